@@ -8,6 +8,8 @@ from PIL import Image
 from io import BytesIO
 from pandas.errors import EmptyDataError
 import numpy as np
+from planilhas import COLUNA_ID, com_ids
+from armazem_local import ArmazemLocal, LINHAS_POR_BLOCO, diferencas, ler_csv, acumular_opcoes
 
 # Configuração da página com layout wide
 st.set_page_config(page_title="Painel Fiscal - Edição", layout="wide", page_icon="📝")
@@ -133,13 +135,40 @@ logo_url = "http://nfeviasolo.com.br/portal2/imagens/Logo%20Essencis%20MG%20-%20
 logo_img = load_logo(logo_url)
 
 # Funções de carregamento e salvamento de dados
+ARQUIVO_CSV = "dados_pedidos.csv"
+
+# Tipos das colunas do CSV, declarados para a leitura não precisar inferir (as não
+# listadas vêm como texto) e formatos de data aceitos, na ordem de tentativa
+TIPOS_CSV = {
+    "V. TOTAL NF": "float64",
+    "VALOR_JUROS": "float64",
+    "VALOR_FRETE": "float64",
+    "DIAS_ATRASO": "float64",
+}
+DATAS_CSV = {
+    "DATA": ("%d/%m/%Y", "%Y-%m-%d", "%Y-%m-%d %H:%M:%S"),
+    "VENCIMENTO": ("%d/%m/%Y", "%Y-%m-%d", "%Y-%m-%d %H:%M:%S"),
+}
+# Acima desse tamanho o CSV é lido em blocos
+LIMITE_LEITURA_UNICA = 64 * 1024 * 1024
+# Colunas com as opções dos filtros da página
+COLUNAS_FILTRO = ("FORNECEDOR", "STATUS_FINANCEIRO")
+
+
+@st.cache_resource
+def obter_armazem():
+    """Armazenamento local do painel (Parquet + diário de edições), comum a todas as sessões."""
+    return ArmazemLocal("dados_pedidos")
+
+
 def carregar_dados():
     """
-    Carrega os dados do arquivo CSV, garantindo que as colunas existam.
-    O decorator @st.cache_data foi removido para evitar problemas de sincronização.
+    Carrega os dados do armazenamento local, garantindo que as colunas existam, e as
+    opções dos filtros ({coluna: valores}).
+    Na primeira vez, importa o dados_pedidos.csv usado antes para o arquivo Parquet.
     """
-    arquivo_csv = "dados_pedidos.csv"
-    
+    armazem = obter_armazem()
+
     colunas_necessarias = {
         "STATUS_FINANCEIRO": "N/A",
         "CONDICAO_PROBLEMA": "N/A",
@@ -150,40 +179,47 @@ def carregar_dados():
         "DOC NF": ""
     }
 
-    if os.path.exists(arquivo_csv):
-        try:
-            df = pd.read_csv(arquivo_csv)
-            # Converter colunas de data
-            df['DATA'] = pd.to_datetime(df['DATA'], errors='coerce', dayfirst=True)
-            if 'VENCIMENTO' in df.columns:
-                df['VENCIMENTO'] = pd.to_datetime(df['VENCIMENTO'], errors='coerce', dayfirst=True)
-            else:
-                df['VENCIMENTO'] = pd.NaT
-            
-            # Garantir que colunas importantes existam
-            for col, default_val in colunas_necessarias.items():
-                if col not in df.columns:
-                    df[col] = default_val
-            
-            return df
-        except pd.errors.EmptyDataError:
-            st.warning("O arquivo de dados existe, mas está vazio. Adicione dados pelo Painel do Almoxarifado.")
-            return pd.DataFrame(columns=list(colunas_necessarias.keys()))
-        except Exception as e:
-            st.error(f"Erro ao carregar arquivo: {e}")
-            return pd.DataFrame(columns=list(colunas_necessarias.keys()))
-    else:
-        return pd.DataFrame(columns=list(colunas_necessarias.keys()))
+    vazio = pd.DataFrame(columns=list(colunas_necessarias.keys())), {coluna: set() for coluna in COLUNAS_FILTRO}
+    if not armazem.existe() and not os.path.exists(ARQUIVO_CSV):
+        return vazio
+
+    try:
+        opcoes = None
+        if not armazem.existe():
+            grande = os.path.getsize(ARQUIVO_CSV) > LIMITE_LEITURA_UNICA
+            df, opcoes = ler_csv(
+                ARQUIVO_CSV, TIPOS_CSV, DATAS_CSV,
+                linhas_por_bloco=LINHAS_POR_BLOCO if grande else None,
+                opcoes=COLUNAS_FILTRO,
+            )
+            # O ID estável da linha identifica as edições no diário
+            armazem.substituir(com_ids(df))
+
+        # O ID da linha também é o índice, para o update das edições alinhar por ele
+        df = armazem.carregar()
+        if opcoes is None:
+            opcoes = acumular_opcoes({coluna: set() for coluna in COLUNAS_FILTRO}, df)
+        opcoes = {coluna: set(valores) for coluna, valores in opcoes.items()}
+        if 'VENCIMENTO' not in df.columns:
+            df['VENCIMENTO'] = pd.NaT
+
+        # Garantir que colunas importantes existam
+        for col, default_val in colunas_necessarias.items():
+            if col not in df.columns:
+                df[col] = default_val
+                opcoes.get(col, set()).add(default_val)
+        return df, opcoes
+    except pd.errors.EmptyDataError:
+        st.warning("O arquivo de dados existe, mas está vazio. Adicione dados pelo Painel do Almoxarifado.")
+        return vazio
+    except Exception as e:
+        st.error(f"Erro ao carregar arquivo: {e}")
+        return vazio
 
-def salvar_dados(df):
-    """Salva o DataFrame no arquivo CSV"""
+def salvar_alteracoes(antes, depois):
+    """Grava no diário do armazenamento local só as células que mudaram entre `antes` e `depois`."""
     try:
-        df_to_save = df.copy()
-        for col in ['DATA', 'VENCIMENTO']:
-            if col in df_to_save.columns:
-                df_to_save[col] = df_to_save[col].apply(lambda x: x.strftime('%d/%m/%Y') if pd.notna(x) else '')
-            
-        df_to_save.to_csv("dados_pedidos.csv", index=False, encoding='utf-8')
+        obter_armazem().registrar(diferencas(antes, depois))
         return True
     except Exception as e:
         st.error(f"Erro ao salvar dados: {e}")
@@ -220,7 +256,7 @@ if 'logado' not in st.session_state or not st.session_state.logado:
             fazer_login(email, senha)
 else:
     if 'df_fiscal' not in st.session_state:
-        st.session_state.df_fiscal = carregar_dados()
+        st.session_state.df_fiscal, st.session_state.opcoes_fiscal = carregar_dados()
     
     df_fiscal = st.session_state.df_fiscal
 
@@ -232,6 +268,12 @@ else:
         st.title("💼 Menu Fiscal")
         st.divider()
         st.caption("Alterações salvas automaticamente.")
+        st.download_button(
+            "📥 Exportar CSV",
+            data=ArmazemLocal.exportar_csv(df_fiscal.drop(columns=[COLUNA_ID], errors="ignore")),
+            file_name=ARQUIVO_CSV,
+            mime="text/csv",
+        )
         if st.button("Logout"):
             st.session_state.logado = False
             st.rerun()
@@ -250,10 +292,10 @@ else:
     st.subheader("🔍 Filtros")
     col1, col2 = st.columns(2)
     with col1:
-        fornecedores_disponiveis = ['Todos'] + sorted(df_fiscal['FORNECEDOR'].dropna().unique().tolist())
+        fornecedores_disponiveis = ['Todos'] + sorted(st.session_state.opcoes_fiscal['FORNECEDOR'])
         filtro_fornecedor = st.selectbox("Filtrar por Fornecedor", options=fornecedores_disponiveis)
     with col2:
-        status_options = ['Todos'] + sorted(df_fiscal['STATUS_FINANCEIRO'].dropna().unique().tolist())
+        status_options = ['Todos'] + sorted(st.session_state.opcoes_fiscal['STATUS_FINANCEIRO'])
         filtro_status = st.selectbox("Filtrar por Status", options=status_options)
 
     df_filtrado = df_fiscal.copy()
@@ -273,7 +315,9 @@ else:
     edited_df = st.data_editor(
         df_filtrado,
         use_container_width=True,
+        hide_index=True,
         column_config={
+            COLUNA_ID: None,
             "DATA": st.column_config.DateColumn("Data", format="DD/MM/YYYY", disabled=True),
             "FORNECEDOR": "Fornecedor",
             "NF": "N° NF",
@@ -292,7 +336,8 @@ else:
     if not edited_df.equals(df_filtrado):
         st.info("Salvando alterações...")
         st.session_state.df_fiscal.update(edited_df)
-        if salvar_dados(st.session_state.df_fiscal):
+        acumular_opcoes(st.session_state.opcoes_fiscal, edited_df)
+        if salvar_alteracoes(df_filtrado, edited_df):
             st.success("Alterações salvas com sucesso!")
             time.sleep(1)
             st.rerun()
\ No newline at end of file
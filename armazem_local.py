@@ -0,0 +1,260 @@
+"""
+Armazenamento local do painel de edição fiscal (alteracao_fiscal.py).
+
+Os dados ficam num arquivo Parquet (ou Feather) e cada edição é uma linha acrescentada a
+um diário (<nome>.diario.jsonl) com os novos valores das células alteradas, pelo ID da
+linha. A carga lê o arquivo principal e reaplica o diário; de tempos em tempos o diário
+é compactado, regravando o arquivo principal com tudo aplicado.
+
+Nenhuma gravação deixa um arquivo pela metade: o principal é escrito num temporário na
+mesma pasta, sincronizado em disco (fsync) e só então renomeado por cima do antigo; cada
+linha do diário é sincronizada antes de a edição ser dada como salva, e uma última linha
+incompleta (queda no meio da escrita) é ignorada na leitura. O CSV fica só como exportação
+e como origem da importação inicial (`ler_csv`).
+"""
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+from comum import COLUNA_ID, gravar_atomico
+
+FORMATOS = {
+    "parquet": (".parquet", pd.read_parquet, lambda df, caminho: df.to_parquet(caminho, index=False)),
+    "feather": (".feather", pd.read_feather, lambda df, caminho: df.to_feather(caminho)),
+}
+
+# Linhas do diário que disparam a compactação
+COMPACTAR_A_CADA = 500
+
+# Linhas por bloco na leitura de CSV em partes
+LINHAS_POR_BLOCO = 100_000
+
+
+def _valor_json(valor):
+    if valor is None or (not isinstance(valor, (list, dict)) and pd.isna(valor)):
+        return None
+    if isinstance(valor, pd.Timestamp):
+        return valor.isoformat()
+    return valor.item() if hasattr(valor, "item") else valor
+
+
+def diferencas(antes, depois):
+    """{ID: {coluna: novo valor}} das células de `depois` que diferem de `antes` (mesmo índice de IDs)."""
+    depois = depois.reindex(index=antes.index, columns=antes.columns)
+    iguais = (antes == depois) | (antes.isna() & depois.isna())
+    alteradas = ~iguais.to_numpy()
+    return {
+        id_: {coluna: depois.iat[i, j] for j, coluna in enumerate(antes.columns) if alteradas[i, j]}
+        for i, id_ in enumerate(antes.index)
+        if alteradas[i].any()
+    }
+
+
+def _tipo_arrow(tipo):
+    return pa.string() if tipo == "str" else pa.from_numpy_dtype(np.dtype(tipo))
+
+
+def _converter_datas(serie, formatos):
+    """Texto -> datetime tentando cada formato conhecido, na ordem, só nas células ainda sem data."""
+    datas = pd.Series(pd.NaT, index=serie.index, dtype="datetime64[ns]")
+    for formato in formatos:
+        faltam = datas.isna() & serie.notna()
+        if not faltam.any():
+            break
+        datas[faltam] = pd.to_datetime(serie[faltam], format=formato, errors="coerce")
+    return datas
+
+
+def acumular_opcoes(opcoes, df):
+    """Acrescenta a `opcoes` ({coluna: set}) os valores distintos de `df` nessas colunas."""
+    for coluna, valores in opcoes.items():
+        if coluna in df.columns:
+            valores.update(df[coluna].dropna().unique().tolist())
+    return opcoes
+
+
+def ler_csv(caminho, tipos, datas=None, colunas=None, linhas_por_bloco=None, opcoes=()):
+    """
+    Lê um CSV com os tipos declarados, sem inferência:
+    - `tipos`: {coluna: dtype} das colunas que não são datas (as demais vêm como texto);
+    - `datas`: {coluna: formatos aceitos}, convertidas depois da leitura, sem `dayfirst`;
+    - `colunas`: só essas colunas (padrão: todas as do arquivo);
+    - `linhas_por_bloco`: lê em blocos desse tamanho, cada um já convertido antes do
+      seguinte, para a memória não passar do DataFrame final mais um bloco; sem ele, lê
+      de uma vez com o engine pyarrow;
+    - `opcoes`: colunas cujos valores distintos são coletados na mesma passada.
+    Retorna (DataFrame, {coluna: lista ordenada de valores}).
+    """
+    datas = datas or {}
+    cabecalho = pd.read_csv(caminho, nrows=0).columns
+    usadas = [coluna for coluna in (colunas or cabecalho) if coluna in cabecalho]
+    dtype = {coluna: tipos.get(coluna, "str") for coluna in usadas if coluna not in datas}
+    dtype.update({coluna: "str" for coluna in usadas if coluna in datas})
+    valores = {coluna: set() for coluna in opcoes}
+
+    def converter(bloco):
+        for coluna, formatos in datas.items():
+            if coluna in bloco.columns:
+                bloco[coluna] = _converter_datas(bloco[coluna], formatos)
+        acumular_opcoes(valores, bloco)
+        return bloco
+
+    if linhas_por_bloco:
+        with pd.read_csv(caminho, usecols=usadas, dtype=dtype, chunksize=linhas_por_bloco) as leitor:
+            blocos = [converter(bloco) for bloco in leitor]
+        df = pd.concat(blocos, ignore_index=True) if blocos else pd.DataFrame(columns=usadas)
+    else:
+        # Direto no pyarrow: pelo read_csv(engine="pyarrow") os tipos só são aplicados depois
+        # da inferência, e um texto como "0012" já teria virado número
+        tabela = pacsv.read_csv(caminho, convert_options=pacsv.ConvertOptions(
+            include_columns=usadas,
+            column_types={coluna: _tipo_arrow(tipo) for coluna, tipo in dtype.items()},
+            strings_can_be_null=True,
+        ))
+        df = converter(tabela.to_pandas().astype(dtype))
+    return df[usadas], {coluna: sorted(v) for coluna, v in valores.items()}
+
+
+class ArmazemLocal:
+    """Arquivo principal `<nome>.<formato>` + diário de edições, numa pasta local."""
+
+    def __init__(self, nome, pasta=".", formato="parquet", compactar_a_cada=COMPACTAR_A_CADA):
+        extensao, self._ler, self._escrever = FORMATOS[formato]
+        pasta = Path(pasta)
+        self.principal = pasta / f"{nome}{extensao}"
+        self.diario = pasta / f"{nome}.diario.jsonl"
+        self.compactar_a_cada = compactar_a_cada
+        self.lock = threading.Lock()
+        self._linhas_diario = None
+
+    def existe(self):
+        return self.principal.exists()
+
+    # --- Leitura ---
+
+    def _entradas(self):
+        """Entradas válidas do diário, na ordem; a última linha incompleta de uma queda é descartada."""
+        if not self.diario.exists():
+            return []
+        entradas = []
+        with open(self.diario, encoding="utf-8") as arquivo:
+            for linha in arquivo:
+                try:
+                    entradas.append(json.loads(linha))
+                except json.JSONDecodeError:
+                    break
+        return entradas
+
+    def _carregar(self):
+        df = self._ler(self.principal) if self.existe() else pd.DataFrame(columns=[COLUNA_ID])
+        df = df.set_index(df[COLUNA_ID].astype(str), drop=False).rename_axis(None)
+        entradas = self._entradas()
+        self._linhas_diario = len(entradas)
+        if not entradas:
+            return df
+
+        # A última alteração de cada célula vale; IDs novos viram linhas novas
+        alteracoes = {}
+        for entrada in entradas:
+            alteracoes.setdefault(entrada["id"], {}).update(entrada["valores"])
+        novas = pd.Index(list(alteracoes)).difference(df.index)
+        if len(novas):
+            df = pd.concat([df, pd.DataFrame({COLUNA_ID: novas}, index=novas)])
+        colunas = dict.fromkeys(coluna for valores in alteracoes.values() for coluna in valores)
+        for coluna in colunas:
+            ids = [id_ for id_, valores in alteracoes.items() if coluna in valores]
+            serie = df[coluna].astype(object) if coluna in df.columns else pd.Series(None, index=df.index, dtype=object)
+            serie.loc[ids] = [alteracoes[id_][coluna] for id_ in ids]
+            if coluna in df.columns and pd.api.types.is_datetime64_any_dtype(df[coluna]):
+                df[coluna] = pd.to_datetime(serie)
+            else:
+                df[coluna] = serie.infer_objects()
+        return df
+
+    def carregar(self):
+        """DataFrame atual (arquivo principal com o diário aplicado), com o ID como índice."""
+        with self.lock:
+            return self._carregar()
+
+    # --- Gravação ---
+
+    def _gravar_principal(self, df):
+        df = df.reset_index(drop=True)
+        for coluna in df.columns[df.dtypes == object]:
+            # Colunas de texto com valores de tipos misturados não entram no Parquet/Feather
+            df[coluna] = df[coluna].where(df[coluna].isna(), df[coluna].astype(str))
+        gravar_atomico(self.principal, lambda temporario: self._escrever(df, temporario))
+
+    def _zerar_diario(self):
+        gravar_atomico(self.diario, lambda temporario: None)
+        self._linhas_diario = 0
+
+    def substituir(self, df):
+        """Grava `df` inteiro como o novo arquivo principal e descarta o diário."""
+        with self.lock:
+            self._gravar_principal(df)
+            self._zerar_diario()
+
+    def _reparar_diario(self):
+        """Corta a última linha incompleta do diário, para que a próxima não seja escrita colada nela."""
+        if not self.diario.exists() or self.diario.stat().st_size == 0:
+            return
+        with open(self.diario, "rb+") as arquivo:
+            arquivo.seek(-1, os.SEEK_END)
+            if arquivo.read(1) == b"\n":
+                return
+            arquivo.seek(0)
+            conteudo = arquivo.read()
+            fim = conteudo.rfind(b"\n") + 1
+            if fim < len(conteudo):
+                arquivo.truncate(fim)
+                os.fsync(arquivo.fileno())
+
+    def registrar(self, alteracoes):
+        """
+        Acrescenta ao diário as alterações {ID: {coluna: valor}}, sincronizadas em disco antes
+        de retornar. Retorna o número de linhas alteradas.
+        """
+        if not alteracoes:
+            return 0
+        linhas = "".join(
+            json.dumps({"id": str(id_), "valores": {col: _valor_json(v) for col, v in valores.items()}},
+                       ensure_ascii=False, default=str) + "\n"
+            for id_, valores in alteracoes.items()
+        )
+        with self.lock:
+            self._reparar_diario()
+            if self._linhas_diario is None:
+                self._linhas_diario = len(self._entradas())
+            with open(self.diario, "a", encoding="utf-8") as arquivo:
+                arquivo.write(linhas)
+                arquivo.flush()
+                os.fsync(arquivo.fileno())
+            self._linhas_diario += len(alteracoes)
+            if self._linhas_diario >= self.compactar_a_cada:
+                self._compactar()
+        return len(alteracoes)
+
+    def _compactar(self):
+        # Se cair entre as duas gravações, o diário é reaplicado sobre um principal que já o
+        # contém, o que dá o mesmo resultado
+        self._gravar_principal(self._carregar())
+        self._zerar_diario()
+
+    def compactar(self):
+        """Regrava o arquivo principal com o diário aplicado e esvazia o diário."""
+        with self.lock:
+            self._compactar()
+
+    # --- Exportação ---
+
+    @staticmethod
+    def exportar_csv(df, formato_data="%d/%m/%Y"):
+        """CSV (bytes) de `df` para download, com as datas no formato informado."""
+        return df.to_csv(index=False, date_format=formato_data).encode("utf-8")
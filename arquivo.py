@@ -0,0 +1,232 @@
+"""
+Arquivo morto das abas de pedidos e almoxarifado.
+
+Os registros encerrados (pedidos entregues, NFs finalizadas) há mais de `dias` saem das
+abas do dia a dia e vão para abas anuais ("pedidos_2024", "almoxarifado_2024"...) de uma
+planilha separada, configurada no secrets.toml:
+
+    [arquivo]
+    sheet_id = "..."   # planilha do arquivo (o limite de 10M de células é por planilha)
+    dias = 365         # idade mínima, em dias, dos registros arquivados
+
+Assim as cargas das páginas ficam do mesmo tamanho, não importa quantos anos de histórico
+existam; os painéis que precisam de anos antigos juntam o arquivo com `com_arquivo`.
+
+O arquivamento apaga linhas das abas e muda a posição das que ficam: deve rodar com os
+painéis fechados (por exemplo, agendado à noite), como script:
+    python -m arquivo pedidos almoxarifado [--dias 365] [--simular]
+
+Se for interrompido, pode ser rodado de novo: linhas cujo ID já está no arquivo não são
+copiadas outra vez, só apagadas das abas.
+"""
+import argparse
+from collections import namedtuple
+
+import pandas as pd
+import streamlit as st
+from gspread.utils import fill_gaps
+
+from planilhas import (
+    COLUNA_ID, abrir_planilha, obter_aba, ler_abas, grade_para_dataframe, traduzir_falhas,
+    apagar_por_id, limpar_handles,
+)
+from esquemas import PEDIDOS, ALMOXARIFADO
+from particoes import PEDIDOS_POR_FILIAL
+
+# Segundos em que a lista de abas e os anos lidos do arquivo ficam em cache (o arquivo só
+# muda quando o arquivamento roda)
+VALIDADE_ARQUIVO = 3600
+DIAS_PADRAO = 365
+
+# aba: aba de origem na planilha principal; coluna_ano: data que define a aba anual;
+# encerrado(df, limite): máscara das linhas que podem ir para o arquivo;
+# particao: AbaParticionada da origem, quando ela pode estar dividida (ver particoes.py)
+Regra = namedtuple("Regra", ["aba", "esquema", "coluna_ano", "encerrado", "particao"], defaults=(None,))
+
+REGRAS = {
+    # Entregue = com data de entrega (é assim que as páginas calculam o STATUS_PEDIDO)
+    "pedidos": Regra(
+        0, PEDIDOS, "DATA",
+        lambda df, limite: df["DATA_ENTREGA"].notna() & (df["DATA_ENTREGA"] < limite),
+        PEDIDOS_POR_FILIAL,
+    ),
+    "almoxarifado": Regra(
+        2, ALMOXARIFADO, "DATA",
+        lambda df, limite: (
+            df["STATUS_FINANCEIRO"].astype(str).str.strip().str.upper().eq("FINALIZADO")
+            & df["DATA"].notna() & (df["DATA"] < limite)
+        ),
+    ),
+}
+
+
+def configuracao_arquivo():
+    """Seção [arquivo] do secrets.toml (vazia se o arquivo não estiver configurado)."""
+    return dict(st.secrets.get("arquivo", {}))
+
+
+def arquivo_configurado():
+    return bool(configuracao_arquivo().get("sheet_id"))
+
+
+def titulo_aba_arquivo(nome, ano):
+    return f"{nome}_{ano}"
+
+
+# --- Consulta ---
+
+@st.cache_data(ttl=VALIDADE_ARQUIVO, show_spinner=False)
+@traduzir_falhas
+def anos_arquivados(nome):
+    """Anos com aba de arquivo para `nome` ("pedidos" ou "almoxarifado"), do mais recente ao mais antigo."""
+    if not arquivo_configurado():
+        return []
+    prefixo = titulo_aba_arquivo(nome, "")
+    anos = [
+        int(worksheet.title[len(prefixo):])
+        for worksheet in abrir_planilha(configuracao_arquivo()["sheet_id"]).worksheets()
+        if worksheet.title.startswith(prefixo) and worksheet.title[len(prefixo):].isdigit()
+    ]
+    return sorted(anos, reverse=True)
+
+
+@st.cache_data(ttl=VALIDADE_ARQUIVO, show_spinner=False)
+def ler_arquivo(nome, anos=None, colunas=None):
+    """
+    Registros arquivados de `nome` nos `anos` informados (todos, com None), num único
+    batchGet, com as colunas (todas, ou só `colunas`) nos tipos do esquema.
+    """
+    regra = REGRAS[nome]
+    disponiveis = anos_arquivados(nome)
+    anos = disponiveis if anos is None else [ano for ano in anos if ano in disponiveis]
+    modo = list(colunas) if colunas else None
+    if not anos:
+        return regra.esquema.vazio().reindex(columns=modo or regra.esquema.nomes)
+
+    frames = ler_abas(
+        {titulo_aba_arquivo(nome, ano): (modo, regra.esquema.tipos) for ano in anos},
+        chave=configuracao_arquivo()["sheet_id"],
+        exportar=False,
+    )
+    df = pd.concat(list(frames.values()), ignore_index=True)
+    df = regra.esquema.preparar(df, colunas=modo)
+    return df[modo] if modo else df
+
+
+def com_arquivo(df, nome, anos=None, colunas=None):
+    """
+    `df` (carregado da aba do dia a dia) acrescido dos registros arquivados dos `anos`
+    (todos, com None). Sem arquivo configurado ou sem anos arquivados, devolve `df`.
+    """
+    arquivados = ler_arquivo(nome, tuple(anos) if anos is not None else None, tuple(colunas) if colunas else None)
+    if arquivados.empty:
+        return df
+    return pd.concat([df, arquivados.reindex(columns=df.columns)], ignore_index=True)
+
+
+# --- Arquivamento ---
+
+def _aba_anual(planilha, titulo, cabecalho):
+    """Aba anual do arquivo, criada com o cabeçalho da aba de origem se ainda não existir."""
+    existentes = {worksheet.title: worksheet for worksheet in planilha.worksheets()}
+    if titulo in existentes:
+        return existentes[titulo]
+    worksheet = planilha.add_worksheet(titulo, rows=1, cols=len(cabecalho))
+    worksheet.update([cabecalho], "A1")
+    return worksheet
+
+
+def arquivar(nome, dias=None, simular=False):
+    """
+    Move para as abas anuais do arquivo os registros de `nome` encerrados há mais de `dias`
+    (padrão: `dias` da seção [arquivo]), de todas as abas de origem (uma por filial, se
+    divididas). Com `simular`, só conta. Retorna {ano: linhas}.
+    """
+    config = configuracao_arquivo()
+    if not config.get("sheet_id"):
+        raise KeyError("Configure sheet_id na seção [arquivo] do secrets.toml")
+    regra = REGRAS[nome]
+    dias = dias if dias is not None else int(config.get("dias", DIAS_PADRAO))
+    limite = pd.Timestamp.today().normalize() - pd.Timedelta(days=dias)
+
+    movidos = {}
+    for aba in regra.particao.abas() if regra.particao else [regra.aba]:
+        for ano, total in _arquivar_aba(nome, regra, aba, limite, config["sheet_id"], simular).items():
+            movidos[ano] = movidos.get(ano, 0) + total
+    return dict(sorted(movidos.items()))
+
+
+def _arquivar_aba(nome, regra, aba, limite, chave_arquivo, simular):
+    origem = obter_aba(aba)
+    grade = fill_gaps(origem.get_all_values())
+    if len(grade) < 2:
+        return {}
+    cabecalho = grade[0]
+    if COLUNA_ID not in cabecalho:
+        raise KeyError(f"A aba {origem.title!r} ainda não tem a coluna {COLUNA_ID}; abra o painel uma vez antes de arquivar")
+
+    df = regra.esquema.preparar(grade_para_dataframe(grade, regra.esquema.tipos))
+    mascara = regra.encerrado(df, limite) & df[COLUNA_ID].astype(str).str.strip().ne("")
+    anos = df.loc[mascara, regra.coluna_ano].dt.year
+    if simular:
+        return {int(ano): int(total) for ano, total in anos.value_counts().items()}
+
+    # As linhas vão como estão guardadas na planilha, sem passar pela conversão de tipos nem
+    # pelo formato de exibição: lidas sem formatação (números como números, datas como
+    # número de série, fórmulas como fórmulas, textos como "0012" como estão) e gravadas em
+    # RAW, para que a planilha do arquivo não as interprete de novo no seu idioma
+    coluna_id = cabecalho.index(COLUNA_ID)
+    brutas = {
+        str(linha[coluna_id]): linha
+        for linha in fill_gaps(origem.get_all_values(value_render_option='FORMULA'), cols=len(cabecalho))[1:]
+    }
+    arquivo = abrir_planilha(chave_arquivo)
+    movidos, ids_movidos = {}, set()
+    for ano, posicoes in anos.groupby(anos).groups.items():
+        worksheet = _aba_anual(arquivo, titulo_aba_arquivo(nome, int(ano)), cabecalho)
+        cabecalho_arquivo = worksheet.row_values(1)
+        ja_arquivados = set(worksheet.col_values(cabecalho_arquivo.index(COLUNA_ID) + 1)[1:])
+        # Uma linha alterada entre as duas leituras fica para a próxima execução
+        ids = [grade[posicao + 1][coluna_id] for posicao in posicoes]
+        ids = [id_ for id_ in ids if id_ in ja_arquivados or id_ in brutas]
+        novas = [brutas[id_] for id_ in ids if id_ not in ja_arquivados]
+        if novas:
+            # Alinha ao cabeçalho do arquivo, caso a aba de origem tenha mudado de colunas
+            indices = [cabecalho.index(coluna) if coluna in cabecalho else None for coluna in cabecalho_arquivo]
+            worksheet.append_rows(
+                [[linha[i] if i is not None else '' for i in indices] for linha in novas],
+                value_input_option='RAW',
+                insert_data_option='INSERT_ROWS',
+                table_range='A1',
+            )
+            # As datas vão como número de série: a aba do arquivo precisa do formato de data
+            formatos = regra.esquema.formatos_datas(worksheet.id, cabecalho_arquivo)
+            if formatos:
+                arquivo.batch_update({"requests": formatos})
+        movidos[int(ano)] = len(ids)
+        ids_movidos.update(ids)
+
+    # Só apaga depois que todas as linhas estão no arquivo (pelos IDs, que não se deslocam)
+    apagar_por_id(ids_movidos, aba)
+    return movidos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("abas", nargs="+", choices=sorted(REGRAS))
+    parser.add_argument("--dias", type=int, help="idade mínima dos registros arquivados")
+    parser.add_argument("--simular", action="store_true", help="só mostra quantas linhas seriam movidas")
+    args = parser.parse_args()
+
+    for nome in args.abas:
+        movidos = arquivar(nome, args.dias, args.simular)
+        acao = "a mover" if args.simular else "movidas"
+        for ano, total in movidos.items():
+            print(f"{nome} {ano}: {total} linhas {acao}")
+        if not movidos:
+            print(f"{nome}: nada a arquivar")
+    limpar_handles()
+
+
+if __name__ == "__main__":
+    main()
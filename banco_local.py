@@ -0,0 +1,519 @@
+"""
+Planilhas num banco SQLite local, no lugar do Google Sheets.
+
+Mesma interface do cliente em memória (memoria.py, o subconjunto do gspread que os painéis
+usam), com as grades gravadas num arquivo: serve para bases grandes e para continuar
+trabalhando quando o Sheets está fora. Ligado no secrets.toml, vale para todos os painéis:
+
+    [banco_local]
+    arquivo = "portal.db"
+
+Para começar com os dados do Google, copie a planilha principal para o banco (com as
+credenciais do secrets.toml; a cópia local, se existir, é substituída):
+    python -m banco_local importar [--planilha <sheet_id>]
+
+Sem a importação, na primeira abertura a planilha principal (`sheet_id`) é criada com as
+abas de pedidos, solicitantes e almoxarifado, nessa ordem, a partir de dados_pedidos.csv,
+dados_solicitantes.csv e dados_almoxarifado.csv, se algum deles tiver conteúdo (os do
+repositório estão vazios); senão, e nas outras planilhas, as abas começam vazias.
+As opções de latência e de erros injetados do [memoria] também valem aqui.
+
+Cada aba é uma tabela com uma linha por linha não vazia da planilha: a posição (`linha`)
+e uma coluna de texto por coluna usada da planilha (c0, c1...). Cada chamada roda numa
+transação: as gravações por diferença e as atualizações por ID mudam só as linhas
+tocadas, e um append é um INSERT. As leituras abrem a transação sem reservar a escrita, e
+várias podem correr juntas, inclusive enquanto outro processo grava. Os painéis e os
+scripts (arquivo, partição) podem usar o mesmo arquivo ao mesmo tempo.
+
+As colunas de ordem de compra, requisição, NF, data e status (pelo nome no cabeçalho)
+têm índice, refeito quando o cabeçalho muda: `procurar` e as consultas feitas direto no
+banco (relatórios, conferências) acham as linhas pelo valor sem varrer a aba.
+"""
+import argparse
+import json
+import sqlite3
+import threading
+from pathlib import Path
+
+import gspread
+import streamlit as st
+from gspread.utils import absolute_range_name, fill_gaps
+
+from memoria import ClienteMemoria, PlanilhaMemoria, AbaMemoria, erro_api
+
+# Abas criadas na planilha principal, na ordem dos índices usados pelos painéis
+SEMENTES = [
+    ("pedidos", "dados_pedidos.csv"),
+    ("solicitantes", "dados_solicitantes.csv"),
+    ("almoxarifado", "dados_almoxarifado.csv"),
+]
+
+# Colunas indexadas, pelo nome no cabeçalho (e as que começam com STATUS: STATUS_PEDIDO,
+# STATUS_FINANCEIRO...)
+INDEXADAS = {"ORDEM_COMPRA", "REQUISICAO", "NF", "DATA"}
+PREFIXO_INDEXADAS = "STATUS"
+
+# Segundos esperando outro processo liberar o banco antes de falhar
+ESPERA_BLOQUEIO = 30
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS planilhas (
+    id TEXT PRIMARY KEY,
+    titulo TEXT NOT NULL,
+    versao INTEGER NOT NULL DEFAULT 1,
+    automatica INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS abas (
+    tabela INTEGER PRIMARY KEY AUTOINCREMENT,
+    planilha TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    titulo TEXT NOT NULL,
+    posicao INTEGER NOT NULL,
+    linhas INTEGER NOT NULL,
+    colunas INTEGER NOT NULL,
+    ocultas TEXT NOT NULL DEFAULT '[]',
+    UNIQUE (planilha, id)
+);
+"""
+
+
+def configuracao_banco_local():
+    """Seção [banco_local] do secrets.toml (vazia se o banco local não estiver configurado)."""
+    return dict(st.secrets.get("banco_local", {}))
+
+
+def banco_local_ativo():
+    return bool(configuracao_banco_local().get("arquivo"))
+
+
+def _indexada(nome):
+    nome = str(nome).strip().upper()
+    return nome in INDEXADAS or nome.startswith(PREFIXO_INDEXADAS)
+
+
+def _aparar_linha(linha):
+    fim = len(linha)
+    while fim and linha[fim - 1] == '':
+        fim -= 1
+    return linha[:fim]
+
+
+class _Transacao:
+    """
+    Lock reentrante do cliente: a primeira entrada abre a transação e a última saída a
+    confirma (ou desfaz, se houve erro). Banco ocupado ou ilegível sai como erro 503 da API.
+
+    Entrando pelo próprio objeto, a transação já reserva a escrita (BEGIN IMMEDIATE), o que
+    enfileira as outras escritas; entrando por `leitura`, ela é aberta sem reserva (BEGIN),
+    não espera ninguém e lê uma foto consistente do banco. Uma escrita dentro de uma leitura
+    pede a reserva no primeiro comando que grava.
+    """
+
+    def __init__(self, conexao):
+        self.conexao = conexao
+        self.lock = threading.RLock()
+        self.profundidade = 0
+        self.leitura = _Leitura(self)
+
+    def entrar(self, comando):
+        self.lock.acquire()
+        if self.profundidade == 0:
+            try:
+                self.conexao.execute(comando)
+            except sqlite3.OperationalError as e:
+                self.lock.release()
+                raise erro_api(503, f"Banco local indisponível: {e}") from e
+        self.profundidade += 1
+        return self
+
+    def __enter__(self):
+        return self.entrar("BEGIN IMMEDIATE")
+
+    def __exit__(self, tipo, erro, rastro):
+        self.profundidade -= 1
+        try:
+            if self.profundidade == 0:
+                self.conexao.execute("COMMIT" if tipo is None else "ROLLBACK")
+        finally:
+            self.lock.release()
+        if tipo is not None and issubclass(tipo, sqlite3.Error):
+            raise erro_api(503, f"Banco local indisponível: {erro}") from erro
+        return False
+
+
+class _Leitura:
+    """Entrada de leitura da _Transacao (`with cliente.leitura:`)."""
+
+    def __init__(self, transacao):
+        self.transacao = transacao
+
+    def __enter__(self):
+        return self.transacao.entrar("BEGIN")
+
+    def __exit__(self, tipo, erro, rastro):
+        return self.transacao.__exit__(tipo, erro, rastro)
+
+
+class ClienteSQLite(ClienteMemoria):
+    """Cliente com as planilhas no arquivo SQLite `arquivo`; `principal` é o sheet_id semeado com os CSVs."""
+
+    def __init__(self, config=None, principal=None):
+        super().__init__(config)
+        self.principal = principal
+        self.conexao = sqlite3.connect(
+            self.config["arquivo"], timeout=ESPERA_BLOQUEIO, isolation_level=None, check_same_thread=False,
+        )
+        self.conexao.execute("PRAGMA journal_mode=WAL")
+        self.conexao.execute("PRAGMA synchronous=NORMAL")
+        self.conexao.executescript(ESQUEMA)
+        self.lock = _Transacao(self.conexao)
+        self.leitura = self.lock.leitura
+
+    def executar(self, sql, parametros=()):
+        return self.conexao.execute(sql, parametros)
+
+    # --- Armazenamento das planilhas ---
+
+    def _planilha(self, chave):
+        if self.executar("SELECT 1 FROM planilhas WHERE id = ?", (chave,)).fetchone() is None:
+            self.planilhas.pop(chave, None)
+            return None
+        if chave not in self.planilhas:
+            self.planilhas[chave] = PlanilhaSQLite(self, chave)
+        return self.planilhas[chave]
+
+    def _planilha_por_titulo(self, titulo):
+        linha = self.executar("SELECT id FROM planilhas WHERE titulo = ? ORDER BY rowid LIMIT 1", (titulo,)).fetchone()
+        return self._planilha(linha[0]) if linha else None
+
+    def _nova_planilha(self, chave, titulo):
+        self.executar("INSERT INTO planilhas (id, titulo) VALUES (?, ?)", (chave, titulo))
+        return self._planilha(chave)
+
+    def _remover_planilha(self, chave):
+        for (tabela,) in self.executar("SELECT tabela FROM abas WHERE planilha = ?", (chave,)).fetchall():
+            self.executar(f"DROP TABLE IF EXISTS aba_{tabela}")
+        self.executar("DELETE FROM abas WHERE planilha = ?", (chave,))
+        removida = self.executar("DELETE FROM planilhas WHERE id = ?", (chave,)).rowcount > 0
+        self.planilhas.pop(chave, None)
+        return removida
+
+    def _arquivos_iniciais(self, origem):
+        arquivos = super()._arquivos_iniciais(origem)
+        if arquivos or origem is None or origem != self.principal:
+            return arquivos
+        sementes = [(titulo, Path(arquivo)) for titulo, arquivo in SEMENTES if Path(arquivo).exists()]
+        # Todas as abas ou nenhuma, para não mudar o índice das que vêm depois
+        if not any(arquivo.stat().st_size for _, arquivo in sementes):
+            return []
+        return sementes
+
+    def importar(self, origem):
+        """
+        Copia para o banco as abas da planilha `origem` (um gspread.Spreadsheet), com a mesma
+        chave e o mesmo título, num único batchGet. A cópia local que já existir é substituída.
+        """
+        abas = origem.worksheets()
+        resposta = origem.values_batch_get([absolute_range_name(aba.title) for aba in abas])
+        grades = [intervalo.get("values", []) for intervalo in resposta.get("valueRanges", [])]
+        with self.lock:
+            anterior = self._planilha(origem.id)
+            versao = anterior.versao if anterior is not None else 0
+            self._remover_planilha(origem.id)
+            planilha = self._nova_planilha(origem.id, origem.title)
+            for aba, grade in zip(abas, grades):
+                grade = fill_gaps(grade) if grade else []
+                largura = len(grade[0]) if grade else 0
+                nova = planilha._nova_aba(aba.title, max(aba.row_count, len(grade)), max(aba.col_count, largura))
+                nova._gravar(0, grade)
+            # A versão continua de onde a cópia anterior parou: as cargas guardadas não a confundem com a nova
+            self.executar("UPDATE planilhas SET versao = versao + ? WHERE id = ?", (versao, origem.id))
+        return planilha
+
+
+class PlanilhaSQLite(PlanilhaMemoria):
+    """Planilha guardada nas tabelas `planilhas` e `abas` do banco."""
+
+    def __init__(self, cliente, chave):
+        self.client = cliente
+        self.id = chave
+        self._objetos = {}
+
+    def _campo(self, nome):
+        linha = self.client.executar(f"SELECT {nome} FROM planilhas WHERE id = ?", (self.id,)).fetchone()
+        return linha[0] if linha else None
+
+    @property
+    def title(self):
+        return self._campo("titulo")
+
+    @property
+    def automatica(self):
+        return bool(self._campo("automatica"))
+
+    @automatica.setter
+    def automatica(self, valor):
+        self.client.executar("UPDATE planilhas SET automatica = ? WHERE id = ?", (int(valor), self.id))
+
+    # --- Armazenamento das abas ---
+
+    @property
+    def versao(self):
+        return self._campo("versao")
+
+    def _tocar(self):
+        self.client.executar("UPDATE planilhas SET versao = versao + 1 WHERE id = ?", (self.id,))
+
+    def _aba_sqlite(self, tabela, id_aba):
+        if tabela not in self._objetos:
+            self._objetos[tabela] = AbaSQLite(self, tabela, id_aba)
+        return self._objetos[tabela]
+
+    @property
+    def abas(self):
+        return [
+            self._aba_sqlite(tabela, id_aba)
+            for tabela, id_aba in self.client.executar(
+                "SELECT tabela, id FROM abas WHERE planilha = ? ORDER BY posicao", (self.id,)
+            ).fetchall()
+        ]
+
+    def _guardar_aba(self, titulo, linhas, colunas, indice):
+        executar = self.client.executar
+        tabelas = [aba.tabela for aba in self.abas]
+        (proximo_id,) = executar("SELECT COALESCE(MAX(id), -1) + 1 FROM abas WHERE planilha = ?", (self.id,)).fetchone()
+        tabela = executar(
+            "INSERT INTO abas (planilha, id, titulo, posicao, linhas, colunas) VALUES (?, ?, ?, ?, ?, ?)",
+            (self.id, proximo_id, titulo, len(tabelas), linhas, colunas),
+        ).lastrowid
+        # `linha` é a posição, que muda quando linhas são inseridas ou apagadas acima; a chave é
+        # o `id`, estável, para que o deslocamento não mexa nos índices das colunas. As colunas
+        # c0, c1... são criadas conforme as gravações chegam a elas
+        executar(f"CREATE TABLE aba_{tabela} (id INTEGER PRIMARY KEY, linha INTEGER NOT NULL UNIQUE)")
+        if indice is not None:
+            tabelas.insert(indice, tabela)
+            executar_muitos = self.client.conexao.executemany
+            executar_muitos("UPDATE abas SET posicao = ? WHERE tabela = ?", [(p, t) for p, t in enumerate(tabelas)])
+        return self._aba_sqlite(tabela, proximo_id)
+
+    def _remover_aba(self, aba):
+        self.client.executar(f"DROP TABLE IF EXISTS aba_{aba.tabela}")
+        self.client.executar("DELETE FROM abas WHERE tabela = ?", (aba.tabela,))
+        self._objetos.pop(aba.tabela, None)
+
+
+class AbaSQLite(AbaMemoria):
+    """
+    Aba guardada na tabela aba_<n>: uma linha por linha não vazia da planilha, com a posição
+    e os valores nas colunas c0, c1... (NULL nas células vazias).
+    """
+
+    def __init__(self, planilha, tabela, id_aba):
+        self.spreadsheet = planilha
+        self.client = planilha.client
+        self.tabela = tabela
+        self.id = id_aba
+        self._nome = f"aba_{tabela}"
+
+    def _campo(self, nome):
+        linha = self.client.executar(f"SELECT {nome} FROM abas WHERE tabela = ?", (self.tabela,)).fetchone()
+        return linha[0] if linha else None
+
+    def _definir(self, nome, valor):
+        self.client.executar(f"UPDATE abas SET {nome} = ? WHERE tabela = ?", (valor, self.tabela))
+
+    @property
+    def title(self):
+        return self._campo("titulo")
+
+    @property
+    def row_count(self):
+        return self._campo("linhas")
+
+    @row_count.setter
+    def row_count(self, valor):
+        self._definir("linhas", valor)
+
+    @property
+    def col_count(self):
+        return self._campo("colunas")
+
+    @col_count.setter
+    def col_count(self, valor):
+        self._definir("colunas", valor)
+
+    @property
+    def ocultas(self):
+        return set(json.loads(self._campo("ocultas") or "[]"))
+
+    # --- Colunas e índices da tabela ---
+
+    def _fisicas(self):
+        """Colunas c0, c1... da tabela: as que já receberam valores (e as que sobraram de colunas apagadas)."""
+        return [linha[1] for linha in self.client.executar(f"PRAGMA table_info({self._nome})") if linha[1][0] == "c"]
+
+    def _garantir_fisicas(self, quantidade):
+        fisicas = self._fisicas()
+        for posicao in range(len(fisicas), quantidade):
+            self.client.executar(f"ALTER TABLE {self._nome} ADD COLUMN c{posicao} TEXT")
+            fisicas.append(f"c{posicao}")
+        return fisicas
+
+    def _indexar(self):
+        """Deixa indexadas as colunas do cabeçalho atual com nome em INDEXADAS (chamado quando ele muda)."""
+        cabecalho = (self._trecho(0, 1) or [[]])[0]
+        desejados = {f"{self._nome}_c{posicao}": posicao for posicao, nome in enumerate(cabecalho) if _indexada(nome)}
+        existentes = {
+            nome for (nome,) in self.client.executar(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND name GLOB ?",
+                (self._nome, f"{self._nome}_c*"),
+            ).fetchall()
+        }
+        for nome in existentes - desejados.keys():
+            self.client.executar(f"DROP INDEX {nome}")
+        for nome, posicao in desejados.items():
+            if nome not in existentes:
+                self.client.executar(f"CREATE INDEX {nome} ON {self._nome} (c{posicao})")
+
+    def procurar(self, coluna, valor):
+        """
+        Linhas de dados (listas de textos, na ordem da aba) em que a `coluna` do cabeçalho
+        vale `valor`. Nas colunas indexadas, a busca vai pelo índice.
+        """
+        with self.client.leitura:
+            cabecalho = (self._trecho(0, 1) or [[]])[0]
+            if coluna not in cabecalho:
+                raise KeyError(f"Coluna inexistente na aba: {coluna!r}")
+            fisicas = self._fisicas()
+            linhas = [
+                _aparar_linha(['' if celula is None else celula for celula in valores])
+                for valores in self.client.executar(
+                    f"SELECT {', '.join(fisicas)} FROM {self._nome} "
+                    f"WHERE c{cabecalho.index(coluna)} = ? AND linha > 0 ORDER BY linha",
+                    (str(valor),),
+                )
+            ]
+        self.client.chamada("leitura", sum(len(linha) for linha in linhas))
+        return linhas
+
+    # --- Armazenamento da grade ---
+
+    def _trecho(self, inicio, fim):
+        fisicas = self._fisicas()
+        if not fisicas:
+            # Nenhuma gravação com valores ainda
+            return []
+        linhas = []
+        for posicao, *valores in self.client.executar(
+            f"SELECT linha, {', '.join(fisicas)} FROM {self._nome} "
+            "WHERE linha >= ? AND linha < ? ORDER BY linha",
+            (inicio, fim),
+        ):
+            linhas.extend([] for _ in range(posicao - inicio - len(linhas)))
+            linhas.append(_aparar_linha(['' if valor is None else valor for valor in valores]))
+        return linhas
+
+    def _gravar(self, inicio, linhas):
+        linhas = [_aparar_linha(linha) for linha in linhas]
+        fisicas = self._garantir_fisicas(max((len(linha) for linha in linhas), default=0))
+        gravar, apagar = [], []
+        for posicao, linha in enumerate(linhas, start=inicio):
+            if linha:
+                valores = [valor if valor != '' else None for valor in linha]
+                gravar.append((posicao, *valores, *[None] * (len(fisicas) - len(valores))))
+            else:
+                apagar.append((posicao,))
+        conexao = self.client.conexao
+        if gravar:
+            conexao.executemany(
+                f"INSERT INTO {self._nome} (linha, {', '.join(fisicas)}) VALUES (?{', ?' * len(fisicas)}) "
+                f"ON CONFLICT (linha) DO UPDATE SET {', '.join(f'{nome} = excluded.{nome}' for nome in fisicas)}",
+                gravar,
+            )
+        conexao.executemany(f"DELETE FROM {self._nome} WHERE linha = ?", apagar)
+        if inicio == 0 and linhas:
+            self._indexar()
+
+    def _usadas(self):
+        (ultima,) = self.client.executar(f"SELECT MAX(linha) FROM {self._nome}").fetchone()
+        return 0 if ultima is None else ultima + 1
+
+    def _esvaziar(self):
+        self.client.executar(f"DELETE FROM {self._nome}")
+        self._indexar()
+
+    def _ocultar(self, colunas):
+        self._definir("ocultas", json.dumps(sorted(self.ocultas | set(colunas))))
+
+    def _deslocar(self, a_partir, deslocamento):
+        """Soma `deslocamento` à posição das linhas a partir de `a_partir` (em dois passos, sem colidir a posição)."""
+        executar = self.client.executar
+        executar(f"UPDATE {self._nome} SET linha = -(linha + ?) - 1 WHERE linha >= ?", (deslocamento, a_partir))
+        executar(f"UPDATE {self._nome} SET linha = -linha - 1 WHERE linha < 0")
+
+    def _apagar_linhas(self, inicio, fim):
+        self.client.executar(f"DELETE FROM {self._nome} WHERE linha >= ? AND linha < ?", (inicio, fim))
+        self._deslocar(fim, inicio - fim)
+        if inicio == 0:
+            self._indexar()
+
+    def _inserir_linhas(self, inicio, fim):
+        self._deslocar(inicio, fim - inicio)
+        if inicio == 0:
+            self._indexar()
+
+    def _mover_colunas(self, atribuicoes):
+        """Aplica as atribuições {coluna: expressão} a todas as linhas, num único UPDATE, e refaz os índices."""
+        if atribuicoes:
+            self.client.executar(
+                f"UPDATE {self._nome} SET {', '.join(f'{nome} = {valor}' for nome, valor in atribuicoes.items())}"
+            )
+        self._indexar()
+
+    def _apagar_colunas(self, inicio, fim):
+        # As colunas à direita vêm para a esquerda (no UPDATE, todas leem os valores de antes)
+        fisicas = self._fisicas()
+        quantidade = fim - inicio
+        self._mover_colunas({
+            f"c{posicao}": f"c{posicao + quantidade}" if posicao + quantidade < len(fisicas) else "NULL"
+            for posicao in range(inicio, len(fisicas))
+        })
+
+    def _inserir_colunas(self, inicio, fim):
+        fisicas = self._fisicas()
+        if inicio >= len(fisicas):
+            return
+        # Chamado antes do col_count crescer: as células ocupadas estão todas abaixo dele
+        total = min(self.col_count, len(fisicas)) + fim - inicio
+        self._garantir_fisicas(total)
+        quantidade = fim - inicio
+        self._mover_colunas({
+            f"c{posicao}": f"c{posicao - quantidade}" if posicao >= fim else "NULL"
+            for posicao in range(inicio, total)
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+    importar = subcomandos.add_parser("importar", help="copia uma planilha do Google para o banco")
+    importar.add_argument("--planilha", help="ID da planilha (padrão: sheet_id do secrets.toml)")
+    args = parser.parse_args()
+
+    config = configuracao_banco_local()
+    if not config.get("arquivo"):
+        raise SystemExit("Configure arquivo na seção [banco_local] do secrets.toml")
+    # A sessão autorizada do Google vem de planilhas.py, que importa este módulo: a
+    # importação fica aqui para não ser circular
+    from planilhas import SCOPES_PLANILHAS, obter_sessao
+
+    chave = args.planilha or st.secrets["sheet_id"]
+    sessao = obter_sessao(tuple(SCOPES_PLANILHAS))
+    origem = gspread.Client(auth=sessao.credentials, session=sessao).open_by_key(chave)
+    planilha = ClienteSQLite(config, principal=st.secrets.get("sheet_id")).importar(origem)
+    for aba in planilha.worksheets():
+        print(f"{aba.title}: {max(len(aba.get_all_values()) - 1, 0)} linhas")
+
+
+if __name__ == "__main__":
+    main()
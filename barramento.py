@@ -0,0 +1,177 @@
+"""
+Barramento de invalidação das cargas entre processos.
+
+Cada aba tem um contador, guardado num arquivo SQLite que todos os processos dos painéis
+(compras, estoque_nf, fiscal, consulta...) leem. Cada gravação feita pelas funções de
+planilhas.py incrementa o contador da aba gravada, e as cargas de recarregar_se_mudou
+guardam os contadores das abas que leram: uma gravação nos pedidos refaz só as cargas
+que dependem dos pedidos, em todos os processos, e não as de solicitantes ou almoxarifado.
+
+Mudanças feitas por fora dos painéis (na própria planilha, por outro script) continuam
+sendo percebidas pela versão da planilha no Drive: o barramento guarda, por planilha, a
+versão deixada pela última gravação dos painéis (a "base"). Se a versão atual for outra,
+houve mudança de fora e as cargas são refeitas. Se uma gravação encontra a planilha
+numa versão diferente da base, a mudança de fora que veio antes dela não tem aba
+conhecida: o contador "externo" da planilha é incrementado, o que refaz todas as cargas
+dela. O quanto a versão avança a cada escrita fica por conta do Drive e não entra na
+conta; o que separa as gravações dos painéis das de fora são os contadores.
+
+Cada gravação lê o estado da aba (base e contador) antes de gravar e o publica depois:
+se o contador da aba não andou no meio, nenhuma outra gravação dos painéis entrou na
+aba, e o espelho local dela pode passar para a versão de depois. A chamada à API fica
+fora de qualquer lock; só a publicação (e a atualização do espelho que depende dela) é
+feita dentro de `registro()`, uma transação curta no arquivo, entre todos os processos
+que o usam. Uma mudança de fora que caia entre as duas consultas de uma gravação (a
+duração da chamada) fica na base, e só é percebida na próxima mudança da planilha ou,
+no espelho, quando ele vencer.
+
+Configuração no secrets.toml:
+
+    [barramento]
+    arquivo = "barramento.sqlite"   # o mesmo caminho para todos os processos da máquina
+
+Sem a seção, os contadores ficam na memória do processo: a invalidação por aba continua
+valendo dentro dele para as abas gravadas, e as versões da planilha só são consultadas
+nas gravações se houver espelho. Sem elas, qualquer mudança de versão refaz as cargas,
+como antes.
+"""
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import streamlit as st
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS contadores (
+    nome TEXT PRIMARY KEY,
+    valor INTEGER NOT NULL DEFAULT 0,
+    versao TEXT
+)
+"""
+
+
+def configuracao_barramento():
+    """Seção [barramento] do secrets.toml (vazia se o barramento não estiver configurado)."""
+    return dict(st.secrets.get("barramento", {}))
+
+
+def nome_aba(chave, aba_id):
+    """Nome do contador da aba (pelo ID da aba, que não muda quando ela é renomeada)."""
+    return f"{chave}/{aba_id}"
+
+
+def nome_externo(chave):
+    """Nome do contador das mudanças de fora dos painéis na planilha."""
+    return f"{chave}/externo"
+
+
+def _nome_base(chave):
+    return f"{chave}/base"
+
+
+def _numero_versao(versao):
+    """Parte numérica da versão da planilha ("<version>@<modifiedTime>" no Drive), ou None."""
+    try:
+        return int(str(versao).split("@")[0])
+    except ValueError:
+        return None
+
+
+def _estado(conexao, chave, aba_id):
+    base = conexao.execute("SELECT versao FROM contadores WHERE nome = ?", (_nome_base(chave),)).fetchone()
+    contador = conexao.execute("SELECT valor FROM contadores WHERE nome = ?", (nome_aba(chave, aba_id),)).fetchone()
+    return base[0] if base else None, contador[0] if contador else 0
+
+
+class Barramento:
+    def __init__(self, arquivo=":memory:"):
+        self.arquivo = str(arquivo)
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(self.arquivo, timeout=30, isolation_level=None, check_same_thread=False)
+        with self._lock:
+            if self.entre_processos:
+                self._conexao.execute("PRAGMA journal_mode=WAL")
+            self._conexao.execute(ESQUEMA)
+        # A publicação usa uma conexão própria, que segura a escrita no arquivo (o lock entre
+        # processos) sem bloquear as leituras dos contadores pela outra. Na memória só há
+        # este processo: basta o lock da thread
+        self._lock_registro = threading.RLock()
+        self._profundidade = 0
+        self._conexao_registro = None
+        if self.entre_processos:
+            self._conexao_registro = sqlite3.connect(
+                self.arquivo, timeout=30, isolation_level=None, check_same_thread=False,
+            )
+
+    @property
+    def entre_processos(self):
+        """Se os contadores estão num arquivo, vistos por todos os processos que o usam."""
+        return self.arquivo != ":memory:"
+
+    def contadores(self):
+        """{nome: valor} de todos os contadores (a tabela tem uma linha por aba gravada)."""
+        with self._lock:
+            return dict(self._conexao.execute("SELECT nome, valor FROM contadores WHERE nome NOT LIKE '%/base'"))
+
+    def base(self, chave):
+        """Versão da planilha (em texto) deixada pela última gravação dos painéis, ou None."""
+        with self._lock:
+            linha = self._conexao.execute(
+                "SELECT versao FROM contadores WHERE nome = ?", (_nome_base(chave),)
+            ).fetchone()
+        return linha[0] if linha else None
+
+    @contextmanager
+    def registro(self):
+        """
+        Exclusão mútua da publicação das gravações, entre as threads e entre os processos que
+        usam o mesmo arquivo (uma transação de escrita aberta no SQLite). Reentrante; o que
+        for publicado dentro dela só aparece para os outros processos na saída. Não deve
+        envolver chamadas à API: segura as publicações de todos os processos.
+        """
+        with self._lock_registro:
+            if self._profundidade == 0 and self._conexao_registro is not None:
+                self._conexao_registro.execute("BEGIN IMMEDIATE")
+            self._profundidade += 1
+            try:
+                yield
+            except BaseException:
+                self._profundidade -= 1
+                if self._profundidade == 0 and self._conexao_registro is not None:
+                    self._conexao_registro.execute("ROLLBACK")
+                raise
+            self._profundidade -= 1
+            if self._profundidade == 0 and self._conexao_registro is not None:
+                self._conexao_registro.execute("COMMIT")
+
+    def estado(self, chave, aba_id):
+        """(base da planilha, contador da aba), lidos antes de uma gravação para publicar_escrita."""
+        with self._lock:
+            return _estado(self._conexao, chave, aba_id)
+
+    def publicar_escrita(self, chave, aba_id, visto=None, antes=None, depois=None, externa=False):
+        """
+        Registra uma gravação na aba e incrementa o contador dela. `visto` é o estado(chave,
+        aba_id) lido antes de gravar, e `antes`/`depois` as versões da planilha consultadas
+        antes e depois; sem elas (`visto` None) só o contador anda. Se `antes` não é a base
+        vista, ou com `externa`, incrementa também o contador externo da planilha. `depois`
+        vira a base se for mais nova que ela.
+
+        Retorna se o contador da aba estava no visto, isto é, se nenhuma outra gravação dos
+        painéis entrou na aba desde então.
+        """
+        incrementar = "INSERT INTO contadores (nome, valor) VALUES (?, 1) ON CONFLICT(nome) DO UPDATE SET valor = valor + 1"
+        with self.registro(), self._lock:
+            conexao = self._conexao_registro or self._conexao
+            base, contador = _estado(conexao, chave, aba_id)
+            if externa or (visto is not None and (antes is None or str(antes) != visto[0])):
+                conexao.execute(incrementar, (nome_externo(chave),))
+            conexao.execute(incrementar, (nome_aba(chave, aba_id),))
+            if visto is not None and depois is not None and (
+                base is None or (_numero_versao(depois) or 0) > (_numero_versao(base) or 0)
+            ):
+                conexao.execute(
+                    "INSERT INTO contadores (nome, versao) VALUES (?, ?) ON CONFLICT(nome) DO UPDATE SET versao = excluded.versao",
+                    (_nome_base(chave), str(depois)),
+                )
+        return visto is not None and contador == visto[1]
@@ -0,0 +1,93 @@
+"""
+Benchmark das cargas e gravações com as planilhas em memória (memoria.py): ler_aba completa
+e só de duas colunas, salvar_alteracoes com poucas células mudadas e anexar_linhas, numa aba
+com o formato de pedidos de 10k a 1M linhas.
+
+Uso (na raiz do projeto; não acessa o Google nem precisa do secrets.toml):
+    python -m benchmarks.cargas [--tamanhos 10000,100000,1000000] [--repeticoes 3]
+                                [--latencia 0.2] [--latencia-por-mil-celulas 0.01]
+
+Sem latência, mede só o processamento local (conversão, diferenças, montagem dos lotes);
+com ela, simula o tempo de rede de cada chamada. O limite de células por planilha do Sheets
+fica desligado para permitir as abas maiores.
+"""
+import argparse
+import statistics
+import time
+
+import pandas as pd
+
+import memoria
+import planilhas
+from benchmarks.conversao import COLUNAS, TIPOS, _grade
+
+CHAVE = "benchmark_cargas"
+ABA = "pedidos"
+CELULAS_ALTERADAS = 10
+LINHAS_POR_INSERCAO = 3
+
+
+def _medir(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos)
+
+
+def _medir_tamanho(planilha, linhas, repeticoes):
+    grade = _grade(linhas)
+    worksheet = planilha.add_worksheet(ABA, rows=len(grade), cols=len(COLUNAS))
+    worksheet.update(grade, "A1")
+    try:
+        def carga():
+            planilhas.ler_aba(ABA, chave=CHAVE, tipos=TIPOS)
+
+        def colunas():
+            planilhas.ler_aba(ABA, chave=CHAVE, colunas=["DATA", "VALOR_ITEM"], tipos=TIPOS)
+
+        df = pd.DataFrame(grade[1:], columns=COLUNAS)
+        planilhas.registrar_snapshot(df, ABA, chave=CHAVE)
+        rodada = iter(range(repeticoes * 2))
+
+        def gravacao():
+            # Cada rodada muda as mesmas células para um valor novo, para sempre haver diferença
+            alterado = df.copy()
+            alterado.iloc[:CELULAS_ALTERADAS, alterado.columns.get_loc("CONDICAO_FRETE")] = f"RODADA {next(rodada)}"
+            planilhas.salvar_alteracoes(alterado, ABA, chave=CHAVE)
+
+        novas = pd.DataFrame(grade[1:LINHAS_POR_INSERCAO + 1], columns=COLUNAS)
+
+        def insercao():
+            planilhas.anexar_linhas(novas, ABA, chave=CHAVE)
+
+        return [_medir(funcao, repeticoes) for funcao in (carga, colunas, gravacao, insercao)]
+    finally:
+        planilha.del_worksheet(worksheet)
+        planilhas.limpar_handles()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanhos", default="10000,100000,1000000")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--latencia", type=float, default=0.0, help="segundos por chamada")
+    parser.add_argument("--latencia-por-mil-celulas", type=float, default=0.0)
+    args = parser.parse_args()
+
+    memoria.ativar({
+        "latencia": args.latencia,
+        "latencia_por_mil_celulas": args.latencia_por_mil_celulas,
+        "limite_celulas": 0,
+    })
+    planilha = planilhas.abrir_planilha(CHAVE)
+
+    print(f"{'linhas':>8} | {'carga (s)':>9} | {'2 colunas (s)':>13} | {'gravação (s)':>12} | {'append (s)':>10}")
+    for tamanho in sorted(int(t) for t in args.tamanhos.split(",")):
+        carga, colunas, gravacao, insercao = _medir_tamanho(planilha, tamanho, args.repeticoes)
+        print(f"{tamanho:>8} | {carga:>9.3f} | {colunas:>13.3f} | {gravacao:>12.3f} | {insercao:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark de conversão: tempo e pico de memória para transformar a grade de valores de uma
+aba de pedidos em DataFrame tipado, comparando o caminho antigo (get_all_records + loops de
+to_datetime/to_numeric nos loaders) com o grade_para_dataframe com tipos declarados.
+
+Uso (na raiz do projeto; não acessa a planilha, a grade é gerada localmente):
+    python -m benchmarks.conversao [--linhas 50000] [--repeticoes 3]
+"""
+import argparse
+import statistics
+import time
+import tracemalloc
+
+import pandas as pd
+from gspread.utils import fill_gaps, numericise_all, to_records
+
+import planilhas
+
+COLUNAS = [
+    "DATA", "SOLICITANTE", "DEPARTAMENTO", "FILIAL", "MATERIAL", "QUANTIDADE", "TIPO_PEDIDO",
+    "REQUISICAO", "FORNECEDOR", "ORDEM_COMPRA", "VALOR_ITEM", "VALOR_RENEGOCIADO",
+    "DATA_APROVACAO", "PREVISAO_ENTREGA", "CONDICAO_FRETE", "DATA_ENTREGA", "DIAS_ATRASO",
+    "DIAS_EMISSAO", "DOC NF",
+]
+DATAS = ['DATA', 'DATA_APROVACAO', 'DATA_ENTREGA', 'PREVISAO_ENTREGA']
+NUMEROS = ['QUANTIDADE', 'VALOR_ITEM', 'VALOR_RENEGOCIADO', 'DIAS_ATRASO', 'DIAS_EMISSAO']
+TIPOS = {**dict.fromkeys(DATAS, planilhas.TIPO_DATA), **dict.fromkeys(NUMEROS, planilhas.TIPO_NUMERO)}
+
+
+def _grade(linhas):
+    """Grade como a API devolve: tudo texto, com células vazias e linhas curtas no fim."""
+    grade = [COLUNAS]
+    for i in range(linhas):
+        data = f"{i % 28 + 1:02d}/{i % 12 + 1:02d}/2025"
+        entregue = i % 3 == 0
+        linha = [
+            data, f"SOLICITANTE {i % 50}", "1308 - TI", "MG", f"MATERIAL {i}", str(i % 10 + 1),
+            "LOCAL", f"REQ{i}", f"FORNECEDOR {i % 200}", str(4500000000 + i), f"{i % 997}.5", "",
+            data, data, "CIF", data if entregue else "", str(i % 30), str(i % 60),
+            f"https://drive.google.com/file/d/{i}" if entregue else "",
+        ]
+        grade.append(linha if entregue else linha[:-1])
+    return grade
+
+
+def _caminho_antigo(grade):
+    valores = fill_gaps(grade)
+    df = pd.DataFrame(to_records(valores[0], [numericise_all(linha) for linha in valores[1:]]))
+    for col in DATAS:
+        if col in df.columns and not df[col].empty:
+            df[col] = pd.to_datetime(df[col], errors='coerce', dayfirst=True)
+    for col in NUMEROS:
+        if col in df.columns and not df[col].empty:
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    return df
+
+
+def _caminho_novo(grade):
+    return planilhas.grade_para_dataframe(grade, TIPOS)
+
+
+def _medir(funcao, grade, repeticoes):
+    """
+    Mediana do tempo (s) e pico de memória alocada (MB). O pico é medido numa execução à
+    parte, porque o tracemalloc deixa a conversão bem mais lenta.
+    """
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao(grade)
+        tempos.append(time.perf_counter() - inicio)
+
+    tracemalloc.start()
+    funcao(grade)
+    pico = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return statistics.median(tempos), pico
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--linhas", type=int, default=50000)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    args = parser.parse_args()
+
+    grade = _grade(args.linhas)
+    antigo, novo = _caminho_antigo(grade), _caminho_novo(grade)
+    pd.testing.assert_frame_equal(antigo, novo, check_dtype=False)
+
+    print(f"{'caminho':>22} | {'tempo (s)':>9} | {'pico (MB)':>9}")
+    for nome, funcao in [("get_all_records+loops", _caminho_antigo), ("grade_para_dataframe", _caminho_novo)]:
+        tempo, pico = _medir(funcao, grade, args.repeticoes)
+        print(f"{nome:>22} | {tempo:>9.3f} | {pico:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
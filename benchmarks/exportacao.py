@@ -0,0 +1,148 @@
+"""
+Benchmark da carga completa: get_all_records aba por aba comparado com a exportação XLSX
+da planilha inteira (planilhas.ler_exportacao), numa pasta com 100k linhas no total
+distribuídas em cinco abas com o formato de pedidos.
+
+Uso (na raiz do projeto, com o .streamlit/secrets.toml configurado):
+    python -m benchmarks.exportacao [--linhas 100000] [--repeticoes 3]
+
+Cria a planilha de rascunho "benchmark_exportacao" (apagada no fim); não toca na planilha
+de `sheet_id`. Com --local, não acessa a rede: gera o XLSX em memória e mede só a leitura
+dele pelo openpyxl, comparada com a conversão da mesma grade como a API a devolve.
+"""
+import argparse
+import io
+import re
+import statistics
+import time
+import zipfile
+
+import openpyxl
+
+import planilhas
+from benchmarks.conversao import COLUNAS, TIPOS, _grade
+
+TITULO = "benchmark_exportacao"
+ABAS = ["pedidos", "solicitantes", "almoxarifado", "reembolsos", "usuarios"]
+LOTE_PREENCHIMENTO = 10000
+
+
+def _medir(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos)
+
+
+def _grades(linhas):
+    por_aba = linhas // len(ABAS)
+    return {aba: _grade(por_aba) for aba in ABAS}
+
+
+def _compartilhar_textos(dados):
+    """
+    Reescreve o XLSX do openpyxl (textos inline) com a tabela de textos compartilhados,
+    como no arquivo exportado pelo Google, que o openpyxl lê bem mais rápido.
+    """
+    entrada = zipfile.ZipFile(io.BytesIO(dados))
+    saida_bytes = io.BytesIO()
+    saida = zipfile.ZipFile(saida_bytes, "w", zipfile.ZIP_DEFLATED)
+    textos = {}
+
+    def compartilhar(m):
+        return b't="s"><v>%d</v>' % textos.setdefault(m.group(1), len(textos))
+
+    for nome in entrada.namelist():
+        conteudo = entrada.read(nome)
+        if nome.startswith("xl/worksheets/"):
+            conteudo = re.sub(rb't="inlineStr"><is><t>(.*?)</t></is>', compartilhar, conteudo)
+        elif nome == "[Content_Types].xml":
+            conteudo = conteudo.replace(b"</Types>", (
+                b'<Override PartName="/xl/sharedStrings.xml" ContentType="application/'
+                b'vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/></Types>'
+            ))
+        elif nome == "xl/_rels/workbook.xml.rels":
+            conteudo = conteudo.replace(b"</Relationships>", (
+                b'<Relationship Id="rIdTextos" Target="sharedStrings.xml" Type="http://schemas.'
+                b'openxmlformats.org/officeDocument/2006/relationships/sharedStrings"/></Relationships>'
+            ))
+        saida.writestr(nome, conteudo)
+    saida.writestr("xl/sharedStrings.xml", (
+        b'<?xml version="1.0" encoding="UTF-8"?><sst xmlns="http://schemas.openxmlformats.org/'
+        b'spreadsheetml/2006/main" uniqueCount="%d">' % len(textos)
+        + b"".join(b"<si><t>%s</t></si>" % texto for texto in textos)
+        + b"</sst>"
+    ))
+    saida.close()
+    return saida_bytes.getvalue()
+
+
+def _local(grades, repeticoes):
+    livro = openpyxl.Workbook(write_only=True)
+    for aba, grade in grades.items():
+        planilha = livro.create_sheet(aba)
+        for linha in grade:
+            planilha.append(linha)
+    arquivo = io.BytesIO()
+    livro.save(arquivo)
+    dados = _compartilhar_textos(arquivo.getvalue())
+    print(f"XLSX: {len(dados) / 2 ** 20:.1f} MB")
+
+    def ler_xlsx():
+        livro = openpyxl.load_workbook(io.BytesIO(dados), read_only=True, data_only=True)
+        for aba in ABAS:
+            planilhas.grade_para_dataframe(planilhas._grade_xlsx(livro[aba]), TIPOS)
+        livro.close()
+
+    def converter_grades():
+        for grade in grades.values():
+            planilhas.grade_para_dataframe(grade, TIPOS)
+
+    print(f"{'caminho (local)':>22} | {'tempo (s)':>9}")
+    print(f"{'grade da API':>22} | {_medir(converter_grades, repeticoes):>9.3f}")
+    print(f"{'XLSX (openpyxl)':>22} | {_medir(ler_xlsx, repeticoes):>9.3f}")
+
+
+def _remoto(grades, repeticoes):
+    cliente = planilhas.get_gspread_client()
+    planilha = cliente.create(TITULO)
+    try:
+        for indice, (aba, grade) in enumerate(grades.items()):
+            worksheet = planilha.add_worksheet(aba, rows=len(grade) + 10, cols=len(COLUNAS))
+            for inicio in range(0, len(grade), LOTE_PREENCHIMENTO):
+                worksheet.update(grade[inicio:inicio + LOTE_PREENCHIMENTO], f"A{inicio + 1}")
+        planilha.del_worksheet(planilha.sheet1)
+
+        def por_aba():
+            for worksheet in planilha.worksheets():
+                worksheet.get_all_records()
+
+        def exportacao():
+            planilhas.ler_exportacao(ABAS, chave=planilha.id)
+
+        print(f"{'caminho':>22} | {'tempo (s)':>9}")
+        print(f"{'get_all_records x5':>22} | {_medir(por_aba, repeticoes):>9.3f}")
+        print(f"{'exportação XLSX':>22} | {_medir(exportacao, repeticoes):>9.3f}")
+    finally:
+        cliente.del_spreadsheet(planilha.id)
+        planilhas.limpar_handles()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--linhas", type=int, default=100000, help="total de linhas somando as cinco abas")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--local", action="store_true", help="mede só a leitura do XLSX, sem rede")
+    args = parser.parse_args()
+
+    grades = _grades(args.linhas)
+    if args.local:
+        _local(grades, args.repeticoes)
+    else:
+        _remoto(grades, args.repeticoes)
+
+
+if __name__ == "__main__":
+    main()
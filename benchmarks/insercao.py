@@ -0,0 +1,97 @@
+"""
+Benchmark de inserção: latência do append (anexar_linhas) conforme a aba cresce,
+comparada com a regravação completa usada antes.
+
+Uso (na raiz do projeto, com o .streamlit/secrets.toml configurado):
+    python -m benchmarks.insercao [--tamanhos 1000,10000,50000,100000] [--repeticoes 5] [--comparar]
+
+Cria a aba de rascunho "benchmark_insercao" na planilha de `sheet_id` (recriando-a se já
+existir) e a remove no fim.
+"""
+import argparse
+import statistics
+import time
+
+import gspread
+import pandas as pd
+import streamlit as st
+
+import planilhas
+
+ABA = "benchmark_insercao"
+COLUNAS = [
+    "DATA", "SOLICITANTE", "DEPARTAMENTO", "FILIAL", "MATERIAL", "QUANTIDADE", "TIPO_PEDIDO",
+    "REQUISICAO", "FORNECEDOR", "ORDEM_COMPRA", "VALOR_ITEM", "STATUS_PEDIDO",
+]
+LOTE_PREENCHIMENTO = 10000
+
+
+def _linhas(inicio, quantidade):
+    return [
+        ["01/01/2025", f"SOLICITANTE {i % 50}", "1308 - TI", "MG", f"MATERIAL {i}", i % 10 + 1,
+         "LOCAL", f"REQ{i}", f"FORNECEDOR {i % 200}", f"OC{i}", "10.5", "PENDENTE"]
+        for i in range(inicio, inicio + quantidade)
+    ]
+
+
+def _preencher_ate(worksheet, atual, alvo):
+    """Completa a aba até `alvo` linhas de dados, em lotes."""
+    while atual < alvo:
+        lote = min(LOTE_PREENCHIMENTO, alvo - atual)
+        worksheet.append_rows(_linhas(atual, lote), insert_data_option='INSERT_ROWS', table_range='A1')
+        atual += lote
+    return atual
+
+
+def _medir(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanhos", default="1000,10000,50000,100000")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--linhas-por-insercao", type=int, default=3)
+    parser.add_argument("--comparar", action="store_true", help="mede também a regravação completa")
+    args = parser.parse_args()
+    tamanhos = sorted(int(t) for t in args.tamanhos.split(","))
+
+    planilha = planilhas.abrir_planilha(st.secrets["sheet_id"])
+    try:
+        planilha.del_worksheet(planilha.worksheet(ABA))
+    except gspread.exceptions.WorksheetNotFound:
+        pass
+    worksheet = planilha.add_worksheet(ABA, rows=max(tamanhos) + 1000, cols=len(COLUNAS))
+    worksheet.update([COLUNAS], 'A1')
+
+    novas = pd.DataFrame(_linhas(0, args.linhas_por_insercao), columns=COLUNAS)
+    atual = 0
+    print(f"{'linhas':>8} | {'append (s)':>10} | {'regravação (s)':>14}")
+    try:
+        for tamanho in tamanhos:
+            atual = _preencher_ate(worksheet, atual, tamanho)
+
+            def inserir():
+                planilhas.anexar_linhas(novas, ABA)
+
+            tempo_append = _medir(inserir, args.repeticoes)
+            atual += args.linhas_por_insercao * args.repeticoes
+
+            tempo_total = float("nan")
+            if args.comparar:
+                grade = [COLUNAS] + _linhas(0, atual)
+                tempo_total = _medir(lambda: worksheet.update(grade, 'A1'), 1)
+
+            print(f"{tamanho:>8} | {tempo_append:>10.3f} | {tempo_total:>14.3f}")
+    finally:
+        planilha.del_worksheet(worksheet)
+        planilhas.limpar_handles()
+
+
+if __name__ == "__main__":
+    main()
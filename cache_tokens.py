@@ -0,0 +1,93 @@
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+
+from google.oauth2 import service_account
+
+# Cache em disco dos access tokens OAuth da conta de serviço.
+# Reinícios do Streamlit e expirações do st.cache_resource reaproveitam o token ainda
+# válido em vez de refazer a troca no token endpoint para cada conjunto de scopes.
+
+DIRETORIO_TOKENS = os.environ.get("PORTAL_TOKEN_DIR", os.path.join(tempfile.gettempdir(), "portal_tokens"))
+
+# Tokens que expiram dentro desta margem são tratados como vencidos
+MARGEM_EXPIRACAO = datetime.timedelta(minutes=5)
+
+
+def chave_token(email, scopes, token_uri):
+    """Chave do cache: conta de serviço + conjunto de scopes + token endpoint."""
+    base = "|".join([email, " ".join(sorted(scopes or ())), token_uri or ""])
+    return hashlib.sha256(base.encode("utf-8")).hexdigest()
+
+
+def _caminho_token(chave, diretorio=None):
+    return os.path.join(diretorio or DIRETORIO_TOKENS, f"{chave}.json")
+
+
+def ler_token(chave, diretorio=None):
+    """Retorna (token, expiry) se houver token salvo e ainda válido, senão None."""
+    try:
+        with open(_caminho_token(chave, diretorio), encoding="utf-8") as f:
+            dados = json.load(f)
+        expiry = datetime.datetime.fromisoformat(dados["expiry"])
+    except (OSError, ValueError, KeyError):
+        return None
+
+    # O google-auth trabalha com datetimes UTC sem fuso
+    if expiry - MARGEM_EXPIRACAO <= datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None):
+        return None
+    return dados["token"], expiry
+
+
+def gravar_token(chave, token, expiry, diretorio=None):
+    """Grava o token de forma atômica e legível apenas pelo usuário do processo."""
+    if not token or expiry is None:
+        return
+    destino = _caminho_token(chave, diretorio)
+    try:
+        os.makedirs(os.path.dirname(destino), mode=0o700, exist_ok=True)
+        fd, temporario = tempfile.mkstemp(dir=os.path.dirname(destino), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"token": token, "expiry": expiry.isoformat()}, f)
+        os.replace(temporario, destino)
+    except OSError:
+        # O cache é só uma otimização: sem disco gravável seguimos com o token em memória
+        pass
+
+
+class CredenciaisComCache(service_account.Credentials):
+    """Credenciais da conta de serviço que consultam o cache em disco antes do token endpoint."""
+
+    diretorio_tokens = None
+
+    def _chave_cache(self):
+        return chave_token(self.service_account_email, self._scopes, self._token_uri)
+
+    def carregar_do_cache(self):
+        salvo = ler_token(self._chave_cache(), self.diretorio_tokens)
+        if salvo:
+            self.token, self.expiry = salvo
+        return salvo is not None
+
+    def refresh(self, request):
+        # Outro processo pode ter renovado o token enquanto este estava em uso. Se o token
+        # atual ainda está no prazo, o refresh veio de um 401: ele foi recusado, e o do
+        # cache (em geral o mesmo) também não serve
+        if not self.valid and self.carregar_do_cache():
+            return
+        super().refresh(request)
+        gravar_token(self._chave_cache(), self.token, self.expiry, self.diretorio_tokens)
+
+
+def credenciais_com_cache(info, scopes, diretorio=None):
+    """
+    Cria as credenciais a partir do JSON da conta de serviço já com o token do cache, se houver.
+    O token endpoint usado é o `token_uri` do próprio JSON, o que permite apontar para um
+    endpoint local nos testes.
+    """
+    creds = CredenciaisComCache.from_service_account_info(info, scopes=list(scopes))
+    creds.diretorio_tokens = diretorio
+    creds.carregar_do_cache()
+    return creds
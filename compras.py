@@ -10,10 +10,13 @@ import requests
 from PIL import Image
 from io import BytesIO
 import numpy as np
-import gspread
 from gspread_dataframe import set_with_dataframe
-from google.oauth2.service_account import Credentials
-import json
+from planilhas import (
+    anexar_linhas, COLUNA_ID, com_ids, garantir_ids, ler_aba, recarregar_se_mudou, posicoes_por_id,
+    FalhaPlanilha, exibir_falha,
+)
+from esquemas import PEDIDOS, SOLICITANTES
+from particoes import PEDIDOS_POR_FILIAL
 
 # Configuração da página com layout wide e ícone
 st.set_page_config(page_title="Painel do Comprador", layout="wide", page_icon="👨‍💼")
@@ -144,150 +147,116 @@ def load_logo(url):
 logo_url = "http://nfeviasolo.com.br/portal2/imagens/Logo%20Essencis%20MG%20-%20branca.png"
 logo_img = load_logo(logo_url)
 
-# --- Funções de Conexão e Carregamento de Dados ---
-@st.cache_resource(show_spinner=False)
-def get_gspread_client():
-    """Conecta com o Google Sheets usando os secrets do Streamlit."""
-    scopes = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
-    credentials_info = st.secrets["gcp_service_account"]
-    
-    if isinstance(credentials_info, str):
-        try:
-            credentials_info = json.loads(credentials_info)
-        except json.JSONDecodeError as e:
-            st.error(f"Erro ao decodificar as credenciais JSON: {e}. Verifique a formatação do secrets.toml.")
-            return None
-    
-    creds = Credentials.from_service_account_info(credentials_info, scopes=scopes)
-    client = gspread.authorize(creds)
-    return client
+# --- Funções de Carregamento de Dados ---
+# Do almoxarifado só são usadas a OC e o link da NF, para completar os pedidos
+COLUNAS_ALMOXARIFADO = ['ORDEM_COMPRA', 'DOC NF']
 
-def carregar_dados_pedidos():
-    """Carrega o DataFrame de pedidos do Google Sheets."""
-    try:
-        gc = get_gspread_client()
-        spreadsheet = gc.open_by_key(st.secrets["sheet_id"])
-        worksheet = spreadsheet.get_worksheet(0)
-        
-        data = worksheet.get_all_records()
-        df = pd.DataFrame(data)
+# Abas lidas após o login junto com os pedidos (solicitantes e almoxarifado): vêm todas num
+# único batchGet, já convertidas com os tipos dos esquemas
+ABAS_PAGINA = {1: (None, SOLICITANTES.tipos), 2: COLUNAS_ALMOXARIFADO}
 
-        for col in ['DATA', 'DATA_APROVACAO', 'DATA_ENTREGA', 'PREVISAO_ENTREGA']:
-            if col in df.columns and not df[col].empty:
-                df[col] = pd.to_datetime(df[col], errors='coerce', dayfirst=True)
-        
-        for col in ['QUANTIDADE', 'VALOR_ITEM', 'VALOR_RENEGOCIADO', 'DIAS_ATRASO', 'DIAS_EMISSAO']:
-            if col in df.columns and not df[col].empty:
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-        
-        if 'DOC NF' not in df.columns:
-            df['DOC NF'] = ""
-        
-        if 'PREVISAO_ENTREGA' not in df.columns:
-            df['PREVISAO_ENTREGA'] = pd.NaT
+# Com os pedidos divididos por filial (particoes.py), o comprador escolhe a filial na barra
+# lateral e só a aba dela é baixada e gravada; "Todas" junta as abas de todas as filiais
+TODAS_FILIAIS = "Todas"
 
-        # NOVO CÓDIGO AQUI:
-        # Define o status do pedido com base na data de entrega
-        df['STATUS_PEDIDO'] = df['DATA_ENTREGA'].apply(
-            lambda x: 'ENTREGUE' if pd.notna(x) else 'PENDENTE'
-        )
+def carregar_dados_pedidos(filial=TODAS_FILIAIS):
+    """
+    Carrega o DataFrame de pedidos (da filial, ou de todas) do Google Sheets. Se a planilha
+    não puder ser lida, levanta FalhaPlanilha (um DataFrame vazio seria gravado por cima
+    dos pedidos).
+    """
+    # Datas e valores já vêm convertidos da leitura; o snapshot de cada aba é registrado
+    # como ela foi lida, antes das colunas/status calculados abaixo
+    df = PEDIDOS_POR_FILIAL.ler(
+        None if filial == TODAS_FILIAIS else [filial],
+        tipos=PEDIDOS.tipos, grupo=ABAS_PAGINA, serializar=serializar_pedidos,
+    )
+    return com_status(PEDIDOS.preparar(df))
+
+@recarregar_se_mudou(compartilhado=True)
+def carregar_pedidos_todas_filiais():
+    """Pedidos de todas as filiais, só para os painéis (sem snapshot para gravação)."""
+    return com_status(PEDIDOS.preparar(PEDIDOS_POR_FILIAL.ler(tipos=PEDIDOS.tipos)))
+
+def pedidos_para_paineis():
+    """Os painéis comparam filiais: com uma filial escolhida, juntam as abas de todas."""
+    if st.session_state.get('filial_pedidos', TODAS_FILIAIS) == TODAS_FILIAIS:
+        return st.session_state.df_pedidos.copy()
+    return carregar_pedidos_todas_filiais()
+
+def com_status(df):
+    # NOVO CÓDIGO AQUI:
+    # Define o status do pedido com base na data de entrega
+    df['STATUS_PEDIDO'] = df['DATA_ENTREGA'].apply(
+        lambda x: 'ENTREGUE' if pd.notna(x) else 'PENDENTE'
+    )
+
+    return df
+
+def serializar_pedidos(df):
+    """Converte o DataFrame de pedidos para os valores gravados na planilha."""
+    df_to_save = df.copy()
+    
+    # Converte as colunas de valor para tipo string e substitui vírgulas por pontos
+    # para garantir o formato numérico correto para o Google Sheets
+    for col_val in ['VALOR_ITEM', 'VALOR_RENEGOCIADO']:
+        if col_val in df_to_save.columns:
+            df_to_save[col_val] = df_to_save[col_val].astype(str).str.replace(',', '.', regex=False)
 
-        return df
-    except Exception as e:
-        st.error(f"Erro ao carregar dados do Google Sheets: {e}")
-        st.info("Criando um DataFrame vazio. Verifique suas credenciais e a planilha.")
-        return criar_dataframe_pedidos_vazio()
-
-def criar_dataframe_pedidos_vazio():
-    """Cria um DataFrame de pedidos vazio com a estrutura correta."""
-    return pd.DataFrame(columns=[
-        "DATA", "SOLICITANTE", "DEPARTAMENTO", "FILIAL", "MATERIAL", "QUANTIDADE", "TIPO_PEDIDO",
-        "REQUISICAO", "FORNECEDOR", "ORDEM_COMPRA", "VALOR_ITEM", "VALOR_RENEGOCIADO",
-        "DATA_APROVACAO", "PREVISAO_ENTREGA", "CONDICAO_FRETE", "STATUS_PEDIDO", "DATA_ENTREGA", "DIAS_ATRASO", "DIAS_EMISSAO", "DOC NF"
-    ])
+    # Datas no formato da planilha
+    return PEDIDOS.serializar(df_to_save)
 
 def salvar_dados_pedidos(df):
-    """Salva o DataFrame de pedidos no Google Sheets."""
+    """Salva no Google Sheets apenas as células de pedidos que mudaram desde o carregamento."""
     try:
-        gc = get_gspread_client()
-        spreadsheet = gc.open_by_key(st.secrets["sheet_id"])
-        worksheet = spreadsheet.get_worksheet(0)
-
-        df_to_save = df.copy()
+        PEDIDOS_POR_FILIAL.salvar(serializar_pedidos(df))
         
-        # Converte as colunas de valor para tipo string e substitui vírgulas por pontos
-        # para garantir o formato numérico correto para o Google Sheets
-        for col_val in ['VALOR_ITEM', 'VALOR_RENEGOCIADO']:
-            if col_val in df_to_save.columns:
-                df_to_save[col_val] = df_to_save[col_val].astype(str).str.replace(',', '.', regex=False)
+        st.success("Dados salvos na planilha com sucesso!")
+    except Exception as e:
+        st.error(f"Erro ao salvar dados no Google Sheets: {e}")
 
-        for col in ['DATA', 'DATA_APROVACAO', 'DATA_ENTREGA', 'PREVISAO_ENTREGA']:
-            if col in df_to_save.columns:
-                df_to_save[col] = df_to_save[col].apply(
-                    lambda x: x.strftime('%d/%m/%Y') if pd.notna(x) else ''
-                )
-        
-        data_to_write = [df_to_save.columns.values.tolist()] + df_to_save.values.tolist()
-        
-        worksheet.clear()
-        worksheet.update(data_to_write, value_input_option='USER_ENTERED')
+def atualizar_dados_pedidos(df_alteracoes):
+    """Grava só as colunas informadas das linhas indicadas pelo ID, num único batchUpdate."""
+    try:
+        colunas = [col for col in df_alteracoes.columns if col in PEDIDOS_POR_FILIAL.colunas()]
+        PEDIDOS_POR_FILIAL.atualizar_por_id(serializar_pedidos(df_alteracoes[colunas]))
         
         st.success("Dados salvos na planilha com sucesso!")
     except Exception as e:
         st.error(f"Erro ao salvar dados no Google Sheets: {e}")
 
-def carregar_dados_solicitantes():
-    """Carrega o DataFrame de solicitantes do Google Sheets."""
+def anexar_dados_pedidos(df_novos):
+    """Acrescenta novas linhas de pedido ao fim da aba (da filial), com custo proporcional às linhas novas."""
     try:
-        gc = get_gspread_client()
-        spreadsheet = gc.open_by_key(st.secrets["sheet_id"])
-        worksheet = spreadsheet.get_worksheet(1)
-        
-        data = worksheet.get_all_records()
-        df = pd.DataFrame(data)
+        PEDIDOS_POR_FILIAL.anexar(serializar_pedidos(df_novos))
         
-        return df
+        st.success("Dados salvos na planilha com sucesso!")
     except Exception as e:
-        st.error(f"Erro ao carregar dados de solicitantes do Google Sheets: {e}")
-        return criar_dataframe_solicitantes_vazio()
+        st.error(f"Erro ao salvar dados no Google Sheets: {e}")
 
-def criar_dataframe_solicitantes_vazio():
-    """Cria um DataFrame de solicitantes vazio."""
-    return pd.DataFrame(columns=["NOME", "DEPARTAMENTO", "EMAIL", "FILIAL"])
+def carregar_dados_solicitantes():
+    """Carrega o DataFrame de solicitantes do Google Sheets (FalhaPlanilha se não conseguir)."""
+    return garantir_ids(ler_aba(1, grupo=ABAS_PAGINA, tipos=SOLICITANTES.tipos), 1)
 
-def salvar_dados_solicitantes(df):
-    """Salva o DataFrame de solicitantes no Google Sheets."""
+def anexar_dados_solicitantes(df_novos):
+    """Acrescenta novos solicitantes ao fim da aba, sem reescrever os já cadastrados."""
     try:
-        gc = get_gspread_client()
-        spreadsheet = gc.open_by_key(st.secrets["sheet_id"])
-        worksheet = spreadsheet.get_worksheet(1)
-
-        data_to_write = [df.columns.values.tolist()] + df.values.tolist()
-        
-        worksheet.clear()
-        worksheet.update(data_to_write, value_input_option='USER_ENTERED')
+        anexar_linhas(df_novos, 1)
         
         st.success("Solicitante cadastrado na planilha com sucesso!")
     except Exception as e:
         st.error(f"Erro ao salvar dados de solicitantes no Google Sheets: {e}")
 
-@st.cache_data(show_spinner=False)
+@recarregar_se_mudou()
 def carregar_dados_almoxarifado():
-    """Carrega dados do almoxarifado para preencher a nota fiscal."""
-    try:
-        gc = get_gspread_client()
-        spreadsheet = gc.open_by_key(st.secrets["sheet_id"])
-        worksheet = spreadsheet.get_worksheet(2)
-        data = worksheet.get_all_records()
-        df = pd.DataFrame(data)
-
-        ordem_colunas = ['ORDEM_COMPRA', 'DOC NF']
-        df = df.reindex(columns=ordem_colunas, fill_value="")
-        
-        return df
-    except Exception as e:
-        st.warning(f"Aviso: Não foi possível carregar dados do Almoxarifado para preencher a nota fiscal. Verifique a aba 'Almoxarifado' da planilha. {e}")
-        return pd.DataFrame(columns=['ORDEM_COMPRA', 'DOC NF'])
+    """
+    Carrega dados do almoxarifado para preencher a nota fiscal. Baixa de novo quando o
+    almoxarifado é gravado (por qualquer painel); falhas saem como FalhaPlanilha, que não
+    fica guardada (um DataFrame vazio ficaria em cache).
+    """
+    # Baixa só as colunas usadas em vez da aba inteira
+    df = ler_aba(2, grupo=ABAS_PAGINA, colunas=COLUNAS_ALMOXARIFADO)
+    return df.reindex(columns=COLUNAS_ALMOXARIFADO, fill_value="")
 
 
 # --- LÓGICA DE LOGIN (SEM INTEGRAÇÃO COM SMTP) ---
@@ -320,14 +289,32 @@ if 'logado' not in st.session_state or not st.session_state.logado:
 else:
     logo_img = load_logo(logo_url)
 
-    if 'df_pedidos' not in st.session_state:
-        st.session_state.df_pedidos = carregar_dados_pedidos()
-    if 'df_solicitantes' not in st.session_state:
-        st.session_state.df_solicitantes = carregar_dados_solicitantes()
+    if PEDIDOS_POR_FILIAL.ativa():
+        try:
+            filiais = PEDIDOS_POR_FILIAL.valores()
+        except FalhaPlanilha as e:
+            exibir_falha(e)
+        filial = st.sidebar.selectbox("Filial", [TODAS_FILIAIS] + filiais, key='filial_escolhida')
+    else:
+        filial = TODAS_FILIAIS
+
+    try:
+        if 'df_pedidos' not in st.session_state or st.session_state.get('filial_pedidos', TODAS_FILIAIS) != filial:
+            st.session_state.df_pedidos = carregar_dados_pedidos(filial)
+            st.session_state.filial_pedidos = filial
+        if 'df_solicitantes' not in st.session_state:
+            st.session_state.df_solicitantes = carregar_dados_solicitantes()
+    except FalhaPlanilha as e:
+        exibir_falha(e)
     if 'itens_requisicao_temp' not in st.session_state:
         st.session_state.itens_requisicao_temp = pd.DataFrame(columns=["MATERIAL", "QUANTIDADE"])
     if 'df_almoxarifado' not in st.session_state:
-        st.session_state.df_almoxarifado = carregar_dados_almoxarifado()
+        try:
+            st.session_state.df_almoxarifado = carregar_dados_almoxarifado()
+        except FalhaPlanilha as e:
+            # Só serve para preencher a nota fiscal: segue sem ele
+            st.warning(f"Aviso: Não foi possível carregar dados do Almoxarifado para preencher a nota fiscal. Verifique a aba 'Almoxarifado' da planilha. {e}")
+            st.session_state.df_almoxarifado = pd.DataFrame(columns=COLUNAS_ALMOXARIFADO)
 
     with st.sidebar:
         if logo_img:
@@ -415,7 +402,7 @@ else:
                 linhas_a_adicionar = []
                 for _, item_row in st.session_state.itens_requisicao_temp.iterrows():
                     nova_linha = {
-                        "DATA": data_requisicao,
+                        "DATA": pd.Timestamp(data_requisicao),
                         "SOLICITANTE": solicitante_selecionado,
                         "DEPARTAMENTO": departamento_selecionado,
                         "FILIAL": filial_selecionada,
@@ -430,8 +417,11 @@ else:
                     }
                     linhas_a_adicionar.append(nova_linha)
                 
-                st.session_state.df_pedidos = pd.concat([st.session_state.df_pedidos, pd.DataFrame(linhas_a_adicionar)], ignore_index=True)
-                salvar_dados_pedidos(st.session_state.df_pedidos)
+                df_novos_pedidos = com_ids(pd.DataFrame(linhas_a_adicionar))
+                anexar_dados_pedidos(df_novos_pedidos)
+                # Requisição de outra filial vai para a aba dela e não entra na lista em edição
+                if st.session_state.filial_pedidos in (TODAS_FILIAIS, str(filial_selecionada).strip().upper()):
+                    st.session_state.df_pedidos = pd.concat([st.session_state.df_pedidos, df_novos_pedidos], ignore_index=True)
                 st.session_state.itens_requisicao_temp = pd.DataFrame(columns=["MATERIAL", "QUANTIDADE"])
                 st.success("Requisição registrada com sucesso! Vá para 'Atualizar Pedidos' para completar as informações.")
                 st.balloons()
@@ -470,7 +460,8 @@ else:
             "PREVISAO_ENTREGA", "DATA_APROVACAO", "CONDICAO_FRETE"
         ]
         
-        df_editavel = pedidos_pendentes_oc[cols_para_editar].copy()
+        # O ID estável vira o índice (oculto) para localizar as linhas ao salvar
+        df_editavel = pedidos_pendentes_oc.drop_duplicates(COLUNA_ID).set_index(COLUNA_ID)[cols_para_editar].copy()
 
         # Converte as colunas de valor para string para evitar o erro de compatibilidade
         for col_val in ['VALOR_ITEM', 'VALOR_RENEGOCIADO']:
@@ -517,24 +508,21 @@ else:
                 axis=1
             )
             
-            for index, edited_row in edited_df.iterrows():
-                original_index = st.session_state.df_pedidos[
-                    (st.session_state.df_pedidos['REQUISICAO'] == edited_row['REQUISICAO']) & 
-                    (st.session_state.df_pedidos['MATERIAL'] == edited_row['MATERIAL'])
-                ].index
-                
-                if not original_index.empty:
-                    original_index = original_index[0]
-                    st.session_state.df_pedidos.loc[original_index, 'FORNECEDOR'] = edited_row['FORNECEDOR']
-                    st.session_state.df_pedidos.loc[original_index, 'ORDEM_COMPRA'] = edited_row['ORDEM_COMPRA']
-                    st.session_state.df_pedidos.loc[original_index, 'VALOR_ITEM'] = edited_df.loc[index, 'VALOR_ITEM']
-                    st.session_state.df_pedidos.loc[original_index, 'VALOR_RENEGOCIADO'] = edited_row['VALOR_RENEGOCIADO']
-                    st.session_state.df_pedidos.loc[original_index, 'PREVISAO_ENTREGA'] = edited_row['PREVISAO_ENTREGA']
-                    st.session_state.df_pedidos.loc[original_index, 'DATA_APROVACAO'] = edited_row['DATA_APROVACAO']
-                    st.session_state.df_pedidos.loc[original_index, 'CONDICAO_FRETE'] = edited_row['CONDICAO_FRETE']
-                    st.session_state.df_pedidos.loc[original_index, 'DIAS_EMISSAO'] = edited_row['DIAS_EMISSAO']
+            cols_atualizadas = [
+                'FORNECEDOR', 'ORDEM_COMPRA', 'VALOR_ITEM', 'VALOR_RENEGOCIADO',
+                'PREVISAO_ENTREGA', 'DATA_APROVACAO', 'CONDICAO_FRETE', 'DIAS_EMISSAO'
+            ]
+
+            # Localiza cada linha pelo ID em vez de buscar REQUISICAO + MATERIAL
+            try:
+                posicoes = posicoes_por_id(st.session_state.df_pedidos, edited_df.index)
+            except KeyError as e:
+                st.error(f"Não foi possível localizar as linhas editadas ({e}). Recarregue os dados e tente de novo.")
+                st.stop()
+            for col in cols_atualizadas:
+                st.session_state.df_pedidos.iloc[posicoes, st.session_state.df_pedidos.columns.get_loc(col)] = edited_df[col].values
             
-            salvar_dados_pedidos(st.session_state.df_pedidos)
+            atualizar_dados_pedidos(edited_df[cols_atualizadas])
             st.success("Dados atualizados com sucesso!")
             st.rerun()
 
@@ -551,7 +539,6 @@ else:
         col_filter_h1, col_filter_h2, col_filter_h3, col_filter_h4 = st.columns(4)
         
         df_history = st.session_state.df_pedidos.copy()
-        df_history['DATA'] = pd.to_datetime(df_history['DATA'], errors='coerce', dayfirst=True)
 
         df_almox = st.session_state.df_almoxarifado.copy()
         if not df_almox.empty:
@@ -588,7 +575,8 @@ else:
             st.warning("Nenhum registro encontrado com os filtros aplicados.")
             st.stop()
         
-        df_display = df_history.copy()
+        # O ID estável vira o índice (oculto), pois o merge acima não preserva o índice original
+        df_display = df_history.set_index(COLUNA_ID)
 
         # Adiciona a conversão de valor para string para o data_editor
         for col_val in ['VALOR_ITEM', 'VALOR_RENEGOCIADO']:
@@ -610,7 +598,7 @@ else:
         edited_history_df = st.data_editor(
             df_display,
             use_container_width=True,
-            hide_index=False,
+            hide_index=True,
             key='history_editor',
             column_config={
                 "STATUS_PEDIDO": st.column_config.SelectboxColumn("Status", options=['🟢 ENTREGUE', '🟡 PENDENTE', 'EM ANDAMENTO', '']),
@@ -677,10 +665,15 @@ else:
 
             edited_history_df['DIAS_ATRASO'] = edited_history_df.apply(calcular_dias_atraso, axis=1)
 
-            # Mapeia as alterações de volta para o DataFrame principal
+            # Mapeia as alterações de volta para o DataFrame principal pelo ID da linha
+            try:
+                posicoes = posicoes_por_id(st.session_state.df_pedidos, edited_history_df.index)
+            except KeyError as e:
+                st.error(f"Não foi possível localizar as linhas editadas ({e}). Recarregue os dados e tente de novo.")
+                st.stop()
             for col in edited_history_df.columns:
                 if col in st.session_state.df_pedidos.columns and col not in ['Anexo']:
-                    st.session_state.df_pedidos.loc[edited_history_df.index, col] = edited_history_df[col]
+                    st.session_state.df_pedidos.iloc[posicoes, st.session_state.df_pedidos.columns.get_loc(col)] = edited_history_df[col].values
             
             salvar_dados_pedidos(st.session_state.df_pedidos)
             st.success("Histórico atualizado com sucesso!")
@@ -708,14 +701,14 @@ else:
             
             if st.form_submit_button("Cadastrar"):
                 if nome and departamento and filial and email:
-                    novo_solicitante = pd.DataFrame([{
+                    novo_solicitante = com_ids(pd.DataFrame([{
                         "NOME": nome,
                         "DEPARTAMENTO": departamento,
                         "EMAIL": email,
                         "FILIAL": filial
-                    }])
+                    }]))
+                    anexar_dados_solicitantes(novo_solicitante)
                     st.session_state.df_solicitantes = pd.concat([st.session_state.df_solicitantes, novo_solicitante], ignore_index=True)
-                    salvar_dados_solicitantes(st.session_state.df_solicitantes)
                     st.success(f"Solicitante '{nome}' cadastrado com sucesso!")
                     time.sleep(2)
                     st.rerun()
@@ -732,12 +725,14 @@ else:
 
         st.header("📊 Análise de Desempenho de Entregas")
         
-        if st.session_state.df_pedidos.empty:
+        try:
+            df_analise = pedidos_para_paineis()
+        except FalhaPlanilha as e:
+            exibir_falha(e)
+
+        if df_analise.empty:
             st.info("Nenhum pedido registrado para análise.")
             st.stop()
-
-        df_analise = st.session_state.df_pedidos.copy()
-        df_analise['DATA'] = pd.to_datetime(df_analise['DATA'], errors='coerce', dayfirst=True)
         
         st.subheader("Filtros de Período")
         col_filtro1, col_filtro2 = st.columns(2)
@@ -867,11 +862,12 @@ else:
         """, unsafe_allow_html=True)
         st.header("📊 Análise de Performance de Negociações Locais")
 
-        df_performance = st.session_state.df_pedidos.copy()
+        try:
+            df_performance = pedidos_para_paineis()
+        except FalhaPlanilha as e:
+            exibir_falha(e)
         df_performance_local = df_performance[df_performance['TIPO_PEDIDO'] == 'LOCAL'].copy()
         
-        df_performance_local['DATA'] = pd.to_datetime(df_performance_local['DATA'], errors='coerce', dayfirst=True)
-        
         st.markdown("---")
         st.subheader("Filtros de Período")
         col_filtro_p1, col_filtro_p2 = st.columns(2)
@@ -0,0 +1,75 @@
+"""
+Peças sem dependências compartilhadas pelos módulos do portal (planilhas, memoria,
+espelho, armazem_local...). Ficam aqui para que quem só precisa delas não carregue o
+gspread, o Streamlit ou o pyarrow junto.
+"""
+import os
+import tempfile
+from pathlib import Path
+
+# Coluna oculta com o ID imutável de cada linha das abas de dados (ver planilhas.py)
+COLUNA_ID = "_ID"
+
+
+def texto_celula(valor, value_input_option):
+    """Valor como a planilha o devolve depois (FORMATTED_VALUE): sempre texto."""
+    if valor is None:
+        return ''
+    if isinstance(valor, bool):
+        return "TRUE" if valor else "FALSE"
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    texto = str(valor)
+    if value_input_option == 'USER_ENTERED' and texto.startswith("'"):
+        return texto[1:]
+    return texto
+
+
+def aparar(linhas):
+    """Sem as células vazias no fim de cada linha e as linhas vazias no fim, como a API devolve."""
+    aparadas = []
+    for linha in linhas:
+        fim = len(linha)
+        while fim and linha[fim - 1] == '':
+            fim -= 1
+        aparadas.append(linha[:fim])
+    while aparadas and not aparadas[-1]:
+        aparadas.pop()
+    return aparadas
+
+
+# umask do processo, para dar aos arquivos novos as permissões de um open() comum (o
+# mkstemp cria com 0600); lida uma vez, porque os.umask só lê trocando o valor
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def gravar_atomico(caminho, escrever):
+    """
+    Grava `caminho` por inteiro ou não grava: `escrever(temporario)` escreve o conteúdo num
+    arquivo da mesma pasta, que é sincronizado e renomeado por cima do destino. O arquivo
+    mantém as permissões do que substitui (ou as de um arquivo novo, pela umask).
+    """
+    caminho = Path(caminho)
+    try:
+        modo = caminho.stat().st_mode & 0o7777
+    except FileNotFoundError:
+        modo = 0o666 & ~_UMASK
+    descritor, temporario = tempfile.mkstemp(prefix=f".{caminho.name}.", dir=caminho.parent or ".")
+    os.close(descritor)
+    try:
+        escrever(temporario)
+        os.chmod(temporario, modo)
+        with open(temporario, "rb") as arquivo:
+            os.fsync(arquivo.fileno())
+        os.replace(temporario, caminho)
+    except BaseException:
+        Path(temporario).unlink(missing_ok=True)
+        raise
+    # O rename só é durável depois de sincronizar a pasta
+    if hasattr(os, "O_DIRECTORY"):
+        pasta = os.open(caminho.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(pasta)
+        finally:
+            os.close(pasta)
@@ -4,9 +4,10 @@ import datetime
 import requests
 from PIL import Image
 from io import BytesIO
-import gspread
-from google.oauth2.service_account import Credentials
-import json
+from planilhas import recarregar_se_mudou, limpar_cargas, FalhaPlanilha, exibir_falha
+from esquemas import PEDIDOS
+from arquivo import anos_arquivados, com_arquivo
+from particoes import PEDIDOS_POR_FILIAL
 import plotly.express as px
 from pandas.errors import EmptyDataError
 
@@ -130,73 +131,30 @@ def load_logo(url):
 logo_url = "http://nfeviasolo.com.br/portal2/imagens/Logo%20Essencis%20MG%20-%20branca.png"
 logo_img = load_logo(logo_url)
 
-# --- Funções de Conexão e Carregamento de Dados ---
-@st.cache_resource(show_spinner=False)
-def get_gspread_client():
-    """
-    Conecta com o Google Sheets usando os secrets do Streamlit.
-    Esta função foi aprimorada para lidar tanto com strings JSON quanto com objetos AttrDict.
-    """
-    scopes = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
-    
-    credentials_info = st.secrets["gcp_service_account"]
-    
-    # Verifica se as credenciais são uma string e tenta convertê-las para JSON
-    if isinstance(credentials_info, str):
-        try:
-            credentials_info = json.loads(credentials_info)
-        except json.JSONDecodeError as e:
-            st.error(f"Erro ao decodificar as credenciais JSON: {e}. Verifique a formatação do secrets.toml.")
-            return None
-    
-    creds = Credentials.from_service_account_info(credentials_info, scopes=scopes)
-    client = gspread.authorize(creds)
-    return client
+# --- Funções de Carregamento de Dados ---
+# Colunas da aba de pedidos usadas pelos filtros, gráficos e tabela deste painel
+COLUNAS_CONSULTA = [
+    'DATA', 'REQUISICAO', 'SOLICITANTE', 'DEPARTAMENTO', 'MATERIAL', 'QUANTIDADE',
+    'ORDEM_COMPRA', 'FORNECEDOR', 'PREVISAO_ENTREGA', 'DATA_ENTREGA'
+]
 
-@st.cache_data(ttl=600)  # Cache de 10 minutos
+@recarregar_se_mudou(compartilhado=True)  # Baixa de novo só quando a planilha muda
 def carregar_dados_pedidos():
-    """Carrega os dados de pedidos do Google Sheets."""
-    try:
-        gc = get_gspread_client()
-        
-        spreadsheet = gc.open_by_key(st.secrets["sheet_id"])
-        worksheet = spreadsheet.get_worksheet(0)
-        
-        data = worksheet.get_all_records()
-        df = pd.DataFrame(data)
+    """Carrega os dados de pedidos do Google Sheets (FalhaPlanilha se não conseguir)."""
+    # Baixa só as colunas usadas pelo painel (de todas as filiais, se os pedidos estiverem
+    # divididos), com datas e quantidade já convertidas
+    df = PEDIDOS.preparar(PEDIDOS_POR_FILIAL.ler(colunas=COLUNAS_CONSULTA, tipos=PEDIDOS.tipos), colunas=COLUNAS_CONSULTA)
 
-        # Adiciona a nova coluna à lista de colunas de data
-        for col in ['DATA', 'DATA_APROVACAO', 'DATA_ENTREGA', 'PREVISAO_ENTREGA']:
-            if col in df.columns and not df[col].empty:
-                df[col] = pd.to_datetime(df[col], errors='coerce', dayfirst=True)
-        
-        for col in ['QUANTIDADE', 'VALOR_ITEM', 'VALOR_RENEGOCIADO', 'DIAS_ATRASO', 'DIAS_EMISSAO']:
-            if col in df.columns and not df[col].empty:
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-        
-        if 'STATUS_PEDIDO' not in df.columns:
-            df['STATUS_PEDIDO'] = ''
-        if 'ORDEM_COMPRA' not in df.columns:
-            df['ORDEM_COMPRA'] = ''
-        if 'FORNECEDOR' not in df.columns:
-            df['FORNECEDOR'] = ''
-        if 'PREVISAO_ENTREGA' not in df.columns:
-            df['PREVISAO_ENTREGA'] = pd.NaT
-
-        # NOVO CÓDIGO AQUI:
-        # Define o status do pedido com base na data de entrega
-        df['STATUS_PEDIDO'] = df['DATA_ENTREGA'].apply(
-            lambda x: 'ENTREGUE' if pd.notna(x) else 'PENDENTE'
-        )
+    return com_status(df)
+
+def com_status(df):
+    # NOVO CÓDIGO AQUI:
+    # Define o status do pedido com base na data de entrega
+    df['STATUS_PEDIDO'] = df['DATA_ENTREGA'].apply(
+        lambda x: 'ENTREGUE' if pd.notna(x) else 'PENDENTE'
+    )
 
-        return df
-    except Exception as e:
-        st.error(f"Erro ao carregar dados do Google Sheets: {e}")
-        st.info("Verifique suas credenciais e a planilha.")
-        return pd.DataFrame(columns=[
-            "DATA", "SOLICITANTE", "DEPARTAMENTO", "REQUISICAO", "MATERIAL",
-            "STATUS_PEDIDO", "DATA_APROVACAO", "DATA_ENTREGA", "ORDEM_COMPRA", "VALOR_ITEM", "FORNECEDOR", "PREVISAO_ENTREGA"
-        ])
+    return df
 
 
 # --- LAYOUT E FILTROS DO SIDEBAR ---
@@ -207,22 +165,32 @@ with st.sidebar:
     st.title("🔎 Painel de Consulta")
     st.divider()
     
-    df_pedidos = carregar_dados_pedidos()
+    try:
+        df_pedidos = carregar_dados_pedidos()
+    except FalhaPlanilha as e:
+        exibir_falha(e)
     
-    # Adicionando um botão de recarregar dados
+    # Adicionando um botão de recarregar dados (só os pedidos deste painel)
     if st.button("🔄 Recarregar Dados", use_container_width=True):
-        st.cache_data.clear()
+        limpar_cargas(carregar_dados_pedidos)
         st.rerun()
 
     st.divider()
 
     st.subheader("Filtros de Período")
+    try:
+        anos_no_arquivo = anos_arquivados("pedidos")
+    except FalhaPlanilha as e:
+        st.warning(f"Não foi possível consultar o arquivo de pedidos antigos: {e}")
+        anos_no_arquivo = []
+
     if 'DATA' in df_pedidos.columns and not df_pedidos['DATA'].isnull().all():
         # Filtros de data por multiselect
         df_pedidos['MES'] = df_pedidos['DATA'].dt.month
         df_pedidos['ANO'] = df_pedidos['DATA'].dt.year
         meses_disponiveis = sorted(df_pedidos['MES'].dropna().unique())
-        anos_disponiveis = sorted(df_pedidos['ANO'].dropna().unique(), reverse=True)
+        # Os anos do arquivo morto aparecem no filtro, mas só são baixados quando escolhidos
+        anos_disponiveis = sorted(set(df_pedidos['ANO'].dropna().astype(int)) | set(anos_no_arquivo), reverse=True)
         meses_nomes = {1: "Janeiro", 2: "Fevereiro", 3: "Março", 4: "Abril", 5: "Maio", 6: "Junho",
                         7: "Julho", 8: "Agosto", 9: "Setembro", 10: "Outubro", 11: "Novembro", 12: "Dezembro"}
         
@@ -237,6 +205,19 @@ with st.sidebar:
             options=['Todos'] + anos_disponiveis,
             default=['Todos']
         )
+
+        if 'Todos' in filtro_ano_dash:
+            incluir_arquivo = bool(anos_no_arquivo) and st.checkbox("Incluir pedidos arquivados", value=False)
+            anos_arquivo = None if incluir_arquivo else []
+        else:
+            anos_arquivo = [ano for ano in filtro_ano_dash if ano in anos_no_arquivo]
+        if anos_arquivo != []:
+            try:
+                df_pedidos = com_status(com_arquivo(df_pedidos, "pedidos", anos_arquivo, COLUNAS_CONSULTA))
+                df_pedidos['MES'] = df_pedidos['DATA'].dt.month
+                df_pedidos['ANO'] = df_pedidos['DATA'].dt.year
+            except FalhaPlanilha as e:
+                st.warning(f"Não foi possível carregar os pedidos arquivados: {e}")
     else:
         filtro_mes_dash = ['Todos']
         filtro_ano_dash = ['Todos']
@@ -0,0 +1,142 @@
+"""
+Espelho local das abas, em Parquet.
+
+Cada aba lida inteira é guardada em <pasta>/<sheet_id>/<título da aba>.parquet junto com a
+versão da planilha (ver planilhas.versao_planilha) em que foi baixada. Nas cargas seguintes,
+enquanto a versão for a mesma, a aba vem do disco em vez do Google. As gravações feitas
+pelas funções de planilhas.py também são aplicadas ao espelho, que passa para a versão
+nova da planilha; assim quem acabou de salvar não precisa baixar a aba de novo.
+
+O Google Sheets continua sendo a fonte dos dados: qualquer mudança feita por fora (outro
+script, a própria planilha) muda a versão e a aba volta a ser baixada. Configuração no
+secrets.toml:
+
+    [espelho]
+    pasta = "espelho"    # pasta dos arquivos (a seção ativa o espelho)
+    validade = 21600     # segundos: depois disso a aba é baixada de novo mesmo sem mudança
+
+A grade é guardada como texto, como a API devolve (uma coluna Parquet por coluna da aba,
+com o cabeçalho nos metadados): a conversão de tipos é a mesma da leitura pelo Google e a
+leitura de só algumas colunas lê só elas do arquivo. Os valores gravados entram no espelho
+como foram enviados; se a planilha os formatar de outro jeito (por exemplo, "1,5" para 1.5),
+a diferença some quando a aba for baixada de novo, ao fim da `validade`.
+"""
+import json
+import threading
+import time
+from pathlib import Path
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+from gspread.utils import fill_gaps
+
+from comum import aparar, gravar_atomico, texto_celula
+
+VALIDADE_PADRAO = 6 * 3600
+
+
+def configuracao_espelho():
+    """Seção [espelho] do secrets.toml (vazia se o espelho não estiver configurado)."""
+    return dict(st.secrets.get("espelho", {}))
+
+
+def espelho_ativo():
+    return bool(configuracao_espelho().get("pasta"))
+
+
+def escrever_bloco(grade, linha, coluna, valores, value_input_option='USER_ENTERED'):
+    """Escreve `valores` (lista de linhas) na grade a partir de (linha, coluna), 0-based, ampliando-a se preciso."""
+    for i, valores_linha in enumerate(valores):
+        while len(grade) <= linha + i:
+            grade.append([])
+        destino = grade[linha + i]
+        fim = coluna + len(valores_linha)
+        if len(destino) < fim:
+            destino.extend([''] * (fim - len(destino)))
+        destino[coluna:fim] = [texto_celula(valor, value_input_option) for valor in valores_linha]
+
+
+class EspelhoLocal:
+    def __init__(self, pasta, validade=VALIDADE_PADRAO):
+        self.pasta = Path(pasta)
+        self.validade = float(validade)
+        self.lock = threading.Lock()
+
+    def _caminho(self, chave, aba):
+        return self.pasta / chave / f"{quote(aba, safe='')}.parquet"
+
+    def _metadados(self, caminho):
+        try:
+            metadados = pq.read_schema(caminho).metadata or {}
+        except (OSError, pa.ArrowException):
+            return None
+        return {k.decode(): json.loads(v) for k, v in metadados.items() if k in (b"versao", b"baixado_em", b"cabecalho")}
+
+    def versao(self, chave, aba):
+        """Versão da planilha em que o espelho da aba está, ou None (sem espelho ou vencido)."""
+        metadados = self._metadados(self._caminho(chave, aba))
+        if not metadados or time.time() - metadados["baixado_em"] > self.validade:
+            return None
+        return metadados["versao"]
+
+    def ler(self, chave, aba, versao, colunas=None):
+        """
+        Grade (cabeçalho + linhas) da aba, só de `colunas` se informadas, se o espelho estiver
+        na `versao` informada; senão None.
+        """
+        caminho = self._caminho(chave, aba)
+        metadados = self._metadados(caminho)
+        if (
+            not metadados or metadados["versao"] != versao
+            or time.time() - metadados["baixado_em"] > self.validade
+        ):
+            return None
+        cabecalho = metadados["cabecalho"]
+        posicoes = range(len(cabecalho)) if colunas is None else [
+            j for j, nome in enumerate(cabecalho) if nome in colunas
+        ]
+        try:
+            tabela = pq.read_table(caminho, columns=[f"c{j}" for j in posicoes])
+        except (OSError, pa.ArrowException):
+            return None
+        linhas = zip(*(coluna.to_pylist() for coluna in tabela.columns)) if posicoes else ([] for _ in range(tabela.num_rows))
+        return [[cabecalho[j] for j in posicoes]] + [list(linha) for linha in linhas]
+
+    def _gravar(self, chave, aba, grade, versao, baixado_em):
+        grade = fill_gaps(aparar(grade) or [[]])
+        cabecalho, linhas = grade[0], grade[1:]
+        colunas = zip(*linhas) if linhas else ([] for _ in cabecalho)
+        tabela = pa.table({f"c{j}": pa.array(coluna, pa.string()) for j, coluna in enumerate(colunas)})
+        tabela = tabela.replace_schema_metadata({
+            "versao": json.dumps(versao),
+            "baixado_em": json.dumps(baixado_em),
+            "cabecalho": json.dumps(cabecalho, ensure_ascii=False),
+        })
+        caminho = self._caminho(chave, aba)
+        caminho.parent.mkdir(parents=True, exist_ok=True)
+        gravar_atomico(caminho, lambda temporario: pq.write_table(tabela, temporario))
+
+    def guardar(self, chave, aba, grade, versao):
+        """Guarda a grade da aba recém-baixada, na `versao` lida antes do download."""
+        with self.lock:
+            self._gravar(chave, aba, grade, versao, time.time())
+
+    def alterar(self, chave, aba, versao, alteracao):
+        """
+        Aplica `alteracao(grade)` (que altera a grade no lugar) ao espelho da aba e o marca
+        com a `versao` nova. Sem espelho da aba, não faz nada.
+        """
+        with self.lock:
+            caminho = self._caminho(chave, aba)
+            metadados = self._metadados(caminho)
+            grade = self.ler(chave, aba, metadados["versao"]) if metadados else None
+            if grade is None:
+                return
+            alteracao(grade)
+            self._gravar(chave, aba, grade, versao, metadados["baixado_em"])
+
+    def descartar(self, chave, aba):
+        with self.lock:
+            self._caminho(chave, aba).unlink(missing_ok=True)
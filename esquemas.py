@@ -0,0 +1,220 @@
+"""
+Esquemas das abas: para cada uma, as colunas com o nome na planilha, o tipo, o formato de
+data, o valor padrão (para colunas que faltam) e os apelidos usados nas telas.
+
+É a fonte única para:
+- os `tipos` passados ao ler_aba, que convertem cada coluna uma única vez, na leitura;
+- completar as colunas que faltam (`preparar`) e montar DataFrames vazios (`vazio`);
+- converter de volta para os valores gravados na planilha (`serializar`).
+
+Os mapas de renomeação, tipos e formatos são montados uma vez, ao criar o Esquema; as
+funções só fazem operações vetorizadas por coluna.
+"""
+from collections import namedtuple
+
+import pandas as pd
+
+from planilhas import COLUNA_ID, TIPO_DATA, TIPO_INTEIRO, TIPO_NUMERO, TIPO_TEXTO
+
+FORMATO_DATA = "%d/%m/%Y"
+FORMATO_DATA_HORA = "%d/%m/%Y %H:%M:%S"
+
+# tipo None: convertida como no get_all_records (número quando der, senão texto).
+# apelido: nome da coluna nas telas que não usam o nome da planilha (painel fiscal).
+# antigos: outros nomes de cabeçalho aceitos na leitura (gravados por versões anteriores).
+Coluna = namedtuple(
+    "Coluna", ["nome", "tipo", "formato", "padrao", "apelido", "antigos"],
+    defaults=(None, None, None, None, ()),
+)
+
+_PADROES = {TIPO_DATA: pd.NaT, TIPO_NUMERO: 0.0, TIPO_INTEIRO: 0}
+
+# Códigos do strftime -> padrão de formato numérico do Sheets
+_CODIGOS_SHEETS = {"%d": "dd", "%m": "mm", "%Y": "yyyy", "%H": "hh", "%M": "mm", "%S": "ss"}
+
+
+def _padrao_sheets(formato):
+    for codigo, padrao in _CODIGOS_SHEETS.items():
+        formato = formato.replace(codigo, padrao)
+    return formato
+
+
+def _serie_vazia(tipo):
+    if tipo == TIPO_DATA:
+        return pd.Series(dtype="datetime64[ns]")
+    if tipo == TIPO_NUMERO:
+        return pd.Series(dtype="float64")
+    if tipo == TIPO_INTEIRO:
+        return pd.Series(dtype="int64")
+    return pd.Series(dtype=object)
+
+
+class Esquema:
+    def __init__(self, colunas):
+        self.colunas = list(colunas)
+        self.nomes = [col.nome for col in self.colunas]
+
+        # Leitura: tipos pelo nome no cabeçalho, inclusive os nomes antigos
+        self.tipos = {}
+        for col in self.colunas:
+            if col.tipo is not None:
+                self.tipos.update(dict.fromkeys((col.nome, *col.antigos), col.tipo))
+        self._antigos = {antigo: col.nome for col in self.colunas for antigo in col.antigos}
+
+        self._apelidos = {col.nome: col.apelido for col in self.colunas if col.apelido}
+        self._nomes_planilha = {apelido: nome for nome, apelido in self._apelidos.items()}
+        # Colunas cujo nome é o apelido de outra: nas telas com apelidos vale a outra
+        self._encobertas = [nome for nome in self.nomes if nome in self._nomes_planilha and nome not in self._apelidos]
+
+        self._padroes = {
+            col.nome: col.padrao if col.padrao is not None else _PADROES.get(col.tipo, '')
+            for col in self.colunas
+        }
+        self._datas = {
+            col.nome: col.formato or FORMATO_DATA for col in self.colunas if col.tipo == TIPO_DATA
+        }
+
+    def preparar(self, df, apelidos=False, colunas=None):
+        """
+        Ajusta o DataFrame lido da planilha (já convertido pelos `tipos`): aceita os nomes
+        antigos de cabeçalho, troca para os apelidos se pedido e acrescenta as colunas que
+        faltam (todas do esquema, ou só `colunas`) com o valor padrão.
+        """
+        if self._antigos:
+            df = df.rename(columns={k: v for k, v in self._antigos.items() if v not in df.columns})
+        if apelidos and self._apelidos:
+            df = df.drop(columns=[c for c in self._encobertas if c in df.columns]).rename(columns=self._apelidos)
+        for nome in colunas or self.nomes:
+            if apelidos and nome in self._encobertas:
+                continue
+            coluna = self._apelidos.get(nome, nome) if apelidos else nome
+            if coluna not in df.columns:
+                df[coluna] = self._padroes[nome]
+        return df
+
+    def vazio(self, apelidos=False):
+        """DataFrame sem linhas com todas as colunas do esquema, já nos tipos declarados."""
+        return pd.DataFrame({
+            (self._apelidos.get(col.nome, col.nome) if apelidos else col.nome): _serie_vazia(col.tipo)
+            for col in self.colunas
+            if not (apelidos and col.nome in self._encobertas)
+        })
+
+    def formatos_datas(self, id_aba, cabecalho):
+        """
+        Requisições de batchUpdate que aplicam às colunas de data de `cabecalho` (da linha 2
+        em diante) o formato de data do esquema. Servem às cópias de linhas gravadas em RAW,
+        em que as datas vão como número de série e sem o formato seriam só números.
+        """
+        return [
+            {"repeatCell": {
+                "range": {
+                    "sheetId": id_aba, "startRowIndex": 1,
+                    "startColumnIndex": cabecalho.index(nome), "endColumnIndex": cabecalho.index(nome) + 1,
+                },
+                "cell": {"userEnteredFormat": {"numberFormat": {
+                    "type": "DATE_TIME" if "%H" in formato else "DATE", "pattern": _padrao_sheets(formato),
+                }}},
+                "fields": "userEnteredFormat.numberFormat",
+            }}
+            for nome, formato in self._datas.items() if nome in cabecalho
+        ]
+
+    def serializar(self, df, apelidos=False):
+        """Cópia do DataFrame com os valores e nomes de coluna gravados na planilha."""
+        df = df.copy()
+        if apelidos and self._nomes_planilha:
+            df = df.rename(columns=self._nomes_planilha)
+        for nome, formato in self._datas.items():
+            if nome not in df.columns:
+                continue
+            datas = df[nome]
+            if not pd.api.types.is_datetime64_any_dtype(datas):
+                datas = pd.to_datetime(datas, errors='coerce', dayfirst=True)
+            df[nome] = datas.dt.strftime(formato).fillna('')
+        return df
+
+
+PEDIDOS = Esquema([
+    Coluna("DATA", TIPO_DATA),
+    Coluna("SOLICITANTE"),
+    Coluna("DEPARTAMENTO"),
+    Coluna("FILIAL"),
+    Coluna("MATERIAL"),
+    Coluna("QUANTIDADE", TIPO_NUMERO),
+    Coluna("TIPO_PEDIDO"),
+    Coluna("REQUISICAO"),
+    Coluna("FORNECEDOR"),
+    # Sem tipo: a OC é comparada com a do almoxarifado, lida da mesma forma
+    Coluna("ORDEM_COMPRA"),
+    Coluna("VALOR_ITEM", TIPO_NUMERO),
+    Coluna("VALOR_RENEGOCIADO", TIPO_NUMERO),
+    Coluna("DATA_APROVACAO", TIPO_DATA),
+    Coluna("PREVISAO_ENTREGA", TIPO_DATA),
+    Coluna("CONDICAO_FRETE"),
+    Coluna("STATUS_PEDIDO"),
+    Coluna("DATA_ENTREGA", TIPO_DATA),
+    Coluna("DIAS_ATRASO", TIPO_NUMERO),
+    Coluna("DIAS_EMISSAO", TIPO_NUMERO),
+    Coluna("DOC NF"),
+    Coluna(COLUNA_ID, TIPO_TEXTO),
+])
+
+SOLICITANTES = Esquema([
+    Coluna("NOME"),
+    Coluna("DEPARTAMENTO"),
+    Coluna("EMAIL"),
+    Coluna("FILIAL"),
+    Coluna(COLUNA_ID, TIPO_TEXTO),
+])
+
+# Os apelidos são os nomes usados pelo painel fiscal
+ALMOXARIFADO = Esquema([
+    Coluna("DATA", TIPO_DATA),
+    Coluna("RECEBEDOR"),
+    Coluna("FORNECEDOR", antigos=("FORNECEDOR_NF",)),
+    Coluna("NF"),
+    Coluna("VOLUME", TIPO_INTEIRO),
+    Coluna("V. TOTAL NF", TIPO_NUMERO, apelido="V_TOTAL_NF"),
+    Coluna("CONDICAO FRETE"),
+    Coluna("VALOR FRETE", TIPO_NUMERO, apelido="VALOR_FRETE"),
+    Coluna("OBSERVACAO", apelido="REGISTRO_ADICIONAL"),
+    Coluna("DOC NF", apelido="DOC_NF"),
+    Coluna("VENCIMENTO", TIPO_DATA),
+    Coluna("STATUS_FINANCEIRO", apelido="STATUS"),
+    Coluna("CONDICAO_PROBLEMA"),
+    Coluna("REGISTRO_ADICIONAL"),
+    Coluna("ORDEM_COMPRA"),
+    Coluna("REGISTRO_ENVIO", TIPO_DATA, formato=FORMATO_DATA_HORA),
+    Coluna("VALOR_JUROS", TIPO_NUMERO),
+    Coluna(COLUNA_ID, TIPO_TEXTO),
+])
+
+# VALOR fica sem tipo: a aba é gravada em RAW e pode ter valores em texto
+REEMBOLSOS = Esquema([
+    Coluna("DATA"),
+    Coluna("NOME"),
+    Coluna("DEPARTAMENTO"),
+    Coluna("TIPO_DESPESA"),
+    Coluna("VALOR"),
+    Coluna("JUSTIFICATIVA"),
+    Coluna("STATUS"),
+    Coluna("ID_COMPROVANTE"),
+    Coluna(COLUNA_ID, TIPO_TEXTO),
+])
+
+# Matrícula e senha são comparadas como texto (sem perder zeros à esquerda)
+USUARIOS = Esquema([
+    Coluna("Nome"),
+    Coluna("Matricula", TIPO_TEXTO),
+    Coluna("Email", TIPO_TEXTO),
+    Coluna("Senha", TIPO_TEXTO),
+])
+
+ESQUEMAS = {
+    "pedidos": PEDIDOS,
+    "solicitantes": SOLICITANTES,
+    "almoxarifado": ALMOXARIFADO,
+    "reembolsos": REEMBOLSOS,
+    "usuarios": USUARIOS,
+}
@@ -12,9 +12,14 @@ from io import BytesIO
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-import gspread
-from google.oauth2.service_account import Credentials
-import json
+from planilhas import (
+    anexar_linhas,
+    COLUNA_ID, com_ids, garantir_ids, recarregar_se_mudou, limpar_cargas, metricas_revisao, ler_aba, INCREMENTAL,
+    FalhaPlanilha, exibir_falha, metricas_leituras,
+)
+from esquemas import PEDIDOS, SOLICITANTES, ALMOXARIFADO
+from transporte import metricas_chamadas
+from particoes import PEDIDOS_POR_FILIAL
 
 # Configuração da página com layout wide
 st.set_page_config(page_title="Painel Almoxarifado", layout="wide", page_icon="🏭")
@@ -136,113 +141,77 @@ def load_logo(url):
         return None
 
 # Funções de carregamento e salvamento de dados para Google Sheets
+# Abas lidas nesta página junto com os pedidos (almoxarifado e solicitantes): vêm todas num
+# único batchGet. O almoxarifado só cresce no fim, então é lido de forma incremental.
+# Datas e valores são convertidos já na leitura, com os tipos dos esquemas das abas.
+ABAS_PAGINA = {2: (INCREMENTAL, ALMOXARIFADO.tipos), 1: (None, SOLICITANTES.tipos)}
+
+# Os loaders rodam a cada execução do script, mas só baixam as abas quando a planilha mudou.
+# Se a planilha não puder ser lida, levantam FalhaPlanilha em vez de devolver um DataFrame
+# vazio, que depois seria gravado por cima da aba.
+# As cargas guardadas (_ler_*) só leem; os IDs que faltam são gravados por quem as chama,
+# para rodar também quando a carga é reaproveitada.
+@recarregar_se_mudou()
+def _ler_almoxarifado():
+    return ler_aba(2, grupo=ABAS_PAGINA, incremental=True, tipos=ALMOXARIFADO.tipos)
+
 def carregar_dados_almoxarifado():
-    try:
-        scopes = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
-        credentials_info = st.secrets["gcp_service_account"]
-        credentials = Credentials.from_service_account_info(credentials_info, scopes=scopes)
-        gc = gspread.authorize(credentials)
-        spreadsheet = gc.open_by_key(st.secrets["sheet_id"])
-        worksheet = spreadsheet.get_worksheet(2)
-        
-        data = worksheet.get_all_records()
-        df = pd.DataFrame(data)
-
-        # SE O DATAFRAME ESTIVER VAZIO, GARANTA QUE AS COLUNAS ESSENCIAIS EXISTAM
-        # Essa é a principal correção
-        colunas_obrigatorias_almoxarifado = [
-            "DATA", "RECEBEDOR", "FORNECEDOR", "NF", "VOLUME", "V. TOTAL NF",
-            "CONDICAO FRETE", "VALOR FRETE", "OBSERVACAO", "DOC NF", "VENCIMENTO",
-            "STATUS_FINANCEIRO", "CONDICAO_PROBLEMA", "REGISTRO_ADICIONAL",
-            "ORDEM_COMPRA", "REGISTRO_ENVIO"
-        ]
-
-        # Adiciona as colunas faltantes para garantir que o dataframe tenha a estrutura completa
-        for col in colunas_obrigatorias_almoxarifado:
-            if col not in df.columns:
-                df[col] = pd.NA if df.empty else ''
-
-        # Agora a conversão de tipos pode ser feita com segurança
-        df['DATA'] = pd.to_datetime(df['DATA'], errors='coerce', dayfirst=True)
-        df['VENCIMENTO'] = pd.to_datetime(df['VENCIMENTO'], errors='coerce', dayfirst=True)
-        df['REGISTRO_ENVIO'] = pd.to_datetime(df['REGISTRO_ENVIO'], errors='coerce', dayfirst=True)
-        df['V. TOTAL NF'] = pd.to_numeric(df['V. TOTAL NF'], errors='coerce').fillna(0)
-        df['VALOR FRETE'] = pd.to_numeric(df['VALOR FRETE'], errors='coerce').fillna(0)
-        df['VOLUME'] = pd.to_numeric(df['VOLUME'], errors='coerce').fillna(0).astype(int)
-
-        return df
-    except Exception as e:
-        st.error(f"Erro ao carregar dados do almoxarifado: {e}")
-        # Retorne um DataFrame com as colunas em caso de erro
-        return pd.DataFrame(columns=colunas_obrigatorias_almoxarifado)
+    # Completa as colunas que faltam na aba (já no tipo certo), inclusive com ela vazia
+    return ALMOXARIFADO.preparar(garantir_ids(_ler_almoxarifado(), 2))
+
+def serializar_almoxarifado(df):
+    return ALMOXARIFADO.serializar(df)
 
-def salvar_dados_almoxarifado(df):
+def anexar_nf_almoxarifado(df_nova):
     try:
-        scopes = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
-        credentials_info = st.secrets["gcp_service_account"]
-        credentials = Credentials.from_service_account_info(credentials_info, scopes=scopes)
-        gc = gspread.authorize(credentials)
-        spreadsheet = gc.open_by_key(st.secrets["sheet_id"])
-        worksheet = spreadsheet.get_worksheet(2)
-
-        df_copy = df.copy()
-        for col in ['DATA', 'VENCIMENTO']:
-            if col in df_copy.columns:
-                df_copy[col] = df_copy[col].apply(lambda x: x.strftime('%d/%m/%Y') if pd.notna(x) else '')
-        
-        # Formata a nova coluna
-        if 'REGISTRO_ENVIO' in df_copy.columns:
-            df_copy['REGISTRO_ENVIO'] = df_copy['REGISTRO_ENVIO'].apply(lambda x: x.strftime('%d/%m/%Y %H:%M:%S') if pd.notna(x) else '')
-        
-        data_to_write = [df_copy.columns.values.tolist()] + df_copy.values.tolist()
-        worksheet.clear()
-        worksheet.update(data_to_write, value_input_option='USER_ENTERED')
+        # Insere só a(s) NF(s) nova(s) no fim da aba, sem regravar o histórico
+        anexar_linhas(serializar_almoxarifado(df_nova), 2)
         return True
     except Exception as e:
         st.error(f"Erro ao salvar dados do almoxarifado: {e}")
         return False
 
-# Removido o cache para garantir que os dados de pedidos sejam sempre os mais recentes
+# Sem cache por tempo: os dados são baixados de novo sempre que a planilha muda
+@recarregar_se_mudou()
+def _ler_pedidos():
+    return PEDIDOS_POR_FILIAL.ler_abas(tipos=PEDIDOS.tipos, grupo=ABAS_PAGINA)
+
 def carregar_dados_pedidos():
-    """Carrega os dados de pedidos do Google Sheets."""
+    """Carrega os dados de pedidos (de todas as filiais, se divididos) do Google Sheets."""
+    # A NF pode ser de qualquer filial: a OC é procurada nos pedidos de todas, e as linhas
+    # dela são gravadas pelo ID, na aba de cada uma
+    return PEDIDOS.preparar(PEDIDOS_POR_FILIAL.preparar_edicao(_ler_pedidos()))
+
+def normalizar_ordem_compra(valor):
+    return str(valor).strip().upper()
+
+def indexar_ordens_compra(df):
+    """Mapeia cada OC (normalizada) para as posições das suas linhas no DataFrame de pedidos."""
+    if df.empty or 'ORDEM_COMPRA' not in df.columns:
+        return {}
+    chaves = df['ORDEM_COMPRA'].astype(str).str.strip().str.upper()
+    return {oc: list(posicoes) for oc, posicoes in chaves.groupby(chaves, sort=False).indices.items()}
+
+def marcar_pedidos_entregues(ids, data_entrega, doc_nf):
+    """Grava STATUS_PEDIDO, DATA_ENTREGA e DOC NF só nas linhas da OC (pelos IDs), num único batchUpdate por aba."""
     try:
-        scopes = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
-        credentials_info = st.secrets["gcp_service_account"]
-        credentials = Credentials.from_service_account_info(credentials_info, scopes=scopes)
-        gc = gspread.authorize(credentials)
-        spreadsheet = gc.open_by_key(st.secrets["sheet_id"])
-        worksheet = spreadsheet.get_worksheet(0)
-        data = worksheet.get_all_records()
-        df = pd.DataFrame(data)
-        
-        colunas_obrigatorias_pedidos = ["DATA", "SOLICITANTE", "DEPARTAMENTO", "FILIAL", "MATERIAL", "QUANTIDADE", "TIPO_PEDIDO", "REQUISICAO", "FORNECEDOR", "ORDEM_COMPRA", "VALOR_ITEM", "VALOR_RENEGOCIADO", "DATA_APROVACAO", "CONDICAO_FRETE", "STATUS_PEDIDO", "DATA_ENTREGA", "DOC NF"]
-        for col in colunas_obrigatorias_pedidos:
-            if col not in df.columns:
-                df[col] = pd.NA if df.empty else ''
-
-        for col in ['DATA', 'DATA_APROVACAO', 'DATA_ENTREGA']:
-            if col in df.columns:
-                df[col] = pd.to_datetime(df[col], errors='coerce', dayfirst=True)
-            
-        return df
+        df_alteracoes = pd.DataFrame({
+            'STATUS_PEDIDO': 'ENTREGUE',
+            'DATA_ENTREGA': pd.to_datetime(data_entrega).strftime('%d/%m/%Y'),
+            'DOC NF': doc_nf,
+        }, index=list(ids))
+        PEDIDOS_POR_FILIAL.atualizar_por_id(df_alteracoes)
+        return True
     except Exception as e:
-        st.error(f"Erro ao carregar dados de pedidos: {e}")
-        return pd.DataFrame(columns=colunas_obrigatorias_pedidos)
+        st.error(f"Erro ao atualizar os pedidos da OC: {e}")
+        return False
+
+@recarregar_se_mudou()
+def _ler_solicitantes():
+    return ler_aba(1, grupo=ABAS_PAGINA, tipos=SOLICITANTES.tipos)
 
 def carregar_dados_solicitantes():
-    try:
-        scopes = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
-        credentials_info = st.secrets["gcp_service_account"]
-        credentials = Credentials.from_service_account_info(credentials_info, scopes=scopes)
-        gc = gspread.authorize(credentials)
-        spreadsheet = gc.open_by_key(st.secrets["sheet_id"])
-        worksheet = spreadsheet.get_worksheet(1)
-        data = worksheet.get_all_records()
-        df = pd.DataFrame(data)
-        return df
-    except Exception as e:
-        st.error(f"Erro ao carregar dados de solicitantes: {e}")
-        return pd.DataFrame(columns=["NOME", "DEPARTAMENTO", "EMAIL", "FILIAL"])
+    return garantir_ids(_ler_solicitantes(), 1)
 
 # Funções de E-mail
 status_financeiro_options = ["EM ANDAMENTO", "NF PROBLEMA", "CAPTURADO", "FINALIZADO"]
@@ -279,16 +248,19 @@ else:
     logo_img = load_logo(logo_url)
     
     # O carregamento de dados é feito na inicialização do script para evitar cache inconsistente
-    df_pedidos = carregar_dados_pedidos()
-    df_almoxarifado = carregar_dados_almoxarifado()
+    try:
+        df_pedidos = carregar_dados_pedidos()
+        df_almoxarifado = carregar_dados_almoxarifado()
+
+        # Carrega dados dos solicitantes de forma separada
+        df_solicitantes = carregar_dados_solicitantes()
+    except FalhaPlanilha as e:
+        exibir_falha(e)
 
     if 'df_pedidos' not in st.session_state:
         st.session_state.df_pedidos = df_pedidos
     if 'df_almoxarifado' not in st.session_state:
         st.session_state.df_almoxarifado = df_almoxarifado
-    
-    # Carrega dados dos solicitantes de forma separada
-    df_solicitantes = carregar_dados_solicitantes()
 
     if logo_img:
         st.sidebar.image(logo_img, use_container_width=True)
@@ -362,24 +334,18 @@ else:
                             valor_total_float = float(valor_total_nf.replace(".", "").replace(",", "."))
                             valor_frete_float = float(valor_frete_nf.replace(".", "").replace(",", "."))
                             
-                            # Adicionado a busca para garantir que a OC exista na planilha de pedidos
-                            if 'ORDEM_COMPRA' in st.session_state.df_pedidos.columns:
-                                # Encontra as linhas na planilha de pedidos com a OC informada
-                                pedidos_relacionados = st.session_state.df_pedidos[
-                                    st.session_state.df_pedidos['ORDEM_COMPRA'].astype(str).str.strip().str.upper() == ordem_compra_nf.strip().upper()
-                                ]
-                                
-                                if not pedidos_relacionados.empty:
-                                    # Atualiza o status, a data de entrega e o doc da NF para todos os pedidos com essa OC
-                                    indices_a_atualizar = pedidos_relacionados.index
-                                    st.session_state.df_pedidos.loc[indices_a_atualizar, 'STATUS_PEDIDO'] = 'ENTREGUE'
-                                    st.session_state.df_pedidos.loc[indices_a_atualizar, 'DATA_ENTREGA'] = pd.to_datetime(data_recebimento)
-                                    st.session_state.df_pedidos.loc[indices_a_atualizar, 'DOC NF'] = doc_nf_link
-
-                                    # Salva as alterações na planilha de pedidos
-                                    salvar_dados_pedidos(st.session_state.df_pedidos)
-                                else:
-                                    st.warning(f"ℹ️ A Ordem de Compra '{ordem_compra_nf}' não foi encontrada na planilha de pedidos. O status não foi atualizado.")
+                            # Busca a OC nos pedidos carregados nesta execução
+                            indices_a_atualizar = indexar_ordens_compra(df_pedidos).get(normalizar_ordem_compra(ordem_compra_nf), [])
+
+                            if indices_a_atualizar:
+                                # Atualiza o status, a data de entrega e o doc da NF para todos os pedidos com essa OC
+                                if marcar_pedidos_entregues(df_pedidos.loc[indices_a_atualizar, COLUNA_ID], data_recebimento, doc_nf_link):
+                                    df_pedidos.loc[indices_a_atualizar, 'STATUS_PEDIDO'] = 'ENTREGUE'
+                                    df_pedidos.loc[indices_a_atualizar, 'DATA_ENTREGA'] = pd.to_datetime(data_recebimento)
+                                    df_pedidos.loc[indices_a_atualizar, 'DOC NF'] = doc_nf_link
+                                    st.session_state.df_pedidos = df_pedidos
+                            else:
+                                st.warning(f"ℹ️ A Ordem de Compra '{ordem_compra_nf}' não foi encontrada na planilha de pedidos. O status não foi atualizado.")
                             
                             novo_registro_nf = {
                                 "DATA": pd.to_datetime(data_recebimento),
@@ -399,9 +365,10 @@ else:
                                 "ORDEM_COMPRA": ordem_compra_nf,
                                 "REGISTRO_ENVIO": datetime.datetime.now() # NOVO CAMPO: Registra a data e hora do envio
                             }
-                            st.session_state.df_almoxarifado = pd.concat([st.session_state.df_almoxarifado, pd.DataFrame([novo_registro_nf])], ignore_index=True)
+                            df_nova_nf = com_ids(pd.DataFrame([novo_registro_nf]))
                             
-                            if salvar_dados_almoxarifado(st.session_state.df_almoxarifado):
+                            if anexar_nf_almoxarifado(df_nova_nf):
+                                st.session_state.df_almoxarifado = pd.concat([st.session_state.df_almoxarifado, df_nova_nf], ignore_index=True)
                                 st.success(f"🎉 Nota fiscal {nf_numero} registrada com sucesso!")
                             else:
                                 st.error("Erro ao salvar os dados da nota fiscal.")
@@ -424,7 +391,8 @@ else:
                         "DOC NF",
                         help="Clique para abrir a nota fiscal.",
                         display_text="📥 Abrir NF"
-                    )
+                    ),
+                    COLUNA_ID: None
                 }
             )
         else:
@@ -603,10 +571,23 @@ else:
             st.info("**Informações do Sistema**")
             st.write(f"Total de notas cadastradas: **{len(df)}**")
             st.write(f"Última atualização: **{datetime.datetime.now().strftime('%d/%m/%Y %H:%M')}**")
+            revisao = metricas_revisao()
+            st.write(f"Cargas reaproveitadas: **{revisao['acertos']}** de **{revisao['acertos'] + revisao['faltas']}**")
+            leituras = metricas_leituras()
+            st.write(f"Leituras compartilhadas entre sessões: **{leituras['compartilhadas']}** de **{leituras['leituras'] + leituras['compartilhadas']}**")
+            for api, chamadas in metricas_chamadas().items():
+                st.write(
+                    f"{api}: **{chamadas['chamadas']}** chamadas, {chamadas['repeticoes']} repetições, "
+                    f"{chamadas['falhas']} falhas, {chamadas['espera_cota']:.1f}s na fila da cota"
+                )
             
             if st.button("🔄 Recarregar Dados"):
-                st.session_state.df_pedidos = carregar_dados_pedidos()
-                st.session_state.df_almoxarifado = carregar_dados_almoxarifado()
+                limpar_cargas(_ler_pedidos, _ler_almoxarifado)
+                try:
+                    st.session_state.df_pedidos = carregar_dados_pedidos()
+                    st.session_state.df_almoxarifado = carregar_dados_almoxarifado()
+                except FalhaPlanilha as e:
+                    exibir_falha(e)
                 st.success("Dados recarregados com sucesso!")
                 st.rerun()
         
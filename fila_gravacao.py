@@ -0,0 +1,115 @@
+"""
+Fila de gravação em segundo plano (write-behind) para os painéis que salvam a cada edição.
+
+As alterações de um conjunto de dados ({ID: {coluna: valor}}) são acumuladas por uma
+janela curta, contada a partir da primeira alteração pendente; alterações repetidas da
+mesma célula ficam só com o último valor. Ao fim da janela, uma thread do processo grava o
+lote inteiro de uma vez (por exemplo, com planilhas.gravar_celulas, numa única escrita por
+diferença), e a página não espera pela gravação: mostra o `estado()` da fila.
+
+Uma fila é do conjunto de dados, não da sessão: as páginas a criam com st.cache_resource.
+A função de gravação roda fora da execução da página e não deve usar o st.session_state,
+o st.secrets nem o st.cache_resource: o que ela usa (o handle da aba, por exemplo) é
+resolvido por quem cria a fila, como o planilhas.destino_gravacao.
+
+Se a gravação falhar, o lote volta para a fila (sem passar por cima de alterações mais
+novas) e é tentado de novo com espera crescente. Células de IDs ou colunas que não existem
+mais na aba não se resolvem tentando de novo: a função de gravação deve gravar o resto e
+levantar um KeyError com o atributo `ignoradas` ({ID: {coluna: valor}} que ficaram de
+fora), como planilhas.CelulasIgnoradas; o lote conta como gravado e o estado mostra o que
+foi ignorado. Um KeyError sem `ignoradas` não diz o que ficou de fora: é tratado como as
+outras falhas, e o lote volta inteiro para a fila.
+"""
+import datetime
+import threading
+import time
+
+JANELA_PADRAO = 2.0
+ESPERA_MAXIMA = 60.0
+
+
+class FilaGravacao:
+    def __init__(self, gravar, janela=JANELA_PADRAO, nome="fila-gravacao"):
+        self._gravar = gravar
+        self.janela = janela
+        self._condicao = threading.Condition()
+        self._pendentes = {}
+        self._prazo = None
+        self._gravando = False
+        self._falhas_seguidas = 0
+        self._ultima_gravacao = None
+        self._erro = None
+        self._thread = threading.Thread(target=self._trabalhar, name=nome, daemon=True)
+        self._thread.start()
+
+    def enfileirar(self, alteracoes):
+        """Acrescenta as alterações {ID: {coluna: valor}}, que valem sobre as pendentes da mesma célula."""
+        if not alteracoes:
+            return
+        with self._condicao:
+            for id_, valores in alteracoes.items():
+                self._pendentes.setdefault(id_, {}).update(valores)
+            if self._prazo is None:
+                self._prazo = time.monotonic() + self.janela
+            self._condicao.notify_all()
+
+    def descarregar(self, timeout=None):
+        """
+        Grava já o que estiver pendente, sem esperar a janela, e espera terminar. Retorna
+        True se a fila ficou vazia dentro do `timeout`.
+        """
+        with self._condicao:
+            if self._pendentes:
+                self._prazo = time.monotonic()
+                self._condicao.notify_all()
+            return self._condicao.wait_for(lambda: not self._pendentes and not self._gravando, timeout)
+
+    def estado(self):
+        """
+        {"pendentes": células esperando, "gravando": bool, "ultima_gravacao": datetime ou
+        None, "erro": mensagem da última falha ou None}.
+        """
+        with self._condicao:
+            return {
+                "pendentes": sum(len(valores) for valores in self._pendentes.values()),
+                "gravando": self._gravando,
+                "ultima_gravacao": self._ultima_gravacao,
+                "erro": str(self._erro) if self._erro is not None else None,
+            }
+
+    def _proximo_lote(self):
+        with self._condicao:
+            while True:
+                if self._pendentes:
+                    restante = self._prazo - time.monotonic()
+                    if restante <= 0:
+                        break
+                    self._condicao.wait(restante)
+                else:
+                    self._condicao.wait()
+            lote, self._pendentes, self._prazo = self._pendentes, {}, None
+            self._gravando = True
+            return lote
+
+    def _trabalhar(self):
+        while True:
+            lote = self._proximo_lote()
+            try:
+                self._gravar(lote)
+                erro = None
+            except Exception as e:
+                erro = e
+            with self._condicao:
+                self._gravando = False
+                self._erro = erro
+                # Com `ignoradas`, só elas ficaram de fora: o resto do lote foi gravado
+                if erro is None or getattr(erro, "ignoradas", None) is not None:
+                    self._falhas_seguidas = 0
+                    self._ultima_gravacao = datetime.datetime.now()
+                else:
+                    self._falhas_seguidas += 1
+                    for id_, valores in lote.items():
+                        self._pendentes[id_] = {**valores, **self._pendentes.get(id_, {})}
+                    espera = min(self.janela * 2 ** self._falhas_seguidas, ESPERA_MAXIMA)
+                    self._prazo = time.monotonic() + espera
+                self._condicao.notify_all()
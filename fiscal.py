@@ -9,10 +9,10 @@ from plotly.subplots import make_subplots
 import requests
 from PIL import Image
 from io import BytesIO
-import gspread
-from gspread_dataframe import set_with_dataframe
-from google.oauth2.service_account import Credentials
-import json
+from planilhas import COLUNA_ID, ler_aba, garantir_ids, gravar_celulas, destino_gravacao, FalhaPlanilha, exibir_falha
+from esquemas import ALMOXARIFADO
+from armazem_local import diferencas
+from fila_gravacao import FilaGravacao
 
 # Configuração da página com layout wide
 st.set_page_config(page_title="Painel Financeiro - Almoxarifado", layout="wide", page_icon="💼")
@@ -101,144 +101,91 @@ def load_logo(url: str):
 logo_url = "http://nfeviasolo.com.br/portal2/imagens/Logo%20Essencis%20MG%20-%20branca.png"
 logo_img = load_logo(logo_url)
 
-# --- FUNÇÕES DE CONEXÃO E CARREGAMENTO DA PLANILHA ---
-@st.cache_resource(show_spinner=False)
-def get_gspread_client():
-    """Conecta com o Google Sheets usando os secrets do Streamlit."""
-    scopes = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-    credentials_info = st.secrets["gcp_service_account"]
-    
-    if isinstance(credentials_info, str):
-        try:
-            credentials_info = json.loads(credentials_info)
-        except json.JSONDecodeError as e:
-            st.error(f"Erro ao decodificar as credenciais JSON: {e}. Verifique a formatação do secrets.toml.")
-            return None
-    
-    creds = Credentials.from_service_account_info(credentials_info, scopes=scopes)
-    client = gspread.authorize(creds)
-    return client
+# --- FUNÇÕES DE CARREGAMENTO DA PLANILHA ---
+# Colunas do painel fiscal, na ordem de exibição. Os nomes são os apelidos do esquema do
+# almoxarifado (ex.: V_TOTAL_NF para "V. TOTAL NF"), e DIAS_VENCIMENTO é calculada.
+COLUNAS_FISCAL = [
+    "DATA", "FORNECEDOR", "NF", "ORDEM_COMPRA", "V_TOTAL_NF", "VENCIMENTO", "DIAS_VENCIMENTO",
+    "STATUS", "CONDICAO_PROBLEMA", "REGISTRO_ADICIONAL", "VALOR_JUROS", "VALOR_FRETE",
+    "DOC_NF", "RECEBEDOR"
+]
 
 def _to_datetime(series):
     """Converte para datetime com dayfirst, tolerante a strings, date e NaT."""
     return pd.to_datetime(series, errors="coerce", dayfirst=True)
 
+def _dataframe_fiscal_vazio():
+    return ALMOXARIFADO.vazio(apelidos=True).reindex(columns=COLUNAS_FISCAL + [COLUNA_ID])
+
 def carregar_dados() -> pd.DataFrame:
     """
     Carrega os dados da aba 'Almoxarifado' da planilha 'dados_pedido' do Google Sheets
-    e prepara para o painel fiscal.
+    e prepara para o painel fiscal. Levanta FalhaPlanilha se a planilha não puder ser lida:
+    um DataFrame vazio, salvo depois, apagaria a aba.
     """
-    try:
-        client = get_gspread_client()
-        sheet = client.open("dados_pedido")
-        worksheet = sheet.worksheet("Almoxarifado")
-
-        df = pd.DataFrame(worksheet.get_all_records())
-
-        if df.empty or all(pd.Series(df.columns).isnull()):
-            st.warning("A planilha existe, mas está vazia. Adicione dados pelo Painel do Almoxarifado.")
-            return pd.DataFrame(columns=[
-                "DATA", "FORNECEDOR", "NF", "ORDEM_COMPRA", "V_TOTAL_NF", "STATUS",
-                "CONDICAO_PROBLEMA", "REGISTRO_ADICIONAL", "VALOR_JUROS", "VALOR_FRETE",
-                "DOC_NF", "RECEBEDOR", "VENCIMENTO", "DIAS_VENCIMENTO"
-            ])
-
-        # Padroniza os nomes das colunas de forma mais robusta
-        df.columns = df.columns.str.strip().str.upper().str.replace('.', '').str.replace(' ', '_').str.replace('/', '_')
-
-        # Renomeia com um mapeamento explícito para garantir nomes internos consistentes
-        df = df.rename(columns={
-            'STATUS_FINANCEIRO': 'STATUS',
-            'OBSERVACAO': 'REGISTRO_ADICIONAL',
-            'FORNECEDOR_NF': 'FORNECEDOR',
-            'V_TOTAL_NF': 'V_TOTAL_NF', 
-            'DOC_NF': 'DOC_NF',
-        }, errors='ignore')
-
-        # --- NOVA CORREÇÃO AQUI: Remove colunas duplicadas ou indesejadas
-        df = df.loc[:,~df.columns.duplicated()]
-        
-        # Define a lista final de colunas na ordem desejada
-        colunas_finais = [
-            "DATA", "FORNECEDOR", "NF", "ORDEM_COMPRA", "V_TOTAL_NF", "VENCIMENTO", "DIAS_VENCIMENTO",
-            "STATUS", "CONDICAO_PROBLEMA", "REGISTRO_ADICIONAL", "VALOR_JUROS", "VALOR_FRETE",
-            "DOC_NF", "RECEBEDOR"
-        ]
-        
-        # Garante que as colunas existam antes de reindexar
-        for col in colunas_finais:
-            if col not in df.columns:
-                df[col] = None
-        
-        # Reindexa para a ordem e colunas desejadas, eliminando o erro de duplicatas
-        df = df.reindex(columns=colunas_finais)
-        # --- FIM DA NOVA CORREÇÃO ---
-
-        # Remove linhas totalmente vazias, apara espaços
-        df = df.dropna(how='all')
-        if not df.empty:
-            df = df.applymap(lambda x: x.strip() if isinstance(x, str) else x)
+    # Datas e valores já vêm convertidos da leitura, com os tipos do esquema da aba
+    df = ler_aba("Almoxarifado", titulo="dados_pedido", tipos=ALMOXARIFADO.tipos)
 
-        # Tipos numéricos
-        for c in ["V_TOTAL_NF", "VALOR_JUROS", "VALOR_FRETE"]:
-            df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0.0)
+    if df.empty or all(pd.Series(df.columns).isnull()):
+        st.warning("A planilha existe, mas está vazia. Adicione dados pelo Painel do Almoxarifado.")
+        return _dataframe_fiscal_vazio()
 
-        # Datas
-        df["DATA"] = _to_datetime(df["DATA"])
-        df["VENCIMENTO"] = _to_datetime(df["VENCIMENTO"])
+    # O ID estável da linha identifica as células gravadas pela fila (e é o índice)
+    df = garantir_ids(df, "Almoxarifado", titulo="dados_pedido")
 
-        # DIAS_VENCIMENTO (robusto)
-        ref = pd.Timestamp.today().normalize()
-        df["DIAS_VENCIMENTO"] = (df["VENCIMENTO"] - ref).dt.days.fillna(0).astype(int)
+    # Troca os nomes da planilha pelos apelidos do painel e completa as colunas que faltam
+    df = ALMOXARIFADO.preparar(df, apelidos=True)
+    df = df.reindex(columns=COLUNAS_FISCAL + [COLUNA_ID])
+    df = df.set_index(df[COLUNA_ID].astype(str), drop=False).rename_axis(None)
 
-        return df
+    # Remove linhas totalmente vazias, apara espaços
+    df = df.dropna(how='all', subset=COLUNAS_FISCAL)
+    for coluna in df.select_dtypes(include=["object", "string"]).columns:
+        df[coluna] = df[coluna].map(lambda x: x.strip() if isinstance(x, str) else x)
 
-    except Exception as e:
-        st.error(f"Erro ao carregar dados da planilha. Verifique nome/aba/credenciais. Detalhe: {e}")
-        return pd.DataFrame(columns=[
-            "DATA","FORNECEDOR","NF","ORDEM_COMPRA","V_TOTAL_NF","STATUS",
-            "CONDICAO_PROBLEMA","REGISTRO_ADICIONAL","VALOR_JUROS","VALOR_FRETE",
-            "DOC_NF","RECEBEDOR","VENCIMENTO","DIAS_VENCIMENTO"
-        ])
-
-def salvar_dados(df: pd.DataFrame) -> bool:
-    """Salva o DataFrame na aba 'Almoxarifado' do Google Sheets."""
+    # DIAS_VENCIMENTO (robusto)
+    ref = pd.Timestamp.today().normalize()
+    df["DIAS_VENCIMENTO"] = (df["VENCIMENTO"] - ref).dt.days.fillna(0).astype(int)
+
+    return df
+
+@st.cache_resource
+def obter_fila():
+    """
+    Fila de gravação da aba 'Almoxarifado', comum a todas as sessões (ver fila_gravacao.py).
+    O destino é resolvido aqui, na execução da página: a thread da fila só usa ele.
+    """
+    destino = destino_gravacao("Almoxarifado", titulo="dados_pedido")
+    return FilaGravacao(lambda alteracoes: gravar_celulas(alteracoes, destino), nome="fila-almoxarifado")
+
+def _serializar(df):
+    # Remove colunas de cálculo, volta aos nomes da planilha e formata as datas
+    return ALMOXARIFADO.serializar(df.drop(columns=["DIAS_VENCIMENTO"], errors="ignore"), apelidos=True)
+
+def salvar_dados(antes: pd.DataFrame, depois: pd.DataFrame) -> bool:
+    """
+    Enfileira para gravação na aba 'Almoxarifado' só as células de `depois` que diferem
+    de `antes` (mesmas linhas, indexadas pelo ID). A fila grava em segundo plano, numa
+    única escrita por diferença, sem reescrever a aba inteira.
+    """
     try:
-        client = get_gspread_client()
-        sheet = client.open("dados_pedido")
-        worksheet = sheet.worksheet("Almoxarifado")
-
-        df_to_save = df.copy()
-
-        # Garante tipos antes de formatar
-        df_to_save["DATA"] = _to_datetime(df_to_save["DATA"])
-        df_to_save["VENCIMENTO"] = _to_datetime(df_to_save["VENCIMENTO"])
-
-        # Mapeia para nomes da planilha
-        df_to_save = df_to_save.rename(columns={
-            "STATUS": "STATUS_FINANCEIRO",
-            "REGISTRO_ADICIONAL": "OBSERVACAO",
-            "V_TOTAL_NF": "V. TOTAL NF",
-            "DOC_NF": "DOC NF",
-            "FORNECEDOR": "FORNECEDOR_NF"
-        })
-
-        # Formata datas como string dd/mm/yyyy
-        if "DATA" in df_to_save.columns:
-            df_to_save["DATA"] = df_to_save["DATA"].dt.strftime("%d/%m/%Y")
-        if "VENCIMENTO" in df_to_save.columns:
-            df_to_save["VENCIMENTO"] = df_to_save["VENCIMENTO"].dt.strftime("%d/%m/%Y")
-
-        # Remove colunas de cálculo antes de salvar
-        df_to_save = df_to_save.drop(columns=["DIAS_VENCIMENTO"], errors="ignore")
-
-        # Escreve a partir de A1 (não limpa sobra; seguro contra perdas)
-        set_with_dataframe(worksheet, df_to_save, include_index=False, resize=True)
+        obter_fila().enfileirar(diferencas(_serializar(antes), _serializar(depois)))
         return True
     except Exception as e:
         st.error(f"Erro ao salvar dados na planilha: {e}")
         return False
 
+@st.fragment(run_every=2)
+def indicador_gravacao():
+    """Estado da fila de gravação, atualizado sozinho enquanto a página está aberta."""
+    estado = obter_fila().estado()
+    if estado["erro"]:
+        st.error(f"Falha ao salvar: {estado['erro']}")
+    elif estado["pendentes"] or estado["gravando"]:
+        st.warning(f"⏳ Salvando alterações ({estado['pendentes']} pendentes)")
+    elif estado["ultima_gravacao"]:
+        st.info(f"✅ Salvo às {estado['ultima_gravacao'].strftime('%H:%M:%S')}")
+
 # --- Lógica de Login (UNIFICADA) ---
 USERS = {
     "eassis@essencis.com.br": {"password": "Essencis01", "name": "EVIANE DAS GRACAS DE ASSIS"},
@@ -269,12 +216,10 @@ if 'logado' not in st.session_state or not st.session_state.logado:
             fazer_login(email, senha)
 else:
     if 'df' not in st.session_state:
-        st.session_state.df = carregar_dados()
-
-    if 'ultimo_salvamento' not in st.session_state:
-        st.session_state.ultimo_salvamento = None
-    if 'alteracoes_pendentes' not in st.session_state:
-        st.session_state.alteracoes_pendentes = False
+        try:
+            st.session_state.df = carregar_dados()
+        except FalhaPlanilha as e:
+            exibir_falha(e)
 
     df = st.session_state.df
 
@@ -351,21 +296,22 @@ else:
         col1, col2, col3, col4 = st.columns(4)
         with col1:
             if st.button("💾 Salvar Tudo", use_container_width=True):
-                if salvar_dados(df):
-                    st.session_state.ultimo_salvamento = datetime.datetime.now()
-                    st.session_state.alteracoes_pendentes = False
+                # As alterações já estão na fila: grava agora, sem esperar a janela
+                if obter_fila().descarregar(timeout=30) and not obter_fila().estado()["erro"]:
                     st.success("Dados salvos com sucesso!")
-                    time.sleep(1)
-                    st.rerun()
+                else:
+                    st.warning("Nem todas as alterações foram salvas ainda. Veja o estado ao lado.")
         with col2:
             if st.button("🔄 Recarregar", use_container_width=True):
-                st.session_state.df = carregar_dados()
+                try:
+                    # Grava o que estiver na fila antes, para a recarga já vir com as alterações
+                    obter_fila().descarregar(timeout=30)
+                    st.session_state.df = carregar_dados()
+                except FalhaPlanilha as e:
+                    exibir_falha(e)
                 st.rerun()
         with col4:
-            if st.session_state.ultimo_salvamento:
-                st.info(f"Último save: {st.session_state.ultimo_salvamento.strftime('%H:%M:%S')}")
-            elif st.session_state.alteracoes_pendentes:
-                st.warning("Alterações não salvas")
+            indicador_gravacao()
 
         if not df.empty:
             df_filtrado = df.copy()
@@ -470,10 +416,8 @@ else:
             )
             # --- FIM DA CORREÇÃO ---
 
-            # Se houve alteração, salva automaticamente de forma segura
+            # Se houve alteração, enfileira as células alteradas para a gravação em segundo plano
             if not edited_df.equals(df_display):
-                st.session_state.alteracoes_pendentes = True
-
                 # Normaliza tipos antes de salvar
                 edited_df["DATA"] = _to_datetime(edited_df["DATA"])
                 edited_df["VENCIMENTO"] = _to_datetime(edited_df["VENCIMENTO"])
@@ -491,13 +435,14 @@ else:
                 edited_df.drop(columns=['STATUS_VISUAL', 'DIAS_VENCIMENTO_VISUAL', 'PROBLEMA_VISUAL'], inplace=True, errors='ignore')
                 # --- FIM DA CORREÇÃO ---
                 
-                st.session_state.df = edited_df.copy()
-
-                if salvar_dados(st.session_state.df):
-                    st.session_state.ultimo_salvamento = datetime.datetime.now()
-                    st.session_state.alteracoes_pendentes = False
-                    st.success("Alterações salvas com sucesso!")
-                    time.sleep(1)
+                # Só as linhas exibidas (filtradas) mudam; as demais continuam como estão
+                df_atual = st.session_state.df
+                antes = df_atual.loc[edited_df.index]
+                st.session_state.df = pd.concat(
+                    [df_atual.drop(index=edited_df.index), edited_df[df_atual.columns]]
+                ).loc[df_atual.index]
+
+                if salvar_dados(antes, edited_df[df_atual.columns]):
                     st.rerun()
         else:
             st.info("📝 Nenhuma nota fiscal registrada no sistema. As notas cadastradas no Painel do Almoxarifado aparecerão aqui.")
@@ -530,16 +475,16 @@ else:
                             valor_juros = (row['V_TOTAL_NF'] * (taxa_juros / 100.0)) * dias_atraso
                             st.metric("Valor de Juros", f"R$ {valor_juros:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."))
                             if st.button("Aplicar Juros", key=f"apply_{idx}"):
+                                antes = df.loc[[idx]].copy()
                                 df.at[idx, 'VALOR_JUROS'] = float(valor_juros)
-                                st.session_state.alteracoes_pendentes = True
-                                st.success("Juros aplicados com sucesso!")
-                                time.sleep(1)
+                                salvar_dados(antes, df.loc[[idx]])
+                                # O toast continua na tela depois do rerun, sem segurar a página
+                                st.toast("Juros aplicados com sucesso!")
                                 st.rerun()
 
                 st.subheader("📈 Resumo de Juros Aplicados")
                 if "DATA" in df.columns:
                     base = df.copy()
-                    base["DATA"] = _to_datetime(base["DATA"])
                     juros_por_mes = base.groupby(base['DATA'].dt.to_period('M'))['VALOR_JUROS'].sum().reset_index()
                     juros_por_mes['DATA'] = juros_por_mes['DATA'].dt.to_timestamp()
 
@@ -567,8 +512,6 @@ else:
         st.header("📊 Dashboards Financeiros Completos")
 
         if not df.empty:
-            df["DATA"] = _to_datetime(df["DATA"])
-
             df['MES_ANO'] = df['DATA'].dt.to_period('M')
             df['ANO'] = df['DATA'].dt.year
             df['MES'] = df['DATA'].dt.month
@@ -664,13 +607,17 @@ else:
 
         st.subheader("Manutenção de Dados")
         if st.button("🔄 Forçar Recarregamento de Dados"):
-            st.session_state.df = carregar_dados()
+            try:
+                obter_fila().descarregar(timeout=30)
+                st.session_state.df = carregar_dados()
+            except FalhaPlanilha as e:
+                exibir_falha(e)
             st.success("Cache limpo e dados recarregados com sucesso!")
             st.rerun()
 
         st.subheader("Exportação de Dados")
         if not df.empty:
-            csv = df.to_csv(index=False, encoding='utf-8')
+            csv = df.drop(columns=[COLUNA_ID], errors='ignore').to_csv(index=False, encoding='utf-8')
             st.download_button(
                 label="⬇️ Download CSV",
                 data=csv,
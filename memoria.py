@@ -0,0 +1,663 @@
+"""
+Planilhas em memória no lugar do Google Sheets, para testes e benchmarks.
+
+Implementa a parte do gspread que os painéis usam (Client.open/open_by_key/create,
+Spreadsheet.worksheets/get_worksheet/worksheet/add_worksheet/values_batch_get/batch_update,
+Worksheet.get_all_values/get_all_records/update/batch_update/append_rows/clear...) sobre
+grades de texto guardadas no processo. Ligada no secrets.toml, vale para todos os painéis:
+
+    [memoria]
+    ativa = true
+    pasta = "dados_memoria"          # opcional: abas iniciais, em <pasta>/<sheet_id ou título>/<n>_<aba>.csv
+    latencia = 0.2                   # segundos somados a cada chamada
+    latencia_por_mil_celulas = 0.01  # segundos somados por mil células lidas ou gravadas
+    taxa_erro_cota = 0.05            # fração das chamadas que falham com 429
+    cota_leitura = 60                # leituras por minuto antes de responder 429 (0 = sem limite)
+    cota_escrita = 60                # escritas por minuto, idem
+    limite_celulas = 10000000        # células por planilha, como no Sheets (0 = sem limite)
+    semente = 1                      # torna a injeção de erros reproduzível
+
+Planilhas e abas que não existem são criadas vazias quando abertas, e tudo some quando o
+processo termina. Os erros injetados saem como gspread.exceptions.APIError com o código da
+API, sem as repetições do transporte: é o que as páginas recebem quando elas se esgotam.
+O Drive e o Gmail do reembolso (anexos e e-mails) continuam indo para o Google.
+
+Nos scripts (benchmarks), `ativar(config)` liga o modo sem precisar do secrets.toml.
+"""
+import csv
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+
+import gspread
+import requests
+import streamlit as st
+from gspread.utils import a1_range_to_grid_range, fill_gaps, numericise_all, rowcol_to_a1, to_records
+
+from comum import aparar, texto_celula
+from transporte import _registrar_chamada
+
+CONFIG_PADRAO = {
+    "pasta": None,
+    "latencia": 0.0,
+    "latencia_por_mil_celulas": 0.0,
+    "taxa_erro_cota": 0.0,
+    "cota_leitura": 0,
+    "cota_escrita": 0,
+    "limite_celulas": 10_000_000,
+    "semente": None,
+}
+
+# Tamanho de uma aba nova quando não informado, como no Sheets
+LINHAS_PADRAO = 1000
+COLUNAS_PADRAO = 26
+
+_CATEGORIAS = {"leitura": "leitura_planilhas", "escrita": "escrita_planilhas", "drive": "drive"}
+
+_forcada = None
+
+
+def ativar(config=None):
+    """Liga as planilhas em memória no processo, com `config` no lugar da seção [memoria]."""
+    global _forcada
+    _forcada = {**(config or {}), "ativa": True}
+
+
+def configuracao_memoria():
+    """Seção [memoria] do secrets.toml (ou a configuração passada a `ativar`)."""
+    if _forcada is not None:
+        return dict(_forcada)
+    return dict(st.secrets.get("memoria", {}))
+
+
+def memoria_ativa():
+    return bool(configuracao_memoria().get("ativa", False))
+
+
+def erro_api(codigo, mensagem):
+    """APIError do gspread como o que vem de uma resposta de erro da API."""
+    resposta = requests.Response()
+    resposta.status_code = codigo
+    resposta._content = json.dumps({"error": {"code": codigo, "message": mensagem}}).encode("utf-8")
+    return gspread.exceptions.APIError(resposta)
+
+
+def _linhas_usadas(linhas):
+    """Número de linhas até a última com algum valor (onde o append começa a gravar)."""
+    for posicao in range(len(linhas) - 1, -1, -1):
+        if any(valor != '' for valor in linhas[posicao]):
+            return posicao + 1
+    return 0
+
+
+def _separar_intervalo(intervalo):
+    """'Aba'!A1:B2 -> ("Aba", "A1:B2"); sem o nome da aba, (None, intervalo)."""
+    correspondencia = re.match(r"^'((?:[^']|'')*)'(?:!(.*))?$", intervalo)
+    if correspondencia:
+        return correspondencia.group(1).replace("''", "'"), correspondencia.group(2) or ""
+    if "!" in intervalo:
+        aba, a1 = intervalo.split("!", 1)
+        return aba, a1
+    return None, intervalo
+
+
+class ClienteMemoria:
+    """Substituto do gspread.Client: planilhas guardadas no processo, por ID."""
+
+    def __init__(self, config=None):
+        self.config = {**CONFIG_PADRAO, **(config or {})}
+        self.planilhas = {}
+        # Todo acesso às grades acontece dentro do `lock`; as chamadas que só leem entram
+        # por `leitura`, que aqui é o mesmo lock (no banco_local, transação sem reserva)
+        self.lock = threading.RLock()
+        self.leitura = self.lock
+        self._lock_cota = threading.Lock()
+        self._aleatorio = random.Random(self.config["semente"])
+        self._janelas = {"leitura": deque(), "escrita": deque()}
+        self._falhas = deque()
+
+    # --- Latência e erros injetados ---
+
+    def injetar_falhas(self, quantidade=1, codigo=429):
+        """As próximas `quantidade` chamadas falham com `codigo`."""
+        with self._lock_cota:
+            self._falhas.extend([codigo] * quantidade)
+
+    def chamada(self, tipo, celulas=0):
+        """
+        Conta uma chamada à API ("leitura", "escrita" ou "drive"): falha se houver erro
+        injetado ou cota estourada e, senão, espera a latência configurada.
+        """
+        inicio = time.monotonic()
+        categoria = _CATEGORIAS[tipo]
+        with self._lock_cota:
+            codigo = self._falhas.popleft() if self._falhas else None
+            janela = self._janelas.get(tipo)
+            cota = self.config.get(f"cota_{tipo}", 0)
+            if codigo is None and janela is not None and cota:
+                while janela and inicio - janela[0] > 60:
+                    janela.popleft()
+                if len(janela) >= cota:
+                    codigo = 429
+            if codigo is None and self._aleatorio.random() < self.config["taxa_erro_cota"]:
+                codigo = 429
+            if codigo is None and janela is not None:
+                janela.append(inicio)
+        if codigo is not None:
+            _registrar_chamada(categoria, 0.0, 0.0, 0, True)
+            raise erro_api(codigo, f"Erro injetado pelas planilhas em memória ({tipo})")
+
+        espera = self.config["latencia"] + celulas / 1000 * self.config["latencia_por_mil_celulas"]
+        if espera:
+            time.sleep(espera)
+        _registrar_chamada(categoria, time.monotonic() - inicio, 0.0, 0, False)
+
+    # --- Armazenamento das planilhas (substituído em banco_local.py) ---
+
+    def _planilha(self, chave):
+        return self.planilhas.get(chave)
+
+    def _planilha_por_titulo(self, titulo):
+        for planilha in self.planilhas.values():
+            if planilha.title == titulo:
+                return planilha
+        return None
+
+    def _nova_planilha(self, chave, titulo):
+        planilha = self.planilhas[chave] = PlanilhaMemoria(self, chave, titulo)
+        return planilha
+
+    def _remover_planilha(self, chave):
+        return self.planilhas.pop(chave, None) is not None
+
+    def _arquivos_iniciais(self, origem):
+        """[(título da aba, CSV)] com as abas iniciais da planilha, da `pasta` configurada."""
+        pasta = self.config["pasta"]
+        diretorio = Path(pasta) / origem if pasta and origem else None
+        if diretorio is None or not diretorio.is_dir():
+            return []
+        return [(re.sub(r"^\d+_", "", arquivo.stem), arquivo) for arquivo in sorted(diretorio.glob("*.csv"))]
+
+    # --- Planilhas ---
+
+    def _criar(self, titulo, chave=None, origem=None):
+        planilha = self._nova_planilha(chave or uuid.uuid4().hex, titulo)
+        arquivos = self._arquivos_iniciais(origem)
+        for titulo_aba, arquivo in arquivos:
+            with open(arquivo, newline="", encoding="utf-8") as entrada:
+                linhas = list(csv.reader(entrada))
+            aba = planilha._nova_aba(
+                titulo_aba, max(len(linhas), LINHAS_PADRAO), max((len(linha) for linha in linhas), default=COLUNAS_PADRAO),
+            )
+            aba._gravar(0, linhas)
+        if not arquivos:
+            # Sem abas iniciais, as abas pedidas são criadas vazias
+            planilha.automatica = True
+            planilha._nova_aba("Página1", LINHAS_PADRAO, COLUNAS_PADRAO)
+        return planilha
+
+    def open_by_key(self, key):
+        self.chamada("drive")
+        with self.leitura:
+            planilha = self._planilha(key)
+        if planilha is not None:
+            return planilha
+        with self.lock:
+            return self._planilha(key) or self._criar(key, chave=key, origem=key)
+
+    def open(self, title, folder_id=None):
+        self.chamada("drive")
+        with self.leitura:
+            planilha = self._planilha_por_titulo(title)
+        if planilha is not None:
+            return planilha
+        with self.lock:
+            return self._planilha_por_titulo(title) or self._criar(title, origem=title)
+
+    def create(self, title, folder_id=None):
+        self.chamada("drive")
+        with self.lock:
+            planilha = self._criar(title)
+            planilha.automatica = False
+            return planilha
+
+    def del_spreadsheet(self, file_id):
+        self.chamada("drive")
+        with self.lock:
+            if not self._remover_planilha(file_id):
+                raise erro_api(404, f"File not found: {file_id}")
+
+    def versao(self, chave):
+        """Versão da planilha (muda a cada escrita), no lugar do files.get do Drive."""
+        self.chamada("drive")
+        with self.leitura:
+            planilha = self._planilha(chave) or self._criar(chave, chave=chave, origem=chave)
+            return str(planilha.versao)
+
+
+class PlanilhaMemoria:
+    """Substituto do gspread.Spreadsheet."""
+
+    def __init__(self, cliente, chave, titulo):
+        self.client = cliente
+        self.id = chave
+        self.title = titulo
+        self.automatica = False
+        self._versao = 1
+        self._lista = []
+        self._proximo_id = 0
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.title!r} id:{self.id}>"
+
+    # --- Armazenamento das abas (substituído em banco_local.py) ---
+
+    @property
+    def versao(self):
+        return self._versao
+
+    def _tocar(self):
+        self._versao += 1
+
+    @property
+    def abas(self):
+        return self._lista
+
+    def _guardar_aba(self, titulo, linhas, colunas, indice):
+        aba = AbaMemoria(self, self._proximo_id, titulo, linhas, colunas)
+        self._proximo_id += 1
+        self._lista.insert(len(self._lista) if indice is None else indice, aba)
+        return aba
+
+    def _remover_aba(self, aba):
+        self._lista.remove(aba)
+
+    # --- Abas ---
+
+    def _nova_aba(self, titulo, linhas, colunas, indice=None):
+        if any(aba.title == titulo for aba in self.abas):
+            raise erro_api(400, f'A sheet with the name "{titulo}" already exists.')
+        self._verificar_limite(linhas * colunas)
+        aba = self._guardar_aba(titulo, linhas, colunas, indice)
+        self._tocar()
+        return aba
+
+    def _verificar_limite(self, acrescimo):
+        limite = self.client.config["limite_celulas"]
+        total = sum(aba.row_count * aba.col_count for aba in self.abas) + acrescimo
+        if limite and total > limite:
+            raise erro_api(400, (
+                f"This action would increase the number of cells in the workbook above the limit of {limite} cells."
+            ))
+
+    def _aba(self, titulo):
+        for aba in self.abas:
+            if aba.title == titulo:
+                return aba
+        if self.automatica:
+            return self._nova_aba(titulo, LINHAS_PADRAO, COLUNAS_PADRAO)
+        raise gspread.exceptions.WorksheetNotFound(titulo)
+
+    def _aba_por_id(self, id_aba):
+        for aba in self.abas:
+            if aba.id == id_aba:
+                return aba
+        raise erro_api(400, f"No grid with id: {id_aba}")
+
+    @property
+    def sheet1(self):
+        return self.get_worksheet(0)
+
+    def worksheets(self, exclude_hidden=False):
+        self.client.chamada("leitura")
+        with self.client.leitura:
+            return list(self.abas)
+
+    def get_worksheet(self, index):
+        self.client.chamada("leitura")
+        with self.client.leitura:
+            abas = self.abas
+            if index < len(abas) or not self.automatica:
+                return abas[index] if 0 <= index < len(abas) else None
+        # A aba ainda não existe e vai ser criada: só então a transação de escrita
+        with self.client.lock:
+            while self.automatica and index >= len(self.abas):
+                self._nova_aba(f"Página{len(self.abas) + 1}", LINHAS_PADRAO, COLUNAS_PADRAO)
+            abas = self.abas
+            return abas[index] if 0 <= index < len(abas) else None
+
+    def worksheet(self, title):
+        self.client.chamada("leitura")
+        with self.client.leitura:
+            for aba in self.abas:
+                if aba.title == title:
+                    return aba
+        with self.client.lock:
+            return self._aba(title)
+
+    def add_worksheet(self, title, rows, cols, index=None):
+        self.client.chamada("escrita")
+        with self.client.lock:
+            return self._nova_aba(title, int(rows), int(cols), index)
+
+    def del_worksheet(self, worksheet):
+        self.client.chamada("escrita")
+        with self.client.lock:
+            if len(self.abas) == 1:
+                raise erro_api(400, "You can't remove all the sheets in a document.")
+            self._remover_aba(self._aba_por_id(worksheet.id))
+            self._tocar()
+
+    def _resolver(self, intervalo):
+        titulo, a1 = _separar_intervalo(intervalo)
+        if titulo is None:
+            if any(aba.title == a1 for aba in self.abas):
+                titulo, a1 = a1, ""
+            else:
+                return self.abas[0], a1
+        return self._aba(titulo), a1
+
+    def values_get(self, range, params=None):
+        return self.values_batch_get([range], params)["valueRanges"][0]
+
+    def values_batch_get(self, ranges, params=None):
+        with self.client.leitura:
+            resultado, celulas = [], 0
+            for intervalo in ranges:
+                aba, a1 = self._resolver(intervalo)
+                valores = aba._ler(a1)
+                celulas += sum(len(linha) for linha in valores)
+                valor = {"range": intervalo, "majorDimension": "ROWS"}
+                if valores:
+                    valor["values"] = valores
+                resultado.append(valor)
+        self.client.chamada("leitura", celulas)
+        return {"spreadsheetId": self.id, "valueRanges": resultado}
+
+    def batch_update(self, body):
+        """Requisições de estrutura: deleteDimension, insertDimension e appendDimension (as de formato são aceitas e ignoradas)."""
+        self.client.chamada("escrita")
+        with self.client.lock:
+            respostas = []
+            for requisicao in body.get("requests", []):
+                if "deleteDimension" in requisicao:
+                    faixa = requisicao["deleteDimension"]["range"]
+                    self._aba_por_id(faixa["sheetId"])._apagar(faixa["dimension"], faixa["startIndex"], faixa["endIndex"])
+                elif "insertDimension" in requisicao:
+                    faixa = requisicao["insertDimension"]["range"]
+                    self._aba_por_id(faixa["sheetId"])._inserir(faixa["dimension"], faixa["startIndex"], faixa["endIndex"])
+                elif "appendDimension" in requisicao:
+                    pedido = requisicao["appendDimension"]
+                    aba = self._aba_por_id(pedido["sheetId"])
+                    total = aba.row_count if pedido["dimension"] == "ROWS" else aba.col_count
+                    aba._inserir(pedido["dimension"], total, total + pedido["length"])
+                respostas.append({})
+            self._tocar()
+        return {"spreadsheetId": self.id, "replies": respostas}
+
+
+class AbaMemoria:
+    """Substituto do gspread.Worksheet: a grade é uma lista de linhas de texto."""
+
+    def __init__(self, planilha, id_aba, titulo, linhas, colunas):
+        self.spreadsheet = planilha
+        self.client = planilha.client
+        self.id = id_aba
+        self.title = titulo
+        self.row_count = linhas
+        self.col_count = colunas
+        self.ocultas = set()
+        self._linhas = []
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.title!r} id:{self.id}>"
+
+    @property
+    def spreadsheet_id(self):
+        return self.spreadsheet.id
+
+    # --- Grade ---
+
+    def _faixa(self, a1):
+        """(linha_ini, linha_fim, col_ini, col_fim) 0-based e exclusivos, limitados à grade."""
+        grade = a1_range_to_grid_range(a1) if a1 else {}
+        return (
+            grade.get("startRowIndex", 0), min(grade.get("endRowIndex", self.row_count), self.row_count),
+            grade.get("startColumnIndex", 0), min(grade.get("endColumnIndex", self.col_count), self.col_count),
+        )
+
+    # --- Armazenamento da grade (substituído em banco_local.py) ---
+
+    def _trecho(self, inicio, fim):
+        """Linhas [inicio, fim) da grade; a lista pode ser mais curta quando as últimas estão vazias."""
+        return self._linhas[inicio:fim]
+
+    def _gravar(self, inicio, linhas):
+        """Substitui as linhas a partir de `inicio` pelas informadas."""
+        if len(self._linhas) < inicio + len(linhas):
+            self._linhas.extend([] for _ in range(inicio + len(linhas) - len(self._linhas)))
+        self._linhas[inicio:inicio + len(linhas)] = linhas
+
+    def _usadas(self):
+        return _linhas_usadas(self._linhas)
+
+    def _esvaziar(self):
+        self._linhas = []
+
+    def _ocultar(self, colunas):
+        self.ocultas.update(colunas)
+
+    def _apagar_linhas(self, inicio, fim):
+        del self._linhas[inicio:fim]
+
+    def _inserir_linhas(self, inicio, fim):
+        if inicio < len(self._linhas):
+            self._linhas[inicio:inicio] = [[] for _ in range(fim - inicio)]
+
+    def _apagar_colunas(self, inicio, fim):
+        for linha in self._linhas:
+            del linha[inicio:fim]
+
+    def _inserir_colunas(self, inicio, fim):
+        for linha in self._linhas:
+            if inicio < len(linha):
+                linha[inicio:inicio] = [''] * (fim - inicio)
+
+    # --- Operações sobre a grade ---
+
+    def _ler(self, a1=""):
+        linha_ini, linha_fim, col_ini, col_fim = self._faixa(a1)
+        return aparar([linha[col_ini:col_fim] for linha in self._trecho(linha_ini, linha_fim)])
+
+    def _escrever(self, linha_ini, col_ini, valores, value_input_option):
+        valores = [list(linha) for linha in valores]
+        altura = len(valores)
+        largura = max((len(linha) for linha in valores), default=0)
+        if linha_ini + altura > self.row_count or col_ini + largura > self.col_count:
+            fim = rowcol_to_a1(linha_ini + altura, col_ini + largura)
+            raise erro_api(400, (
+                f"Range ('{self.title}'!{fim}) exceeds grid limits. "
+                f"Max rows: {self.row_count}, max columns: {self.col_count}"
+            ))
+        atuais = self._trecho(linha_ini, linha_ini + altura)
+        novas = []
+        for deslocamento, valores_linha in enumerate(valores):
+            linha = list(atuais[deslocamento]) if deslocamento < len(atuais) else []
+            if len(linha) < col_ini + len(valores_linha):
+                linha.extend([''] * (col_ini + len(valores_linha) - len(linha)))
+            linha[col_ini:col_ini + len(valores_linha)] = [texto_celula(v, value_input_option) for v in valores_linha]
+            novas.append(linha)
+        self._gravar(linha_ini, novas)
+        return altura * largura
+
+    def _apagar(self, dimensao, inicio, fim):
+        if dimensao == "ROWS":
+            fim = min(fim, self.row_count)
+            self._apagar_linhas(inicio, fim)
+            self.row_count -= max(0, fim - inicio)
+        else:
+            fim = min(fim, self.col_count)
+            self._apagar_colunas(inicio, fim)
+            self.col_count -= max(0, fim - inicio)
+
+    def _inserir(self, dimensao, inicio, fim):
+        quantidade = fim - inicio
+        if dimensao == "ROWS":
+            self.spreadsheet._verificar_limite(quantidade * self.col_count)
+            self._inserir_linhas(inicio, fim)
+            self.row_count += quantidade
+        else:
+            self.spreadsheet._verificar_limite(quantidade * self.row_count)
+            self._inserir_colunas(inicio, fim)
+            self.col_count += quantidade
+
+    # --- Leitura ---
+
+    def get_all_values(self, range_name=None, **kwargs):
+        with self.client.leitura:
+            valores = self._ler(range_name or "")
+        self.client.chamada("leitura", sum(len(linha) for linha in valores))
+        return fill_gaps(valores) if valores else []
+
+    get_values = get_all_values
+
+    def get_all_records(self, head=1, expected_headers=None, value_render_option=None, default_blank='',
+                        numericise_ignore=(), allow_underscores_in_numeric_literals=False, empty2zero=False):
+        valores = self.get_all_values()
+        if len(valores) < head:
+            return []
+        cabecalho, linhas = valores[head - 1], valores[head:]
+        if list(numericise_ignore) != ["all"]:
+            linhas = [
+                numericise_all(linha, empty2zero, default_blank, allow_underscores_in_numeric_literals, list(numericise_ignore))
+                for linha in linhas
+            ]
+        return to_records(cabecalho, linhas)
+
+    def row_values(self, row, **kwargs):
+        with self.client.leitura:
+            valores = self._ler(f"{row}:{row}")
+        self.client.chamada("leitura", len(valores[0]) if valores else 0)
+        return valores[0] if valores else []
+
+    def col_values(self, col, **kwargs):
+        with self.client.leitura:
+            valores = [linha[col - 1] if len(linha) >= col else '' for linha in self._trecho(0, self.row_count)]
+            while valores and valores[-1] == '':
+                valores.pop()
+        self.client.chamada("leitura", len(valores))
+        return valores
+
+    # --- Escrita ---
+
+    def update(self, values=None, range_name=None, raw=True, major_dimension=None, value_input_option=None, **kwargs):
+        if isinstance(values, str):
+            # Ordem antiga dos argumentos: update(range_name, values)
+            values, range_name = range_name, values
+        if value_input_option is None:
+            value_input_option = 'RAW' if raw else 'USER_ENTERED'
+        if major_dimension == "COLUMNS":
+            values = [list(linha) for linha in zip(*values)]
+        linha_ini, _, col_ini, _ = self._faixa(_separar_intervalo(range_name or "A1")[1])
+        self.client.chamada("escrita", sum(len(linha) for linha in values))
+        with self.client.lock:
+            celulas = self._escrever(linha_ini, col_ini, values, value_input_option)
+            self.spreadsheet._tocar()
+        return {"spreadsheetId": self.spreadsheet.id, "updatedRange": range_name, "updatedCells": celulas}
+
+    def batch_update(self, data, raw=True, value_input_option=None, **kwargs):
+        if value_input_option is None:
+            value_input_option = 'RAW' if raw else 'USER_ENTERED'
+        data = list(data)
+        self.client.chamada("escrita", sum(len(linha) for bloco in data for linha in bloco["values"]))
+        with self.client.lock:
+            celulas = 0
+            for bloco in data:
+                linha_ini, _, col_ini, _ = self._faixa(_separar_intervalo(bloco["range"])[1])
+                celulas += self._escrever(linha_ini, col_ini, bloco["values"], value_input_option)
+            self.spreadsheet._tocar()
+        return {"spreadsheetId": self.spreadsheet.id, "totalUpdatedCells": celulas}
+
+    def update_cells(self, cell_list, value_input_option='RAW'):
+        self.client.chamada("escrita", len(cell_list))
+        with self.client.lock:
+            for celula in cell_list:
+                self._escrever(celula.row - 1, celula.col - 1, [[celula.value]], value_input_option)
+            self.spreadsheet._tocar()
+        return {"spreadsheetId": self.spreadsheet.id, "totalUpdatedCells": len(cell_list)}
+
+    def append_rows(self, values, value_input_option='RAW', insert_data_option=None, table_range=None, **kwargs):
+        """Grava as linhas logo abaixo da última linha com dados; com INSERT_ROWS, a grade cresce junto."""
+        values = [list(linha) for linha in values]
+        self.client.chamada("escrita", sum(len(linha) for linha in values))
+        with self.client.lock:
+            inicio = self._usadas()
+            if insert_data_option == 'INSERT_ROWS':
+                self._inserir("ROWS", inicio, inicio + len(values))
+            elif inicio + len(values) > self.row_count:
+                self._inserir("ROWS", self.row_count, inicio + len(values))
+            largura = max((len(linha) for linha in values), default=0)
+            if largura > self.col_count:
+                self._inserir("COLUMNS", self.col_count, largura)
+            self._escrever(inicio, 0, values, value_input_option)
+            self.spreadsheet._tocar()
+        intervalo = f"'{self.title}'!A{inicio + 1}:{rowcol_to_a1(inicio + len(values), max(largura, 1))}"
+        return {"spreadsheetId": self.spreadsheet.id, "updates": {"updatedRange": intervalo}}
+
+    def append_row(self, values, value_input_option='RAW', insert_data_option=None, table_range=None, **kwargs):
+        return self.append_rows([values], value_input_option, insert_data_option, table_range)
+
+    def batch_clear(self, ranges):
+        self.client.chamada("escrita")
+        with self.client.lock:
+            for intervalo in ranges:
+                linha_ini, linha_fim, col_ini, col_fim = self._faixa(_separar_intervalo(intervalo)[1])
+                linhas = [list(linha) for linha in self._trecho(linha_ini, linha_fim)]
+                for linha in linhas:
+                    linha[col_ini:col_fim] = [''] * len(linha[col_ini:col_fim])
+                self._gravar(linha_ini, linhas)
+            self.spreadsheet._tocar()
+        return {"spreadsheetId": self.spreadsheet.id, "clearedRanges": list(ranges)}
+
+    def clear(self):
+        self.client.chamada("escrita")
+        with self.client.lock:
+            self._esvaziar()
+            self.spreadsheet._tocar()
+        return {"spreadsheetId": self.spreadsheet.id}
+
+    # --- Dimensões ---
+
+    def resize(self, rows=None, cols=None):
+        self.client.chamada("escrita")
+        with self.client.lock:
+            if rows is not None:
+                if rows < self.row_count:
+                    self._apagar("ROWS", int(rows), self.row_count)
+                else:
+                    self._inserir("ROWS", self.row_count, int(rows))
+            if cols is not None:
+                if cols < self.col_count:
+                    self._apagar("COLUMNS", int(cols), self.col_count)
+                else:
+                    self._inserir("COLUMNS", self.col_count, int(cols))
+            self.spreadsheet._tocar()
+        return {"spreadsheetId": self.spreadsheet.id}
+
+    def add_rows(self, rows):
+        self.resize(rows=self.row_count + rows)
+
+    def add_cols(self, cols):
+        self.resize(cols=self.col_count + cols)
+
+    def hide_columns(self, start, end):
+        self.client.chamada("escrita")
+        with self.client.lock:
+            self._ocultar(range(start, end))
+            self.spreadsheet._tocar()
+        return {"spreadsheetId": self.spreadsheet.id}
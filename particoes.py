@@ -0,0 +1,251 @@
+"""
+Partição da aba de pedidos por FILIAL.
+
+Com a partição ligada no secrets.toml,
+
+    [particoes]
+    pedidos = true
+
+os pedidos ficam numa aba por filial ("PEDIDOS MG", "PEDIDOS SP"...), todas com o mesmo
+cabeçalho. Quem trabalha com uma filial lê e grava só a aba dela; os painéis que cruzam
+filiais leem todas as abas num único batchGet. Desligada, tudo continua na aba única.
+
+As leituras e gravações passam pelo AbaParticionada, que sabe em qual aba está cada linha
+(pelo ID) e reparte os DataFrames entre as abas antes de chamar as funções de planilhas.
+
+Para ligar a partição, as abas das filiais são criadas a partir da aba única (que fica
+intacta, como cópia de segurança) com:
+    python -m particoes pedidos
+"""
+import argparse
+
+import pandas as pd
+import streamlit as st
+from gspread.utils import fill_gaps
+
+from planilhas import (
+    COLUNA_ID, obter_aba, ler_aba, titulos_abas, garantir_ids, registrar_snapshot, criar_aba,
+    salvar_alteracoes, anexar_linhas, atualizar_por_id, colunas_aba, limpar_handles,
+)
+from esquemas import PEDIDOS
+
+SEM_VALOR = "SEM FILIAL"
+
+
+def _juntar(frames):
+    """Registros de {aba: DataFrame} num DataFrame só."""
+    if not frames:
+        return pd.DataFrame()
+    frames = list(frames.values())
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+
+class AbaParticionada:
+    """
+    Aba dividida em várias, uma por valor de `coluna`, com o nome `prefixo` + valor.
+    Com a partição desligada, lê e grava a aba única `aba`, como antes. O `esquema` da aba
+    dá o formato das colunas de data nas abas criadas por `dividir`.
+    """
+
+    def __init__(self, nome, aba, coluna, prefixo, esquema=None):
+        self.nome = nome
+        self.aba = aba
+        self.coluna = coluna
+        self.prefixo = prefixo
+        self.esquema = esquema
+
+    def ativa(self):
+        return bool(st.secrets.get("particoes", {}).get(self.nome, False))
+
+    def aba_de(self, valor):
+        """Aba em que ficam as linhas com esse valor da coluna."""
+        if not self.ativa():
+            return self.aba
+        valor = "" if pd.isna(valor) else str(valor).strip().upper()
+        return f"{self.prefixo}{valor or SEM_VALOR}"
+
+    def valores(self):
+        """Valores da coluna que já têm aba (por exemplo, as filiais com pedidos)."""
+        if not self.ativa():
+            return []
+        return sorted(titulo[len(self.prefixo):] for titulo in titulos_abas() if titulo.startswith(self.prefixo))
+
+    def abas(self, valores=None):
+        """Abas dos `valores` informados (todas, com None) que existem na planilha."""
+        if not self.ativa():
+            return [self.aba]
+        existentes = self.valores()
+        if valores is not None:
+            existentes = [valor for valor in existentes if valor in {str(v).strip().upper() for v in valores}]
+        return [self.prefixo + valor for valor in existentes]
+
+    # --- Leitura ---
+
+    def _estado(self):
+        """Abas carregadas nesta sessão para edição e a aba de cada ID."""
+        return st.session_state.setdefault(f"_particao::{self.nome}", {"abas": [], "ids": {}})
+
+    def ler_abas(self, valores=None, colunas=None, tipos=None, grupo=()):
+        """{aba: registros} das abas dos `valores` (todas, com None), num único batchGet, como o ler_aba."""
+        abas = self.abas(valores)
+        if not abas:
+            return {}
+        outras = dict.fromkeys(abas[1:], (colunas, tipos))
+        outras.update(grupo if isinstance(grupo, dict) else dict.fromkeys(grupo))
+        # A primeira traz as outras no mesmo batchGet; as seguintes saem do que ficou guardado
+        frames = {abas[0]: ler_aba(abas[0], colunas=colunas, tipos=tipos, grupo=outras)}
+        frames.update((aba, ler_aba(aba, colunas=colunas, tipos=tipos)) for aba in abas[1:])
+        return frames
+
+    def preparar_edicao(self, frames, serializar=None):
+        """
+        Prepara para edição as abas lidas por ler_abas e devolve os registros delas juntos:
+        cada aba recebe seus IDs (gravados na planilha, se faltarem), com `serializar` o
+        snapshot (das linhas passadas por ele), e a aba de cada ID fica guardada na sessão.
+        Como grava na planilha e na sessão, fica fora dos loaders com recarregar_se_mudou.
+        """
+        estado = {"abas": list(frames), "ids": {}}
+        frames = dict(frames)
+        for aba, df in frames.items():
+            df = frames[aba] = garantir_ids(df, aba)
+            if serializar is not None:
+                registrar_snapshot(serializar(df), aba)
+            if COLUNA_ID in df.columns:
+                estado["ids"].update(dict.fromkeys(df[COLUNA_ID].astype(str), aba))
+        st.session_state[f"_particao::{self.nome}"] = estado
+        return _juntar(frames)
+
+    def ler(self, valores=None, colunas=None, tipos=None, grupo=(), serializar=None):
+        """
+        Registros das abas dos `valores` (todas, com None) num único batchGet, como o ler_aba.
+        Com `serializar`, a carga é para edição (ver preparar_edicao).
+        """
+        frames = self.ler_abas(valores, colunas, tipos, grupo)
+        if serializar is not None:
+            return self.preparar_edicao(frames, serializar)
+        return _juntar(frames)
+
+    def colunas(self):
+        """Cabeçalho das abas (o da primeira carregada para edição)."""
+        abas = self._estado()["abas"] or self.abas() or [self.aba]
+        return colunas_aba(abas[0])
+
+    # --- Gravação (DataFrames já serializados) ---
+
+    def _repartir(self, df, por_id):
+        """{aba: linhas de df}, pela aba guardada de cada ID ou, para linhas novas, pela coluna."""
+        ids = self._estado()["ids"]
+        if por_id:
+            chaves = pd.Series([ids.get(str(id_)) for id_ in df.index], index=df.index)
+        else:
+            conhecidas = df[COLUNA_ID].astype(str).map(ids) if COLUNA_ID in df.columns else None
+            chaves = df[self.coluna].map(self.aba_de)
+            if conhecidas is not None:
+                chaves = conhecidas.where(conhecidas.notna(), chaves)
+        ausentes = df.index[chaves.isna()].tolist()
+        if ausentes:
+            raise KeyError(f"IDs inexistentes na aba: {ausentes}")
+        return {aba: df[chaves == aba] for aba in pd.unique(chaves)}
+
+    def _criar_aba(self, aba, cabecalho):
+        if aba not in titulos_abas():
+            criar_aba(aba, [cabecalho])
+
+    def salvar(self, df, value_input_option='USER_ENTERED'):
+        """
+        Como salvar_alteracoes, aba por aba: cada aba carregada para edição recebe só as
+        diferenças das suas linhas. Retorna o número de células enviadas.
+        """
+        if not self.ativa():
+            return salvar_alteracoes(df, self.aba, value_input_option=value_input_option)
+        partes = self._repartir(df, por_id=False)
+        celulas = 0
+        for aba in self._estado()["abas"]:
+            celulas += salvar_alteracoes(partes.pop(aba, df.iloc[0:0]), aba, value_input_option=value_input_option)
+        # Linhas de abas que não foram carregadas (filial nova, por exemplo) vão no fim delas
+        for aba, parte in partes.items():
+            celulas += self._anexar(aba, parte, value_input_option) * len(parte.columns)
+        return celulas
+
+    def _anexar(self, aba, df, value_input_option):
+        self._criar_aba(aba, list(df.columns))
+        linhas = anexar_linhas(df, aba, value_input_option=value_input_option)
+        if COLUNA_ID in df.columns:
+            self._estado()["ids"].update(dict.fromkeys(df[COLUNA_ID].astype(str), aba))
+        return linhas
+
+    def anexar(self, df, value_input_option='USER_ENTERED'):
+        """Como anexar_linhas, com cada linha indo para a aba do seu valor da coluna."""
+        if not self.ativa():
+            return anexar_linhas(df, self.aba, value_input_option=value_input_option)
+        return sum(
+            self._anexar(aba, parte, value_input_option)
+            for aba, parte in self._repartir(df, por_id=False).items()
+        )
+
+    def atualizar_por_id(self, df, value_input_option='USER_ENTERED'):
+        """Como atualizar_por_id (índice = ID da linha), aba por aba."""
+        if not self.ativa():
+            return atualizar_por_id(df, self.aba, value_input_option=value_input_option)
+        return sum(
+            atualizar_por_id(parte, aba, value_input_option=value_input_option)
+            for aba, parte in self._repartir(df, por_id=True).items()
+        )
+
+
+PEDIDOS_POR_FILIAL = AbaParticionada("pedidos", 0, "FILIAL", "PEDIDOS ", PEDIDOS)
+
+PARTICOES = {"pedidos": PEDIDOS_POR_FILIAL}
+
+
+# --- Criação das abas a partir da aba única ---
+
+def dividir(particao):
+    """
+    Copia as linhas da aba única para as abas de cada valor da coluna (criadas se preciso;
+    as que já existem não são tocadas). Retorna {aba: linhas}.
+
+    As linhas são copiadas como estão guardadas, não como aparecem: lidas sem formatação
+    (números como números, datas como número de série, fórmulas como fórmulas, textos como
+    "0012" como estão) e gravadas em RAW, com o formato de data do esquema nas colunas de data.
+    """
+    origem = obter_aba(particao.aba)
+    grade = fill_gaps(origem.get_all_values(value_render_option='FORMULA'))
+    if not grade:
+        return {}
+    cabecalho, linhas = grade[0], grade[1:]
+    coluna = cabecalho.index(particao.coluna)
+    existentes = set(titulos_abas())
+
+    grupos = {}
+    for linha in linhas:
+        valor = str(linha[coluna]).strip().upper() or SEM_VALOR
+        grupos.setdefault(particao.prefixo + valor, []).append(linha)
+
+    copiadas = {}
+    for aba, linhas_aba in grupos.items():
+        if aba in existentes:
+            continue
+        criar_aba(
+            aba, [cabecalho] + linhas_aba, value_input_option='RAW',
+            formatar=particao.esquema.formatos_datas if particao.esquema else None,
+        )
+        copiadas[aba] = len(linhas_aba)
+    return copiadas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("particao", choices=sorted(PARTICOES))
+    args = parser.parse_args()
+
+    copiadas = dividir(PARTICOES[args.particao])
+    for aba, total in copiadas.items():
+        print(f"{aba}: {total} linhas")
+    if not copiadas:
+        print("Nenhuma aba criada (já existem ou a aba única está vazia)")
+    limpar_handles()
+
+
+if __name__ == "__main__":
+    main()
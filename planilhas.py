@@ -0,0 +1,1524 @@
+import datetime
+import functools
+import hashlib
+import json
+import re
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from collections import namedtuple
+
+import requests
+import streamlit as st
+import pandas as pd
+import gspread
+import openpyxl
+from gspread.utils import rowcol_to_a1, absolute_range_name, fill_gaps
+from google.auth.exceptions import GoogleAuthError
+from googleapiclient.discovery import build
+from cache_tokens import credenciais_com_cache
+from comum import COLUNA_ID
+from transporte import SessaoComprimida, HttpSessao, CotaEsgotada, registrar_recebidos
+from memoria import ClienteMemoria, memoria_ativa, configuracao_memoria
+from banco_local import ClienteSQLite, banco_local_ativo, configuracao_banco_local
+from espelho import EspelhoLocal, espelho_ativo, configuracao_espelho, escrever_bloco
+from barramento import Barramento, configuracao_barramento, nome_aba, nome_externo
+
+# Módulo compartilhado de acesso ao Google Sheets.
+# Todos os painéis (compras, estoque_nf, fiscal, consulta e reembolso) passam por aqui,
+# assim existe um único cliente autorizado por processo e os handles de planilha/aba
+# são resolvidos uma única vez.
+# O armazenamento é o cliente devolvido por get_gspread_client: o do gspread (Google Sheets),
+# o das planilhas em memória (memoria.py) ou o do banco SQLite local (banco_local.py), todos
+# com a mesma interface; as funções de leitura e gravação daqui funcionam com qualquer um.
+# Com a seção [espelho], as abas lidas inteiras ficam também em Parquet no disco local e
+# são lidas de lá enquanto a versão da planilha não mudar (ver espelho.py).
+# As gravações daqui são anunciadas por aba no barramento (ver barramento.py), para que só
+# as cargas que leram a aba gravada sejam refeitas, em todos os processos.
+
+SCOPES_PLANILHAS = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
+
+
+def carregar_credenciais(scopes):
+    """
+    Monta as credenciais da conta de serviço a partir dos secrets do Streamlit,
+    reaproveitando o access token salvo em disco para os mesmos scopes.
+    """
+    credentials_info = st.secrets["gcp_service_account"]
+
+    # Os secrets podem vir como string JSON ou como AttrDict
+    if isinstance(credentials_info, str):
+        credentials_info = json.loads(credentials_info)
+
+    return credenciais_com_cache(dict(credentials_info), scopes)
+
+
+# --- Transporte HTTP (um pool por conjunto de scopes) ---
+@st.cache_resource(show_spinner=False)
+def obter_sessao(scopes):
+    """
+    Sessão HTTP autorizada e compartilhada para o conjunto de scopes informado.
+    Pool, gzip e timeouts podem ser ajustados na seção [transporte] do secrets.toml.
+    """
+    config = dict(st.secrets.get("transporte", {}))
+    return SessaoComprimida(carregar_credenciais(scopes), config)
+
+
+def construir_servico(nome, versao, scopes):
+    """Serviço do googleapiclient (Drive, Gmail...) usando a sessão compartilhada."""
+    return build(nome, versao, http=HttpSessao(obter_sessao(tuple(scopes))), cache_discovery=False)
+
+
+# --- Falhas tipadas ---
+# Erros de rede, de autenticação e da API nas funções de leitura e escrita saem como
+# FalhaPlanilha (FalhaCota quando a cota se esgotou mesmo depois das repetições feitas
+# pelo transporte), para que as páginas não confundam uma falha com uma aba vazia.
+
+class FalhaPlanilha(Exception):
+    """Não foi possível ler ou gravar a planilha."""
+
+
+class FalhaCota(FalhaPlanilha):
+    """A cota de requisições da API se esgotou."""
+
+
+def _status_erro(erro):
+    if isinstance(erro, gspread.exceptions.APIError):
+        return erro.code
+    resposta = getattr(erro, "response", None)
+    return getattr(resposta, "status_code", None)
+
+
+def traduzir_falhas(funcao):
+    @functools.wraps(funcao)
+    def envoltorio(*args, **kwargs):
+        try:
+            return funcao(*args, **kwargs)
+        except (gspread.exceptions.APIError, requests.RequestException, GoogleAuthError) as e:
+            if isinstance(e, CotaEsgotada) or _status_erro(e) == 429:
+                raise FalhaCota(str(e)) from e
+            raise FalhaPlanilha(str(e)) from e
+    return envoltorio
+
+
+def exibir_falha(falha):
+    """Mostra a falha de acesso à planilha e interrompe a execução da página."""
+    if isinstance(falha, FalhaCota):
+        st.error(f"Limite de acessos ao Google Sheets atingido. Aguarde um minuto e recarregue a página. ({falha})")
+    else:
+        st.error(f"Não foi possível acessar o Google Sheets: {falha}")
+    st.stop()
+
+
+# --- Cliente e handles (um por processo) ---
+@st.cache_resource(show_spinner=False)
+def get_gspread_client():
+    """
+    Cliente gspread autorizado, compartilhado por todas as sessões do processo. Com a seção
+    [memoria] ativa no secrets.toml, as planilhas ficam em memória (ver memoria.py); com a
+    [banco_local], num arquivo SQLite (ver banco_local.py).
+    """
+    if memoria_ativa():
+        return ClienteMemoria(configuracao_memoria())
+    if banco_local_ativo():
+        return ClienteSQLite(configuracao_banco_local(), principal=st.secrets.get("sheet_id"))
+    try:
+        sessao = obter_sessao(tuple(SCOPES_PLANILHAS))
+    except json.JSONDecodeError as e:
+        st.error(f"Erro ao decodificar as credenciais JSON: {e}. Verifique a formatação do secrets.toml.")
+        return None
+    return gspread.Client(auth=sessao.credentials, session=sessao)
+
+
+def planilhas_locais():
+    """Se as planilhas estão em memória ou no banco local, e não no Google."""
+    return memoria_ativa() or banco_local_ativo()
+
+
+@st.cache_resource(show_spinner=False)
+def obter_espelho():
+    """Espelho local das abas em Parquet (ver espelho.py), ou None se não estiver configurado."""
+    if not espelho_ativo():
+        return None
+    return EspelhoLocal(**configuracao_espelho())
+
+
+@st.cache_resource(show_spinner=False)
+def obter_barramento():
+    """Barramento de invalidação das cargas (ver barramento.py), no arquivo configurado ou na memória."""
+    return Barramento(configuracao_barramento().get("arquivo", ":memory:"))
+
+
+@st.cache_resource(show_spinner=False)
+def resolver_id_planilha(titulo):
+    """Resolve o título de uma planilha para o seu ID (busca no Drive feita uma única vez)."""
+    return get_gspread_client().open(titulo).id
+
+
+@st.cache_resource(show_spinner=False)
+def abrir_planilha(chave):
+    """Handle da planilha pelo ID, reaproveitado entre reruns e sessões."""
+    return get_gspread_client().open_by_key(chave)
+
+
+@st.cache_resource(show_spinner=False)
+def _obter_aba_cacheada(chave, aba):
+    planilha = abrir_planilha(chave)
+    if isinstance(aba, int):
+        worksheet = planilha.get_worksheet(aba)
+        if worksheet is None:
+            raise gspread.exceptions.WorksheetNotFound(f"índice {aba}")
+        return worksheet
+    return planilha.worksheet(aba)
+
+
+def obter_aba(aba, chave=None, titulo=None):
+    """
+    Retorna o handle da aba (pelo índice ou pelo nome) da planilha informada.
+    Sem `chave` nem `titulo`, usa a planilha principal definida em `sheet_id`.
+    """
+    if chave is None:
+        chave = resolver_id_planilha(titulo) if titulo else st.secrets["sheet_id"]
+    return _obter_aba_cacheada(chave, aba)
+
+
+_lock_titulos = threading.Lock()
+_titulos = {}
+
+
+@traduzir_falhas
+def titulos_abas(chave=None, titulo=None):
+    """
+    Nomes das abas da planilha, na ordem. A lista só é buscada de novo quando a versão da
+    planilha muda (uma aba criada por outra sessão aparece na próxima consulta).
+    """
+    if chave is None:
+        chave = resolver_id_planilha(titulo) if titulo else st.secrets["sheet_id"]
+    versao = versao_planilha(chave)
+    with _lock_titulos:
+        salvo = _titulos.get(chave)
+    if versao is not None and salvo is not None and salvo[0] == versao:
+        return list(salvo[1])
+    titulos = [worksheet.title for worksheet in abrir_planilha(chave).worksheets()]
+    with _lock_titulos:
+        _titulos[chave] = (versao, titulos)
+    return list(titulos)
+
+
+# --- Leitura de várias abas numa requisição ---
+
+# Segundos em que as abas trazidas junto com outra ficam guardadas esperando seu loader
+VALIDADE_LEITURA_AGRUPADA = 10
+
+
+# Tipos que os loaders podem declarar por coluna em `tipos` ({coluna: tipo}). As colunas
+# sem tipo declarado são convertidas como no numericise do gspread (número ou texto).
+TIPO_TEXTO = "texto"
+TIPO_NUMERO = "numero"
+TIPO_INTEIRO = "inteiro"
+TIPO_DATA = "data"
+
+# Inteiros com mais dígitos que isso não cabem exatos num float64 (ex.: chave de acesso da NF)
+_DIGITOS_EXATOS = 15
+
+
+def _numerizar(valores):
+    """Equivalente vetorizado do numericise_all do gspread aplicado a uma coluna."""
+    serie = pd.Series(valores, dtype=object)
+    numeros = pd.to_numeric(serie, errors="coerce")
+    validos = numeros.notna()
+    if not validos.any():
+        return pd.Series(valores)
+    inteiros = validos & serie.str.fullmatch(r"\s*[+-]?\d+\s*").fillna(False).astype(bool)
+    longos = inteiros & (serie.str.len() > _DIGITOS_EXATOS)
+    if validos.all() and not longos.any():
+        return numeros
+    # Coluna mista: números viram int/float do Python e o resto continua texto
+    decimais = validos & ~inteiros
+    exatos = inteiros & ~longos
+    serie[decimais] = numeros[decimais].astype(object)
+    serie[exatos] = numeros[exatos].astype("int64").astype(object)
+    serie[longos] = serie[longos].map(int)
+    return serie
+
+
+def _converter(valores, tipo):
+    if tipo is None:
+        return _numerizar(valores)
+    if tipo == TIPO_TEXTO:
+        return pd.Series(valores)
+    if tipo == TIPO_DATA:
+        return pd.to_datetime(pd.Series(valores, dtype=object), errors="coerce", dayfirst=True)
+    numeros = pd.to_numeric(pd.Series(valores, dtype=object), errors="coerce").fillna(0)
+    return numeros.astype(int) if tipo == TIPO_INTEIRO else numeros
+
+
+def grade_para_dataframe(valores, tipos=None):
+    """
+    DataFrame a partir da grade devolvida pela API (cabeçalho + linhas), montado coluna a
+    coluna: cada coluna é convertida numa única passada vetorizada, já no tipo declarado em
+    `tipos`. Sem `tipos`, dá o mesmo resultado de pd.DataFrame(worksheet.get_all_records()).
+    """
+    if not valores or not valores[0]:
+        return pd.DataFrame()
+    valores = fill_gaps(valores)
+    cabecalho = valores[0]
+    duplicados = sorted({col for col in cabecalho if cabecalho.count(col) > 1})
+    if duplicados:
+        raise gspread.exceptions.GSpreadException(f"O cabeçalho da aba tem colunas duplicadas: {duplicados}")
+    tipos = tipos or {}
+    colunas = zip(*valores[1:]) if len(valores) > 1 else ([] for _ in cabecalho)
+    return pd.DataFrame({
+        nome: _converter(list(coluna), tipos.get(nome)) for nome, coluna in zip(cabecalho, colunas)
+    })
+
+
+@st.cache_resource(show_spinner=False)
+def _cabecalho_aba(chave, aba):
+    """Cabeçalho da aba, resolvido uma vez por processo para as leituras por coluna."""
+    return obter_aba(aba, chave).row_values(1)
+
+
+def _blocos_colunas(cabecalho, colunas):
+    """Posições (0-based) das colunas pedidas, em blocos contíguos [inicio, fim]."""
+    blocos = []
+    for posicao in sorted({cabecalho.index(col) for col in colunas if col in cabecalho}):
+        if blocos and blocos[-1][1] == posicao - 1:
+            blocos[-1][1] = posicao
+        else:
+            blocos.append([posicao, posicao])
+    return blocos
+
+
+def _letra_coluna(posicao):
+    return re.sub(r"\d", "", rowcol_to_a1(1, posicao + 1))
+
+
+def _juntar_blocos(grades, larguras):
+    """Junta lado a lado as grades de cada bloco de colunas, completando as linhas vazias."""
+    altura = max((len(grade) for grade in grades), default=0)
+    grades = [fill_gaps(grade or [[]], rows=altura, cols=largura) for grade, largura in zip(grades, larguras)]
+    return [sum((grade[i] for grade in grades), []) for i in range(altura)]
+
+
+# Modo de leitura para abas que só crescem no fim (almoxarifado, reembolsos)
+INCREMENTAL = "incremental"
+
+# Linhas finais conferidas antes de baixar só a cauda da aba
+LINHAS_VERIFICACAO = 5
+
+# Segundos após os quais a leitura incremental faz uma leitura completa de novo, para
+# pegar edições feitas acima da cauda por fora deste módulo
+INTERVALO_RESSINCRONIZACAO = 15 * 60
+
+
+def _plano_colunas(chave, aba, nome, colunas, tipos, completa):
+    """Intervalos e montagem da leitura só de `colunas` (na segunda tentativa, da aba inteira)."""
+    if completa:
+        def montar(grades):
+            df = grade_para_dataframe(grades[0], tipos)
+            return df[[col for col in colunas if col in df.columns]]
+        return [absolute_range_name(nome)], montar
+
+    cabecalho = _cabecalho_aba(chave, aba)
+    blocos = _blocos_colunas(cabecalho, colunas)
+    nomes_blocos = [cabecalho[inicio:fim + 1] for inicio, fim in blocos]
+
+    def montar(grades):
+        grade = _juntar_blocos(grades, [len(nomes) for nomes in nomes_blocos])
+        if grade and grade[0] != sum(nomes_blocos, []):
+            # Alguém moveu colunas desde que o cabeçalho foi resolvido
+            _cabecalho_aba.clear()
+            return None
+        return grade_para_dataframe(grade, tipos)
+
+    intervalos = [absolute_range_name(nome, f"{_letra_coluna(inicio)}:{_letra_coluna(fim)}") for inicio, fim in blocos]
+    return intervalos, montar
+
+
+_estado_sincronias = {}
+
+
+def _sincronias():
+    """Estado das leituras incrementais do processo, por (planilha, id da aba)."""
+    return _estado_sincronias
+
+
+def _largura_cabecalho(cabecalho):
+    """Colunas do cabeçalho sem as vazias do fim (que o fill_gaps acrescenta até a linha mais larga)."""
+    largura = len(cabecalho)
+    while largura and cabecalho[largura - 1] == '':
+        largura -= 1
+    return largura
+
+
+def _soma_linhas(linhas, largura):
+    """Checksum das linhas, todas completadas ou cortadas na `largura` do cabeçalho."""
+    linhas = [(linha + [''] * largura)[:largura] for linha in linhas]
+    return hashlib.sha1(json.dumps(linhas, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _guardar_sincronia(chave_estado, cabecalho, linhas_finais, total, frame, sincronizado_em):
+    _sincronias()[chave_estado] = {
+        "cabecalho": cabecalho,
+        "total": total,
+        "soma": _soma_linhas(linhas_finais[-LINHAS_VERIFICACAO:], _largura_cabecalho(cabecalho)),
+        "frame": frame,
+        "sincronizado_em": sincronizado_em,
+    }
+
+
+def esquecer_sincronia(worksheet):
+    """Descarta o estado incremental da aba (chamado antes de reescrever linhas existentes)."""
+    _sincronias().pop((worksheet.spreadsheet_id, worksheet.id), None)
+
+
+def _estado_incremental(chave, aba):
+    """Chave e estado válido da leitura incremental da aba (None se vencido ou inexistente)."""
+    chave_estado = (chave, obter_aba(aba, chave).id)
+    estado = _sincronias().get(chave_estado)
+    if estado is not None and time.monotonic() - estado["sincronizado_em"] > INTERVALO_RESSINCRONIZACAO:
+        estado = None
+    return chave_estado, estado
+
+
+def _plano_incremental(chave, aba, nome, tipos, completa):
+    """
+    Intervalos e montagem da leitura incremental: com estado válido, pede o cabeçalho e as
+    linhas a partir das últimas já lidas; se elas conferem, só as novas são processadas.
+    """
+    chave_estado, estado = _estado_incremental(chave, aba)
+
+    if completa or estado is None:
+        def montar(grades):
+            grade = fill_gaps(grades[0]) if grades[0] else []
+            frame = grade_para_dataframe(grade, tipos)
+            if grade:
+                _guardar_sincronia(chave_estado, grade[0], grade[1:], len(grade) - 1, frame, time.monotonic())
+            return frame.copy()
+        return [absolute_range_name(nome)], montar
+
+    largura = len(estado["cabecalho"])
+    ultima = _letra_coluna(largura - 1)
+    inicio = max(estado["total"] - LINHAS_VERIFICACAO, 0)
+    conferidas = estado["total"] - inicio
+
+    def montar(grades):
+        cabecalho = fill_gaps(grades[0] or [[]], cols=largura)[0]
+        cauda = fill_gaps(grades[1], cols=largura) if grades[1] else []
+        if (
+            cabecalho != estado["cabecalho"]
+            or len(cauda) < conferidas
+            or _soma_linhas(cauda[:conferidas], _largura_cabecalho(cabecalho)) != estado["soma"]
+        ):
+            # Algo acima da cauda foi reescrito ou apagado: refaz a leitura completa
+            return None
+        novas = cauda[conferidas:]
+        if not novas:
+            return estado["frame"].copy()
+        frame = pd.concat([estado["frame"], grade_para_dataframe([cabecalho] + novas, tipos)], ignore_index=True)
+        _guardar_sincronia(
+            chave_estado, cabecalho, cauda, estado["total"] + len(novas), frame, estado["sincronizado_em"]
+        )
+        return frame.copy()
+
+    # +2: linhas da planilha são 1-based e a primeira é o cabeçalho
+    return [absolute_range_name(nome, f"A1:{ultima}1"), absolute_range_name(nome, f"A{inicio + 2}:{ultima}")], montar
+
+
+def _plano_leitura(chave, aba, nome, modo, tipos, completa):
+    """Intervalos a pedir no batchGet e a função que monta o DataFrame (None = tentar de novo)."""
+    if modo is None:
+        return [absolute_range_name(nome)], lambda grades: grade_para_dataframe(grades[0], tipos)
+    if modo == INCREMENTAL:
+        return _plano_incremental(chave, aba, nome, tipos, completa)
+    return _plano_colunas(chave, aba, nome, modo, tipos, completa)
+
+
+def _leituras(abas):
+    """Normaliza `abas` (lista, ou dict {aba: modo} / {aba: (modo, tipos)}) em {aba: (modo, tipos)}."""
+    if not isinstance(abas, dict):
+        return {aba: (None, None) for aba in abas}
+    return {aba: spec if isinstance(spec, tuple) else (spec, None) for aba, spec in abas.items()}
+
+
+# --- Leitura da planilha inteira pela exportação XLSX do Drive ---
+# Alternativa às leituras por aba nas cargas completas (início a frio, "Recarregar"): a
+# planilha vem num único download em stream e as abas pedidas são lidas do arquivo.
+# Ligada com `leitura_exportada = true` no secrets.toml. O files.export recusa arquivos
+# acima de 10 MB; nesse caso (ou em qualquer falha) a leitura segue pelo batchGet.
+
+URL_EXPORTACAO_DRIVE = "https://www.googleapis.com/drive/v3/files/{}/export"
+MIME_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+BLOCO_DOWNLOAD = 1 << 20
+
+
+def leitura_exportada_ativa():
+    # As planilhas locais não têm exportação
+    return not planilhas_locais() and bool(st.secrets.get("leitura_exportada", False))
+
+
+def baixar_xlsx(chave, destino):
+    """Grava em `destino` a planilha exportada como XLSX, baixada em blocos."""
+    resposta = obter_sessao(tuple(SCOPES_PLANILHAS)).get(
+        URL_EXPORTACAO_DRIVE.format(chave), params={"mimeType": MIME_XLSX}, stream=True
+    )
+    with resposta:
+        resposta.raise_for_status()
+        tamanho = 0
+        for bloco in resposta.iter_content(BLOCO_DOWNLOAD):
+            destino.write(bloco)
+            tamanho += len(bloco)
+        registrar_recebidos(resposta.raw.tell() or tamanho, tamanho)
+    destino.seek(0)
+
+
+def _texto_celula(valor):
+    """Valor da célula do XLSX como o texto que a API devolveria para ela."""
+    if valor is None:
+        return ''
+    if isinstance(valor, bool):
+        return 'TRUE' if valor else 'FALSE'
+    if isinstance(valor, datetime.datetime):
+        return valor.strftime('%d/%m/%Y %H:%M:%S' if valor.time() != datetime.time() else '%d/%m/%Y')
+    if isinstance(valor, (datetime.date, datetime.time)):
+        return valor.strftime('%d/%m/%Y' if isinstance(valor, datetime.date) else '%H:%M:%S')
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+
+def _grade_xlsx(planilha):
+    """Grade (linhas de texto, sem células e linhas vazias no fim) de uma aba do XLSX."""
+    grade = []
+    for linha in planilha.iter_rows(values_only=True):
+        textos = [_texto_celula(valor) for valor in linha]
+        while textos and textos[-1] == '':
+            textos.pop()
+        grade.append(textos)
+    while grade and not grade[-1]:
+        grade.pop()
+    return grade
+
+
+def ler_exportacao(abas, chave=None, titulo=None, versao=None):
+    """
+    Lê as abas informadas (como em ler_abas) de um único XLSX exportado da planilha,
+    percorrendo as linhas de cada aba uma vez com o openpyxl em modo read_only. Abas
+    INCREMENTAL vêm inteiras. Com `versao` (a da planilha antes do download), as abas
+    lidas inteiras são guardadas no espelho local.
+    """
+    if chave is None:
+        chave = resolver_id_planilha(titulo) if titulo else st.secrets["sheet_id"]
+    resultado = {}
+    espelho = obter_espelho() if versao is not None else None
+    with tempfile.TemporaryFile() as arquivo:
+        baixar_xlsx(chave, arquivo)
+        livro = openpyxl.load_workbook(arquivo, read_only=True, data_only=True)
+        try:
+            for aba, (modo, tipos) in _leituras(abas).items():
+                planilha = livro.worksheets[aba] if isinstance(aba, int) else livro[aba]
+                grade = _grade_xlsx(planilha)
+                if espelho is not None and modo is None:
+                    espelho.guardar(chave, planilha.title, grade, versao)
+                df = grade_para_dataframe(grade, tipos)
+                if modo not in (None, INCREMENTAL):
+                    df = df[[col for col in modo if col in df.columns]]
+                resultado[aba] = df
+        finally:
+            livro.close()
+    return resultado
+
+
+# --- Leituras simultâneas iguais (single-flight) ---
+# No início do turno várias sessões abrem a mesma página ao mesmo tempo, e quando a carga
+# compartilhada expira todas vão buscar a aba de novo. Leituras com a mesma chave
+# (planilha, abas, colunas, tipos) que chegam enquanto outra igual está em andamento
+# esperam por ela e recebem uma cópia do resultado, em vez de repetir o download.
+
+class _Voo:
+    def __init__(self):
+        self.pronto = threading.Event()
+        self.resultado = None
+        self.erro = None
+        self.interrompido = False
+        self.esperando = 0
+
+
+_lock_voos = threading.Lock()
+_voos = {}
+_metricas_voos = {"leituras": 0, "compartilhadas": 0}
+
+
+def _chave_voo(chave, pendentes, exportar):
+    abas = sorted(
+        (
+            repr(aba),
+            tuple(modo) if isinstance(modo, list) else modo,
+            tuple(sorted((tipos or {}).items())),
+        )
+        for aba, (modo, tipos) in pendentes.items()
+    )
+    # Com os contadores do barramento, quem acabou de gravar numa das abas não entra numa
+    # leitura que começou antes da gravação
+    contadores = obter_barramento().contadores()
+    gravacoes = tuple(_contador_aba(contadores, chave, aba) for aba in sorted(pendentes, key=repr))
+    return chave, bool(exportar), tuple(abas), gravacoes
+
+
+def _copiar_frames(frames):
+    return {aba: df.copy() for aba, df in frames.items()}
+
+
+def _em_voo(chave_voo, buscar):
+    """
+    Executa `buscar()` uma única vez para chamadas simultâneas com a mesma chave. Quem
+    chega durante a busca espera e recebe uma cópia dos DataFrames (ou a mesma exceção).
+    Se a busca for interrompida por algo que não é um erro da leitura (o Stop ou o rerun
+    da sessão que a começou), quem esperava busca de novo em vez de ser interrompido junto.
+    """
+    while True:
+        with _lock_voos:
+            voo = _voos.get(chave_voo)
+            lider = voo is None
+            if lider:
+                voo = _voos[chave_voo] = _Voo()
+                _metricas_voos["leituras"] += 1
+            else:
+                voo.esperando += 1
+                _metricas_voos["compartilhadas"] += 1
+        if lider:
+            break
+        voo.pronto.wait()
+        if voo.erro is not None:
+            raise voo.erro
+        if not voo.interrompido:
+            return _copiar_frames(voo.resultado)
+
+    try:
+        voo.resultado = buscar()
+    except Exception as e:
+        voo.erro = e
+        raise
+    except BaseException:
+        voo.interrompido = True
+        raise
+    finally:
+        with _lock_voos:
+            del _voos[chave_voo]
+            esperando = voo.esperando
+        voo.pronto.set()
+    # Os que esperaram copiam do resultado guardado; o líder não pode alterá-lo
+    return _copiar_frames(voo.resultado) if esperando else voo.resultado
+
+
+def metricas_leituras():
+    """Contadores do processo: leituras feitas na API e leituras atendidas por outra igual em andamento."""
+    with _lock_voos:
+        return dict(_metricas_voos)
+
+
+@traduzir_falhas
+def ler_abas(abas, chave=None, titulo=None, exportar=None):
+    """
+    Lê as abas informadas num único values.batchGet e devolve {aba: DataFrame}, cada um
+    igual ao pd.DataFrame(get_all_records()) da aba. `abas` é uma lista de abas (índices
+    ou nomes) ou um dict {aba: modo}, em que o modo é None (aba inteira), uma lista de
+    colunas (só elas são baixadas) ou INCREMENTAL (só as linhas novas desde a última leitura).
+    O valor também pode ser uma tupla (modo, tipos), com os tipos das colunas (ver
+    grade_para_dataframe).
+
+    Com `exportar` (por padrão, a opção `leitura_exportada` do secrets), as cargas em que
+    todas as abas seriam lidas inteiras usam a exportação XLSX (ver ler_exportacao).
+    Uma leitura igual já em andamento em outra sessão é aproveitada (ver _em_voo).
+    Com o espelho local ativo, as abas (inteiras ou por colunas) cujo espelho está na
+    versão atual da planilha são lidas do disco, e as baixadas inteiras vão para ele.
+    """
+    if chave is None:
+        chave = resolver_id_planilha(titulo) if titulo else st.secrets["sheet_id"]
+    leituras = _leituras(abas)
+    for aba in leituras:
+        _registrar_dependencia(chave, aba)
+    if exportar is None:
+        exportar = leitura_exportada_ativa()
+    espelho = obter_espelho()
+    versao = versao_planilha(chave) if espelho is not None else None
+    espelhadas = _ler_espelho(espelho, chave, leituras, versao) if versao is not None else {}
+    pendentes = {aba: spec for aba, spec in leituras.items() if aba not in espelhadas}
+    if not pendentes:
+        return espelhadas
+    baixadas = _em_voo(
+        _chave_voo(chave, pendentes, exportar), lambda: _baixar_abas(chave, pendentes, exportar, versao)
+    )
+    if not espelhadas:
+        return baixadas
+    return {aba: espelhadas[aba] if aba in espelhadas else baixadas[aba] for aba in leituras}
+
+
+def _ler_espelho(espelho, chave, leituras, versao):
+    """{aba: DataFrame} das abas de `leituras` (exceto INCREMENTAL) com espelho na `versao`."""
+    frames = {}
+    for aba, (modo, tipos) in leituras.items():
+        if modo == INCREMENTAL:
+            continue
+        grade = espelho.ler(chave, obter_aba(aba, chave).title, versao, colunas=modo)
+        if grade is None:
+            continue
+        df = grade_para_dataframe(grade, tipos)
+        frames[aba] = df if modo is None else df[[col for col in modo if col in df.columns]]
+    return frames
+
+
+def _guardando_no_espelho(chave, nome, versao, montar):
+    """`montar` de uma leitura da aba inteira que antes guarda a grade baixada no espelho."""
+    espelho = obter_espelho()
+
+    def montar_e_guardar(grades):
+        espelho.guardar(chave, nome, grades[0], versao)
+        return montar(grades)
+    return montar_e_guardar
+
+
+def _baixar_abas(chave, pendentes, exportar, versao=None):
+    if exportar and not any(
+        _estado_incremental(chave, aba)[1] for aba, (modo, _) in pendentes.items() if modo == INCREMENTAL
+    ):
+        try:
+            return ler_exportacao(pendentes, chave, versao=versao)
+        except (requests.RequestException, GoogleAuthError, zipfile.BadZipFile, KeyError, IndexError):
+            pass
+
+    resultado = {}
+    for tentativa in range(2):
+        intervalos, montagens = [], []
+        for aba, (modo, tipos) in pendentes.items():
+            nome = obter_aba(aba, chave).title
+            faixas, montar = _plano_leitura(chave, aba, nome, modo, tipos, completa=tentativa > 0)
+            if modo is None and versao is not None:
+                montar = _guardando_no_espelho(chave, nome, versao, montar)
+            montagens.append((aba, len(faixas), montar))
+            intervalos += faixas
+
+        resposta = abrir_planilha(chave).values_batch_get(intervalos) if intervalos else {}
+        grades = [intervalo.get('values', []) for intervalo in resposta.get('valueRanges', [])]
+
+        # Abas cuja leitura parcial não conferiu vão numa segunda requisição, completas
+        repetir, posicao = {}, 0
+        for aba, quantidade, montar in montagens:
+            frame = montar(grades[posicao:posicao + quantidade])
+            posicao += quantidade
+            if frame is None:
+                repetir[aba] = pendentes[aba]
+            else:
+                resultado[aba] = frame
+        pendentes = repetir
+        if not pendentes:
+            break
+    return resultado
+
+
+def _contador_aba(contadores, chave, aba):
+    """Contadores (da aba e o externo da planilha) nos `contadores` do barramento (ver barramento.py)."""
+    return contadores.get(nome_aba(chave, obter_aba(aba, chave).id), 0), contadores.get(nome_externo(chave), 0)
+
+
+def _chave_leitura(aba, modo, chave, titulo):
+    if modo is None or modo == INCREMENTAL:
+        projecao = modo or "*"
+    else:
+        projecao = ",".join(modo)
+    return f"{_chave_sessao('_leitura', aba, chave, titulo)}::{projecao}"
+
+
+@traduzir_falhas
+def ler_aba(aba, chave=None, titulo=None, grupo=(), colunas=None, incremental=False, tipos=None, exportar=None):
+    """
+    DataFrame com os registros da aba (só de `colunas`, se informadas, ou só das linhas
+    novas somadas às já lidas, com `incremental`), com as colunas de `tipos` já convertidas.
+    As abas de `grupo` (lista ou dict {aba: modo} / {aba: (modo, tipos)} com as outras que a
+    página vai ler em seguida) vêm no mesmo batchGet e ficam guardadas na sessão para os
+    próximos loaders. Dentro de um loader compartilhado entre as sessões
+    (recarregar_se_mudou com `compartilhado=True`) a sessão não é usada: o `grupo` é
+    ignorado e só a aba pedida é lida. `exportar` escolhe a leitura pela exportação XLSX
+    (ver ler_abas).
+    """
+    modo = INCREMENTAL if incremental else colunas
+    if getattr(_dependencias, "compartilhada", False):
+        return ler_abas({aba: (modo, tipos)}, chave, titulo, exportar)[aba]
+
+    id_planilha = chave or (resolver_id_planilha(titulo) if titulo else st.secrets["sheet_id"])
+    contadores = obter_barramento().contadores()
+    guardado = st.session_state.pop(_chave_leitura(aba, modo, chave, titulo), None)
+    # Uma gravação na aba depois da leitura agrupada (contador do barramento mudou) invalida o guardado
+    if (
+        guardado is not None
+        and time.monotonic() - guardado[0] < VALIDADE_LEITURA_AGRUPADA
+        and guardado[2] == _contador_aba(contadores, id_planilha, aba)
+    ):
+        _registrar_dependencia(id_planilha, aba)
+        return guardado[1]
+
+    outras = _leituras(grupo)
+    outras.pop(aba, None)
+    frames = ler_abas({aba: (modo, tipos), **outras}, chave, titulo, exportar)
+    agora = time.monotonic()
+    for outra, (modo_outra, _) in outras.items():
+        st.session_state[_chave_leitura(outra, modo_outra, chave, titulo)] = (
+            agora, frames[outra], _contador_aba(contadores, id_planilha, outra)
+        )
+    return frames[aba]
+
+
+def limpar_handles():
+    """Descarta os handles em cache (por exemplo, após renomear ou recriar abas)."""
+    _cabecalho_aba.clear()
+    _sincronias().clear()
+    with _lock_titulos:
+        _titulos.clear()
+    _obter_aba_cacheada.clear()
+    abrir_planilha.clear()
+    resolver_id_planilha.clear()
+
+
+# --- Escrita por diferença (delta) ---
+# O snapshot guarda, por sessão, a grade exatamente como foi carregada (cabeçalho + linhas
+# já serializadas). Ao salvar, só as células que mudaram em relação a ele são enviadas,
+# num único values.batchUpdate, sem o clear() que deixava a aba vazia durante a gravação.
+
+def _chave_sessao(prefixo, aba, chave, titulo):
+    if chave is None:
+        chave = resolver_id_planilha(titulo) if titulo else st.secrets["sheet_id"]
+    return f"{prefixo}::{chave}::{aba}"
+
+
+def _chave_snapshot(aba, chave, titulo):
+    return _chave_sessao("_snapshot_planilha", aba, chave, titulo)
+
+
+def grade_valores(df):
+    """Converte o DataFrame (já serializado) em lista de linhas, com vazios no lugar de NaN/NaT."""
+    if df.empty:
+        return []
+    return df.astype(object).where(pd.notna(df), '').values.tolist()
+
+
+def registrar_snapshot(df, aba, chave=None, titulo=None):
+    """Guarda o estado carregado da aba para as próximas gravações por diferença."""
+    st.session_state[_chave_snapshot(aba, chave, titulo)] = (list(df.columns), grade_valores(df))
+
+
+def _agrupar_trechos(trechos):
+    """
+    Agrupa trechos de linha (linha, col_ini, col_fim, valores) em intervalos
+    [linha_ini, linha_fim, col_ini, col_fim, valores]: linhas consecutivas com o mesmo
+    intervalo de colunas viram um único bloco. Tudo 0-based e inclusivo, a partir da
+    primeira linha de dados.
+    """
+    intervalos = []
+    for linha, col_ini, col_fim, valores in trechos:
+        ultimo = intervalos[-1] if intervalos else None
+        if ultimo and ultimo[1] == linha - 1 and ultimo[2] == col_ini and ultimo[3] == col_fim:
+            ultimo[1] = linha
+            ultimo[4].append(valores)
+        else:
+            intervalos.append([linha, linha, col_ini, col_fim, [valores]])
+    return intervalos
+
+
+def _gravar(worksheet, enviar, alteracao, nova=False, destino=None):
+    """
+    Faz a gravação `enviar()` na aba, devolve o resultado dela e a publica no barramento
+    (ver barramento.py). Com espelho ou barramento entre processos, o estado da aba no
+    barramento e a versão da planilha são lidos antes e a versão de novo depois; se nenhuma
+    outra gravação dos painéis entrou na aba no meio e o espelho estava na versão de antes,
+    `alteracao(grade)` é aplicada a ele, que passa para a versão de depois, e senão o
+    espelho da aba é descartado. A chamada à API fica fora do lock do barramento: só a
+    publicação e o espelho ficam dentro. Com `nova` (a aba acabou de ser criada), a
+    gravação conta também como mudança de fora na planilha. Com `destino` (ver
+    destino_gravacao), o barramento e o espelho são os dele.
+    """
+    chave = worksheet.spreadsheet_id
+    if destino is None:
+        barramento, espelho = obter_barramento(), obter_espelho()
+    else:
+        barramento, espelho = destino.barramento, destino.espelho
+    # Sem espelho nem barramento entre processos as versões não servem a ninguém: só o
+    # contador da aba anda, e as cargas das outras abas são refeitas pela versão
+    sondar = espelho is not None or barramento.entre_processos
+    visto = antes = depois = None
+    em_dia = False
+    esquecer_versao(chave)
+    if sondar:
+        visto = barramento.estado(chave, worksheet.id)
+        antes = versao_planilha(chave, worksheet.client)
+        em_dia = espelho is not None and antes is not None and espelho.versao(chave, worksheet.title) == antes
+    resultado = enviar()
+    esquecer_versao(chave)
+    if sondar:
+        depois = versao_planilha(chave, worksheet.client)
+    with barramento.registro():
+        sozinha = barramento.publicar_escrita(chave, worksheet.id, visto, antes, depois, externa=nova)
+        if espelho is not None:
+            if em_dia and sozinha and depois is not None:
+                espelho.alterar(chave, worksheet.title, depois, alteracao)
+            else:
+                espelho.descartar(chave, worksheet.title)
+    return resultado
+
+
+def _enviar_intervalos(worksheet, intervalos, value_input_option, destino=None):
+    """Envia todos os intervalos num único values.batchUpdate e retorna o total de células."""
+    if intervalos:
+        esquecer_sincronia(worksheet)
+
+        def alteracao(grade):
+            for lin_ini, _, col_ini, _, valores in intervalos:
+                escrever_bloco(grade, lin_ini + 1, col_ini, valores, value_input_option)
+        _gravar(worksheet, lambda: worksheet.batch_update([
+            {
+                # +2: linhas da planilha são 1-based e a primeira é o cabeçalho
+                'range': f"{rowcol_to_a1(lin_ini + 2, col_ini + 1)}:{rowcol_to_a1(lin_fim + 2, col_fim + 1)}",
+                'values': valores,
+            }
+            for lin_ini, lin_fim, col_ini, col_fim, valores in intervalos
+        ], value_input_option=value_input_option), alteracao, destino=destino)
+    return sum((i[1] - i[0] + 1) * (i[3] - i[2] + 1) for i in intervalos)
+
+
+def _diferencas(linhas_antigas, linhas_novas, num_colunas):
+    """Intervalos em que `linhas_novas` difere de `linhas_antigas`, célula a célula."""
+    vazia = [''] * num_colunas
+    trechos = []
+    for i in range(max(len(linhas_antigas), len(linhas_novas))):
+        antiga = linhas_antigas[i] if i < len(linhas_antigas) else vazia
+        nova = linhas_novas[i] if i < len(linhas_novas) else vazia
+        j = 0
+        while j < num_colunas:
+            if antiga[j] == nova[j]:
+                j += 1
+                continue
+            inicio = j
+            while j < num_colunas and antiga[j] != nova[j]:
+                j += 1
+            trechos.append((i, inicio, j - 1, nova[inicio:j]))
+    return _agrupar_trechos(trechos)
+
+
+def _garantir_dimensoes(worksheet, linhas, colunas):
+    """Amplia a grade da aba quando a escrita passaria do limite atual."""
+    if linhas > worksheet.row_count:
+        worksheet.add_rows(linhas - worksheet.row_count)
+    if colunas > worksheet.col_count:
+        worksheet.add_cols(colunas - worksheet.col_count)
+
+
+def _salvar_por_id(worksheet, cabecalho, linhas_antigas, linhas, value_input_option):
+    """
+    Gravação por diferença numa aba com a coluna de ID: cada linha de `linhas` é comparada
+    com a de mesmo ID no snapshot, e as células alteradas vão para a posição que a linha
+    tem agora na aba, lida da coluna de IDs (outras sessões podem ter incluído ou apagado
+    linhas desde a carga). IDs que não estavam no snapshot são anexados no fim da aba; os que
+    não estão em `linhas` ficam como estão (`df` pode ser só parte da aba, por exemplo
+    filtrado): para apagar linhas, use apagar_por_id. Retorna o número de células enviadas.
+    """
+    coluna = cabecalho.index(COLUNA_ID)
+    if any(linha[coluna] == '' for linha in linhas):
+        # Sem o ID a linha seria anexada de novo a cada gravação
+        raise KeyError(f"Há linhas sem {COLUNA_ID}: gere os IDs das linhas novas com com_ids")
+    antigas = {str(linha[coluna]): linha for linha in linhas_antigas if linha[coluna] != ''}
+    alteracoes, novas = {}, []
+    for linha in linhas:
+        antiga = antigas.get(str(linha[coluna]))
+        if antiga is None:
+            novas.append(linha)
+        elif antiga != linha:
+            alteracoes[str(linha[coluna])] = {
+                nome: valor for nome, valor, anterior in zip(cabecalho, linha, antiga) if valor != anterior
+            }
+    if not alteracoes and not novas:
+        return 0
+
+    cabecalho_aba, posicoes = _ids_da_aba(worksheet)
+    _conferir_ids(cabecalho_aba, posicoes, alteracoes)
+    faltando = [col for col in cabecalho if col not in cabecalho_aba]
+    if novas and faltando:
+        raise KeyError(f"Colunas inexistentes na aba: {faltando}")
+
+    celulas = _enviar_intervalos(
+        worksheet, _agrupar_trechos(_trechos_por_id(cabecalho_aba, posicoes, alteracoes)), value_input_option
+    )
+    if novas:
+        df_novas = pd.DataFrame(novas, columns=cabecalho).reindex(columns=cabecalho_aba, fill_value='')
+        _anexar_grade(worksheet, grade_valores(df_novas), value_input_option)
+        celulas += len(novas) * len(cabecalho_aba)
+    return celulas
+
+
+def _mesclar_por_id(coluna, linhas_antigas, linhas):
+    """`linhas_antigas` com as de mesmo ID trocadas pelas de `linhas`, e as demais de `linhas` no fim."""
+    novas = {str(linha[coluna]): linha for linha in linhas}
+    mescladas = [novas.pop(str(linha[coluna]), linha) for linha in linhas_antigas]
+    return mescladas + list(novas.values())
+
+
+@traduzir_falhas
+def salvar_alteracoes(df, aba, chave=None, titulo=None, value_input_option='USER_ENTERED'):
+    """
+    Grava na aba apenas as células de `df` (já serializado) que diferem do snapshot.
+    Nas abas com a coluna de ID, as linhas são encontradas pelo ID no momento da gravação
+    (ver _salvar_por_id); nas demais, pela posição em que foram carregadas.
+    Sem snapshot ou com cabeçalho diferente, reescreve a grade inteira sobre a antiga
+    (sem limpar antes). Retorna o número de células enviadas.
+    """
+    worksheet = obter_aba(aba, chave, titulo)
+    chave_snapshot = _chave_snapshot(aba, chave, titulo)
+    cabecalho = list(df.columns)
+    linhas = grade_valores(df)
+    num_colunas = len(cabecalho)
+
+    cabecalho_antigo, linhas_antigas = st.session_state.get(chave_snapshot, (None, None))
+
+    if cabecalho_antigo == cabecalho and COLUNA_ID in cabecalho:
+        celulas = _salvar_por_id(worksheet, cabecalho, linhas_antigas, linhas, value_input_option)
+        # `df` pode ser só parte da aba: o snapshot continua com as linhas que ficaram de fora
+        linhas = _mesclar_por_id(cabecalho.index(COLUNA_ID), linhas_antigas, linhas)
+    elif cabecalho_antigo == cabecalho:
+        intervalos = _diferencas(linhas_antigas, linhas, num_colunas)
+        if intervalos:
+            _garantir_dimensoes(worksheet, len(linhas) + 1, num_colunas)
+        celulas = _enviar_intervalos(worksheet, intervalos, value_input_option)
+    else:
+        # Sobrescreve a área antiga com vazios em vez de limpar a aba antes
+        grade = [cabecalho] + linhas
+        altura = max(len(grade), len(linhas_antigas or []) + 1)
+        largura = max(num_colunas, len(cabecalho_antigo or []))
+        grade = [linha + [''] * (largura - len(linha)) for linha in grade]
+        grade += [[''] * largura for _ in range(altura - len(grade))]
+        _garantir_dimensoes(worksheet, altura, largura)
+        esquecer_sincronia(worksheet)
+        # Sem snapshot não sabemos o tamanho anterior: remove o que sobrar abaixo
+        limpar_abaixo = linhas_antigas is None and worksheet.row_count > altura
+
+        def enviar():
+            worksheet.update(grade, 'A1', value_input_option=value_input_option)
+            if limpar_abaixo:
+                worksheet.batch_clear([f"A{altura + 1}:{rowcol_to_a1(worksheet.row_count, largura)}"])
+
+        def alteracao(grade_espelho):
+            escrever_bloco(grade_espelho, 0, 0, grade, value_input_option)
+            if limpar_abaixo:
+                del grade_espelho[altura:]
+        _gravar(worksheet, enviar, alteracao)
+        celulas = altura * largura
+
+    st.session_state[chave_snapshot] = (cabecalho, linhas)
+    return celulas
+
+
+def _anexar_grade(worksheet, linhas, value_input_option):
+    """Insere `linhas` (já na ordem das colunas da aba) no fim da aba, num único append."""
+    _gravar(
+        worksheet,
+        lambda: worksheet.append_rows(
+            linhas,
+            value_input_option=value_input_option,
+            insert_data_option='INSERT_ROWS',
+            table_range='A1',
+        ),
+        lambda grade: escrever_bloco(grade, len(grade), 0, linhas, value_input_option),
+    )
+
+
+def _apagar_linhas(worksheet, posicoes):
+    """Apaga da aba as linhas de dados nas `posicoes` (0 = logo abaixo do cabeçalho), num único batchUpdate."""
+    faixas = []
+    for posicao in sorted(set(posicoes)):
+        if faixas and faixas[-1][1] == posicao:
+            faixas[-1][1] += 1
+        else:
+            faixas.append([posicao, posicao + 1])
+    esquecer_sincronia(worksheet)
+
+    def alteracao(grade):
+        for inicio, fim in reversed(faixas):
+            del grade[inicio + 1:fim + 1]
+    # +1: a linha 0 da aba é o cabeçalho; de baixo para cima, para que cada exclusão não
+    # desloque as seguintes
+    _gravar(worksheet, lambda: worksheet.spreadsheet.batch_update({"requests": [
+        {"deleteDimension": {"range": {
+            "sheetId": worksheet.id, "dimension": "ROWS", "startIndex": inicio + 1, "endIndex": fim + 1,
+        }}}
+        for inicio, fim in reversed(faixas)
+    ]}), alteracao)
+
+
+@traduzir_falhas
+def anexar_linhas(df, aba, chave=None, titulo=None, value_input_option='USER_ENTERED'):
+    """
+    Insere as linhas de `df` (já serializado) no fim da aba com append (INSERT_ROWS),
+    com custo proporcional às linhas novas e não ao tamanho da aba. As colunas são
+    alinhadas ao cabeçalho atual da aba; uma coluna que a aba não tem levanta KeyError,
+    sem gravar nada.
+    """
+    if df.empty:
+        return 0
+    worksheet = obter_aba(aba, chave, titulo)
+    cabecalho = worksheet.row_values(1) or list(df.columns)
+    if COLUNA_ID in cabecalho:
+        df = com_ids(df)
+    faltando = [col for col in df.columns if col not in cabecalho]
+    if faltando:
+        raise KeyError(f"Colunas inexistentes na aba: {faltando}")
+
+    linhas = grade_valores(df.reindex(columns=cabecalho, fill_value=''))
+    _anexar_grade(worksheet, linhas, value_input_option)
+
+    # Outra sessão pode ter anexado linhas desde a carga, então a posição das linhas novas
+    # não é conhecida: numa aba com IDs elas entram no snapshot, que na gravação seguinte é
+    # conferido pelos IDs (ver _salvar_por_id); numa aba sem IDs o snapshot é descartado
+    chave_snapshot = _chave_snapshot(aba, chave, titulo)
+    cabecalho_snapshot, linhas_antigas = st.session_state.get(chave_snapshot, (None, None))
+    if linhas_antigas is not None and COLUNA_ID in cabecalho_snapshot:
+        linhas_antigas.extend(grade_valores(df.reindex(columns=cabecalho_snapshot, fill_value='')))
+    else:
+        st.session_state.pop(chave_snapshot, None)
+    return len(linhas)
+
+
+@traduzir_falhas
+def apagar_por_id(ids, aba, chave=None, titulo=None):
+    """
+    Apaga da aba as linhas com os `ids` informados, encontradas pela coluna de IDs na hora
+    da gravação, num único batchUpdate. IDs que não estão mais na aba (outra sessão já os
+    apagou) são ignorados. É a única forma de apagar linhas: salvar_alteracoes nunca apaga
+    as que faltam no DataFrame. Retorna o número de linhas apagadas.
+    """
+    ids = {str(id_) for id_ in ids}
+    if not ids:
+        return 0
+    worksheet = obter_aba(aba, chave, titulo)
+    _, posicoes = _ids_da_aba(worksheet)
+    apagadas = [posicoes[id_] for id_ in ids if id_ in posicoes]
+    if apagadas:
+        _apagar_linhas(worksheet, apagadas)
+    return len(apagadas)
+
+
+@traduzir_falhas
+def criar_aba(titulo, linhas, chave=None, value_input_option='USER_ENTERED', formatar=None):
+    """
+    Cria na planilha a aba `titulo` com as `linhas` (a primeira é o cabeçalho), com a coluna
+    de IDs oculta e, com `formatar(id da aba, cabeçalho)`, as requisições de formato que ele
+    devolver. A escrita passa pelo _gravar, como as outras; a criação em si muda a lista de
+    abas, e não uma aba conhecida, e o barramento a conta como mudança de fora: as cargas
+    da planilha são refeitas, e as que listam as abas passam a ver a nova. Retorna a aba.
+    """
+    planilha = abrir_planilha(chave or st.secrets["sheet_id"])
+    cabecalho = linhas[0]
+    worksheet = planilha.add_worksheet(titulo, rows=len(linhas), cols=len(cabecalho))
+    formatos = formatar(worksheet.id, cabecalho) if formatar else []
+    oculta = cabecalho.index(COLUNA_ID) if COLUNA_ID in cabecalho else None
+
+    def enviar():
+        worksheet.update(linhas, "A1", value_input_option=value_input_option)
+        if oculta is not None:
+            worksheet.hide_columns(oculta, oculta + 1)
+        if formatos:
+            planilha.batch_update({"requests": formatos})
+    _gravar(worksheet, enviar, lambda grade: escrever_bloco(grade, 0, 0, linhas, value_input_option), nova=True)
+    return worksheet
+
+
+# --- IDs estáveis de linha ---
+# Cada aba de dados tem uma coluna oculta (COLUNA_ID, de comum.py) com um ID imutável por
+# linha. Na gravação, a posição das linhas é lida da coluna de IDs da aba (uma leitura de
+# uma coluna), não das posições em que a sessão as carregou: outra sessão pode ter incluído,
+# apagado ou ordenado linhas desde então. Uma atualização pontual é um lookup no dicionário
+# e a escrita de um único intervalo, sem varrer o DataFrame procurando a linha.
+
+
+def gerar_ids(quantidade):
+    # O prefixo evita que o get_all_records converta um ID só com dígitos em número
+    return [f"R{uuid.uuid4().hex[:15]}" for _ in range(quantidade)]
+
+
+def com_ids(df):
+    """Cópia de `df` com a coluna de ID preenchida nas linhas que ainda não têm."""
+    df = df.copy()
+    if COLUNA_ID not in df.columns:
+        df[COLUNA_ID] = ''
+    ids = df[COLUNA_ID].fillna('').astype(str).str.strip().tolist()
+    novos = iter(gerar_ids(ids.count('')))
+    df[COLUNA_ID] = [id_ or next(novos) for id_ in ids]
+    return df
+
+
+@traduzir_falhas
+def garantir_ids(df, aba, chave=None, titulo=None):
+    """
+    Garante a coluna de ID na aba e em `df` (recém-lido com get_all_records, colunas na
+    ordem da aba). Na primeira vez cria a coluna oculta no fim da aba; linhas sem ID
+    (incluídas direto na planilha) recebem um novo. Retorna `df` com os IDs.
+    """
+    if df.columns.empty:
+        return df
+    nova_coluna = COLUNA_ID not in df.columns
+    faltando = [] if nova_coluna else df.index[df[COLUNA_ID].astype(str).str.strip() == ''].tolist()
+    if not nova_coluna and not faltando:
+        return df
+
+    worksheet = obter_aba(aba, chave, titulo)
+    df = com_ids(df)
+    coluna = df.columns.get_loc(COLUNA_ID)
+    if nova_coluna:
+        _garantir_dimensoes(worksheet, len(df) + 1, coluna + 1)
+        esquecer_sincronia(worksheet)
+        valores = [[COLUNA_ID]] + [[id_] for id_ in df[COLUNA_ID]]
+
+        def enviar():
+            worksheet.update(
+                valores,
+                f"{rowcol_to_a1(1, coluna + 1)}:{rowcol_to_a1(len(df) + 1, coluna + 1)}",
+                value_input_option='RAW',
+            )
+            worksheet.hide_columns(coluna, coluna + 1)
+        _gravar(worksheet, enviar, lambda grade: escrever_bloco(grade, 0, coluna, valores, 'RAW'))
+    else:
+        posicoes = [df.index.get_loc(i) for i in faltando]
+        trechos = [(pos, coluna, coluna, [df[COLUNA_ID].iat[pos]]) for pos in posicoes]
+        _enviar_intervalos(worksheet, _agrupar_trechos(trechos), 'RAW')
+    return df
+
+
+@traduzir_falhas
+def colunas_aba(aba, chave=None, titulo=None):
+    """Cabeçalho da aba, do snapshot da sessão quando houver."""
+    cabecalho, _ = st.session_state.get(_chave_snapshot(aba, chave, titulo), (None, None))
+    return cabecalho if cabecalho is not None else obter_aba(aba, chave, titulo).row_values(1)
+
+
+def posicoes_por_id(df, ids):
+    """
+    Posições (para o iloc) das linhas de `df` com os `ids`, pela coluna de ID. Levanta
+    KeyError, antes de qualquer alteração, se um dos `ids` não está em `df` ou se a coluna
+    tem IDs repetidos (uma linha copiada na planilha junto com o ID oculto, por exemplo).
+    """
+    indice = pd.Index(df[COLUNA_ID].astype(str))
+    if not indice.is_unique:
+        raise KeyError(f"IDs repetidos: {sorted(indice[indice.duplicated()].unique())}")
+    ids = pd.Index(ids).astype(str)
+    posicoes = indice.get_indexer(ids)
+    if (posicoes == -1).any():
+        raise KeyError(f"IDs inexistentes: {ids[posicoes == -1].tolist()}")
+    return posicoes
+
+
+@traduzir_falhas
+def atualizar_por_id(df, aba, chave=None, titulo=None, value_input_option='USER_ENTERED'):
+    """
+    Grava só as células de `df` (já serializado) nas linhas indicadas pelo índice, que é o
+    ID estável da linha, num único values.batchUpdate. A posição de cada linha é lida da
+    coluna de IDs da aba na hora da gravação, então vale mesmo que outra sessão tenha
+    incluído, apagado ou reordenado linhas depois da carga; um ID ou coluna que não existe
+    na aba levanta KeyError, sem gravar nada. Retorna o número de células enviadas.
+    """
+    if df.empty:
+        return 0
+    worksheet = obter_aba(aba, chave, titulo)
+    alteracoes = {str(id_): valores for id_, valores in zip(df.index, df.to_dict('records'))}
+    cabecalho, posicoes = _ids_da_aba(worksheet)
+    _conferir_ids(cabecalho, posicoes, alteracoes)
+    celulas = _enviar_intervalos(
+        worksheet, _agrupar_trechos(_trechos_por_id(cabecalho, posicoes, alteracoes)), value_input_option
+    )
+
+    # Reflete a escrita no snapshot (só as linhas tocadas), pelo ID
+    cabecalho_snapshot, linhas_antigas = st.session_state.get(_chave_snapshot(aba, chave, titulo), (None, None))
+    if linhas_antigas is not None and COLUNA_ID in cabecalho_snapshot:
+        coluna_id = cabecalho_snapshot.index(COLUNA_ID)
+        for linha in linhas_antigas:
+            for col, valor in alteracoes.get(str(linha[coluna_id]), {}).items():
+                if col in cabecalho_snapshot:
+                    linha[cabecalho_snapshot.index(col)] = _valor_celula(valor)
+    return celulas
+
+
+def _valor_celula(valor):
+    """Valor de uma célula para o JSON da API: vazio no lugar de NaN/NaT, tipos do numpy viram do Python."""
+    if pd.isna(valor):
+        return ''
+    return valor.item() if hasattr(valor, "item") else valor
+
+
+def _ids_da_aba(worksheet):
+    """
+    Cabeçalho atual da aba e ID -> posição atual de cada linha de dados (0 = logo abaixo do
+    cabeçalho), lidos da aba e não da sessão: valem mesmo que linhas tenham sido incluídas,
+    apagadas ou reordenadas depois da carga.
+    """
+    cabecalho = worksheet.row_values(1)
+    if COLUNA_ID not in cabecalho:
+        raise KeyError(f"A aba {worksheet.title!r} não tem a coluna {COLUNA_ID}")
+    ids = worksheet.col_values(cabecalho.index(COLUNA_ID) + 1)[1:]
+    return cabecalho, {str(id_): posicao for posicao, id_ in enumerate(ids) if id_ != ''}
+
+
+def _conferir_ids(cabecalho, posicoes, alteracoes):
+    """Levanta KeyError se alguma coluna ou ID de {ID: {coluna: valor}} não existe na aba."""
+    faltando = sorted({col for valores in alteracoes.values() for col in valores if col not in cabecalho})
+    if faltando:
+        raise KeyError(f"Colunas inexistentes na aba: {faltando}")
+    ausentes = [id_ for id_ in alteracoes if str(id_) not in posicoes]
+    if ausentes:
+        raise KeyError(f"IDs inexistentes na aba: {ausentes}")
+
+
+def _trechos_por_id(cabecalho, posicoes, alteracoes):
+    """Trechos (linha, col_ini, col_fim, valores) das células {ID: {coluna: valor}}, com as colunas vizinhas juntas."""
+    trechos = []
+    for id_, valores in alteracoes.items():
+        celulas = sorted((cabecalho.index(col), _valor_celula(valor)) for col, valor in valores.items())
+        for coluna, valor in celulas:
+            ultimo = trechos[-1] if trechos else None
+            if ultimo and ultimo[0] == posicoes[str(id_)] and ultimo[2] == coluna - 1:
+                ultimo[2] = coluna
+                ultimo[3].append(valor)
+            else:
+                trechos.append([posicoes[str(id_)], coluna, coluna, [valor]])
+    return sorted(tuple(trecho) for trecho in trechos)
+
+
+class CelulasIgnoradas(KeyError):
+    """
+    Parte das células de gravar_celulas ficou de fora porque o ID ou a coluna não existe
+    mais na aba; as demais foram gravadas. `ignoradas` tem as {ID: {coluna: valor}} de fora.
+    """
+
+    def __init__(self, mensagem, ignoradas):
+        super().__init__(mensagem)
+        self.ignoradas = ignoradas
+
+    def __str__(self):
+        return self.args[0]
+
+
+# Destino de gravação resolvido de antemão: o handle da aba e o barramento e o espelho do
+# processo, para gravar de uma thread própria (ver fila_gravacao.py), fora da execução da
+# página, sem passar pelo st.secrets nem pelo st.cache_resource
+Destino = namedtuple("Destino", ["worksheet", "barramento", "espelho"])
+
+
+def destino_gravacao(aba, chave=None, titulo=None):
+    """Destino para gravar_celulas na aba, resolvido agora (chamado na execução da página)."""
+    return Destino(obter_aba(aba, chave, titulo), obter_barramento(), obter_espelho())
+
+
+@traduzir_falhas
+def gravar_celulas(alteracoes, aba, chave=None, titulo=None, value_input_option='USER_ENTERED'):
+    """
+    Grava as células {ID: {coluna: valor}} (valores já serializados) num único
+    values.batchUpdate. Não usa a sessão: o cabeçalho e a coluna de IDs são lidos da aba a
+    cada chamada, então serve para gravações fora da execução da página (ver
+    fila_gravacao.py), com `aba` sendo um Destino. Retorna o número de células enviadas.
+
+    Células de IDs ou colunas que não existem mais na aba (linha apagada por outra sessão)
+    não impedem as outras: elas são gravadas e, no fim, CelulasIgnoradas lista as que
+    ficaram de fora.
+    """
+    if not alteracoes:
+        return 0
+    alvo = aba if isinstance(aba, Destino) else destino_gravacao(aba, chave, titulo)
+    worksheet = alvo.worksheet
+    cabecalho, posicoes = _ids_da_aba(worksheet)
+    gravaveis, ignoradas = {}, {}
+    for id_, valores in alteracoes.items():
+        for coluna, valor in valores.items():
+            destino = gravaveis if str(id_) in posicoes and coluna in cabecalho else ignoradas
+            destino.setdefault(id_, {})[coluna] = valor
+    celulas = _enviar_intervalos(
+        worksheet, _agrupar_trechos(_trechos_por_id(cabecalho, posicoes, gravaveis)), value_input_option, alvo
+    )
+    if ignoradas:
+        motivos = []
+        ausentes = [id_ for id_ in ignoradas if str(id_) not in posicoes]
+        if ausentes:
+            motivos.append(f"IDs inexistentes na aba: {ausentes}")
+        faltando = sorted({col for valores in ignoradas.values() for col in valores if col not in cabecalho})
+        if faltando:
+            motivos.append(f"Colunas inexistentes na aba: {faltando}")
+        raise CelulasIgnoradas(f"{'; '.join(motivos)} (as demais alterações foram gravadas)", ignoradas)
+    return celulas
+
+
+# --- Recarga condicionada à revisão da planilha ---
+# Antes de baixar as abas de novo, os loaders perguntam ao Drive a versão da planilha
+# (files.get com fields=modifiedTime,version, uma resposta de poucos bytes). Se ela não
+# mudou desde a última carga, o DataFrame já processado é reaproveitado.
+
+URL_ARQUIVO_DRIVE = "https://www.googleapis.com/drive/v3/files/{}"
+
+# Segundos em que a versão consultada vale para as demais abas da mesma execução
+INTERVALO_VERIFICACAO = 2
+
+_lock_revisao = threading.Lock()
+_versoes = {}
+_metricas_revisao = {"verificacoes": 0, "acertos": 0, "faltas": 0}
+
+
+def _contar_revisao(chave_metrica):
+    with _lock_revisao:
+        _metricas_revisao[chave_metrica] += 1
+
+
+def metricas_revisao():
+    """Contadores do processo: consultas de versão, cargas reaproveitadas (acertos) e refeitas (faltas)."""
+    with _lock_revisao:
+        return dict(_metricas_revisao)
+
+
+def versao_planilha(chave, cliente=None):
+    """
+    Versão atual da planilha no Drive, ou None se a consulta falhar. Com `cliente` (o do
+    handle já aberto), a consulta usa a sessão dele, sem passar pelo st.secrets.
+    """
+    agora = time.monotonic()
+    with _lock_revisao:
+        salvo = _versoes.get(chave)
+    if salvo and agora - salvo[0] < INTERVALO_VERIFICACAO:
+        return salvo[1]
+
+    try:
+        if cliente is None and planilhas_locais():
+            cliente = get_gspread_client()
+        if isinstance(cliente, ClienteMemoria):
+            versao = cliente.versao(chave)
+        else:
+            sessao = obter_sessao(tuple(SCOPES_PLANILHAS)) if cliente is None else cliente.http_client.session
+            resposta = sessao.get(
+                URL_ARQUIVO_DRIVE.format(chave),
+                params={"fields": "modifiedTime,version", "supportsAllDrives": "true"},
+            )
+            resposta.raise_for_status()
+            dados = resposta.json()
+            versao = f"{dados['version']}@{dados.get('modifiedTime', '')}"
+    except (requests.RequestException, GoogleAuthError, gspread.exceptions.APIError, KeyError, ValueError):
+        # Sem a versão a carga é sempre refeita, como antes
+        return None
+
+    with _lock_revisao:
+        _versoes[chave] = (agora, versao)
+        _metricas_revisao["verificacoes"] += 1
+    return versao
+
+
+def esquecer_versao(chave):
+    """Descarta a versão consultada há pouco (chamado antes de cada escrita)."""
+    with _lock_revisao:
+        _versoes.pop(chave, None)
+
+
+@st.cache_resource(show_spinner=False)
+def _cargas_compartilhadas():
+    return {}
+
+
+# Abas lidas pelo loader em execução nesta thread (None fora de um loader), para que a
+# carga guarde de quais abas depende, e se a carga é compartilhada entre as sessões (e
+# então não pode usar o session_state)
+_dependencias = threading.local()
+
+
+def _registrar_dependencia(chave, aba):
+    coletadas = getattr(_dependencias, "abas", None)
+    if coletadas is not None:
+        coletadas.update((nome_aba(chave, obter_aba(aba, chave).id), nome_externo(chave)))
+
+
+def _carga_valida(salvo, chave, versao):
+    """
+    Se a carga guardada ainda vale: nenhuma das abas que ela leu foi gravada desde então
+    (pelos contadores do barramento) e a planilha não mudou por fora dos painéis.
+    """
+    versao_carga, _, dependencias, contadores = salvo
+    if not dependencias:
+        return versao == versao_carga
+    barramento = obter_barramento()
+    atuais = barramento.contadores()
+    if any(atuais.get(nome, 0) != contadores.get(nome, 0) for nome in dependencias):
+        return False
+    # Versão diferente da carga, mas igual à deixada pela última gravação dos painéis: as
+    # mudanças desde a carga foram gravações em outras abas
+    return versao == versao_carga or str(versao) == barramento.base(chave)
+
+
+def _copiar_carga(resultado):
+    return _copiar_frames(resultado) if isinstance(resultado, dict) else resultado.copy()
+
+
+def recarregar_se_mudou(chave=None, titulo=None, compartilhado=False):
+    """
+    Decorador para os loaders: a função só roda de novo quando uma das abas que ela leu foi
+    gravada (ver barramento.py) ou a planilha mudou por fora dos painéis desde a última
+    chamada com os mesmos argumentos; senão devolve uma cópia do resultado guardado (um
+    DataFrame ou um dict de DataFrames). O resultado fica no session_state, ou vale para o
+    processo inteiro com `compartilhado=True`.
+
+    Quando a carga guardada é reaproveitada a função não roda: o loader não deve ter outros
+    efeitos além de ler (gravar IDs, guardar snapshots ou índices na sessão), que ficam
+    para quem o chama.
+    """
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def envoltorio(*args, **kwargs):
+            id_planilha = chave or (resolver_id_planilha(titulo) if titulo else st.secrets["sheet_id"])
+            versao = versao_planilha(id_planilha)
+            nome = f"_carga::{funcao.__qualname__}::{args!r}::{kwargs!r}"
+            # Dentro de um loader compartilhado, a carga também fica fora da sessão
+            compartilhada = compartilhado or getattr(_dependencias, "compartilhada", False)
+            cargas = _cargas_compartilhadas() if compartilhada else st.session_state
+
+            salvo = cargas.get(nome)
+            if versao is not None and salvo is not None and _carga_valida(salvo, id_planilha, versao):
+                _contar_revisao("acertos")
+                if getattr(_dependencias, "abas", None) is not None:
+                    _dependencias.abas.update(salvo[2])
+                return _copiar_carga(salvo[1])
+
+            _contar_revisao("faltas")
+            # Contadores lidos antes da carga: uma gravação durante ela refaz a próxima
+            contadores = obter_barramento().contadores()
+            externas = getattr(_dependencias, "abas", None)
+            de_fora = getattr(_dependencias, "compartilhada", False)
+            _dependencias.abas = set()
+            _dependencias.compartilhada = compartilhada
+            try:
+                # Falhas de leitura saem como FalhaPlanilha e não chegam a ser guardadas
+                resultado = funcao(*args, **kwargs)
+                dependencias = _dependencias.abas
+            finally:
+                _dependencias.abas = externas
+                _dependencias.compartilhada = de_fora
+            if externas is not None:
+                # Loader chamado dentro de outro: o de fora também depende dessas abas
+                externas.update(dependencias)
+            if versao is not None:
+                cargas[nome] = (versao, resultado, frozenset(dependencias), contadores)
+                return _copiar_carga(resultado)
+            return resultado
+        return envoltorio
+    return decorador
+
+
+def limpar_cargas(*loaders):
+    """
+    Força a próxima chamada dos `loaders` informados (funções decoradas com
+    recarregar_se_mudou) a baixar as abas de novo; sem argumentos, de todos.
+    """
+    prefixos = tuple(f"_carga::{loader.__qualname__}::" for loader in loaders) or ("_carga::",)
+    compartilhadas = _cargas_compartilhadas()
+    for nome in [n for n in list(compartilhadas) if n.startswith(prefixos)]:
+        del compartilhadas[nome]
+    for nome in [n for n in st.session_state.keys() if str(n).startswith(prefixos)]:
+        del st.session_state[nome]
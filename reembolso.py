@@ -8,9 +8,12 @@ import os
 from pandas.errors import EmptyDataError
 import plotly.express as px
 import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseUpload
+from planilhas import (
+    construir_servico, anexar_linhas, COLUNA_ID, com_ids, garantir_ids, ler_aba,
+    FalhaPlanilha, exibir_falha,
+)
+from esquemas import REEMBOLSOS, USUARIOS
 import base64
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
@@ -141,62 +144,44 @@ def load_logo(url):
 SHEET_ID = st.secrets["sheet_id"]
 PASTA_DRIVE_ID = "1FyHsl2dR9kMiRvBhp0i_WV1fvYgEeNPY"
 
-# Conexão com Google Sheets (gspread)
-@st.cache_resource(ttl=3600)
-def get_gspread_client():
-    creds = ServiceAccountCredentials.from_json_keyfile_dict(
-        st.secrets["gcp_service_account"],
-        ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    )
-    return gspread.authorize(creds)
-
+# A conexão com o Google Sheets (gspread) é compartilhada via planilhas.obter_aba
 # Conexão com Google Drive e Gmail API
 @st.cache_resource(ttl=3600)
 def get_google_api_service():
-    creds = ServiceAccountCredentials.from_json_keyfile_dict(
-        st.secrets["gcp_service_account"],
-        ['https://www.googleapis.com/auth/drive', 'https://www.googleapis.com/auth/gmail.send']
-    )
-    drive_service = build('drive', 'v3', credentials=creds)
-    gmail_service = build('gmail', 'v1', credentials=creds)
+    scopes = ['https://www.googleapis.com/auth/drive', 'https://www.googleapis.com/auth/gmail.send']
+    drive_service = construir_servico('drive', 'v3', scopes)
+    gmail_service = construir_servico('gmail', 'v1', scopes)
     return drive_service, gmail_service
 
-gs_client = get_gspread_client()
 drive_service, gmail_service = get_google_api_service()
 
 
+# Os loaders levantam FalhaPlanilha quando a planilha não pode ser lida (um DataFrame vazio
+# liberaria cadastros duplicados e seria gravado por cima da aba); só a aba inexistente
+# vira um DataFrame vazio.
 def carregar_dados_usuarios():
     try:
-        sheet = gs_client.open_by_key(SHEET_ID).worksheet("Usuarios")
-        data = sheet.get_all_records()
-        df = pd.DataFrame(data)
-        return df
+        # Matrícula, e-mail e senha vêm como texto, como foram digitados no cadastro
+        return USUARIOS.preparar(ler_aba("Usuarios", chave=SHEET_ID, tipos=USUARIOS.tipos))
     except gspread.exceptions.WorksheetNotFound:
         st.error("A planilha 'Usuarios' não foi encontrada. Certifique-se de que ela existe na planilha 'despesas'.")
-        return pd.DataFrame(columns=['Nome', 'Matricula', 'Email', 'Senha'])
-    except Exception as e:
-        st.error(f"Erro ao carregar dados de usuários: {e}")
-        return pd.DataFrame(columns=['Nome', 'Matricula', 'Email', 'Senha'])
+        return USUARIOS.vazio()
 
 def carregar_dados_reembolsos():
     try:
-        sheet = gs_client.open_by_key(SHEET_ID).worksheet("Reembolsos")
-        data = sheet.get_all_records()
-        df = pd.DataFrame(data)
-        return df
+        # A aba só cresce no fim: baixa apenas as linhas novas desde a última leitura
+        return garantir_ids(
+            ler_aba("Reembolsos", chave=SHEET_ID, incremental=True, tipos=REEMBOLSOS.tipos), "Reembolsos", chave=SHEET_ID
+        )
     except gspread.exceptions.WorksheetNotFound:
         st.error("A planilha 'Reembolsos' não foi encontrada. Certifique-se de que ela existe na planilha 'despesas'.")
-        return pd.DataFrame(columns=['DATA', 'NOME', 'DEPARTAMENTO', 'TIPO_DESPESA', 'VALOR', 'JUSTIFICATIVA', 'STATUS', 'ID_COMPROVANTE'])
-    except Exception as e:
-        st.error(f"Erro ao carregar dados de reembolsos: {e}")
-        return pd.DataFrame(columns=['DATA', 'NOME', 'DEPARTAMENTO', 'TIPO_DESPESA', 'VALOR', 'JUSTIFICATIVA', 'STATUS', 'ID_COMPROVANTE'])
+        return REEMBOLSOS.vazio()
 
 
-def salvar_dados_reembolsos(df):
+def anexar_dados_reembolsos(df_novos):
     try:
-        sheet = gs_client.open_by_key(SHEET_ID).worksheet("Reembolsos")
-        sheet.clear()
-        sheet.update([df.columns.values.tolist()] + df.values.tolist())
+        # Inserção pura: só as linhas novas vão para o fim da aba
+        anexar_linhas(df_novos, "Reembolsos", chave=SHEET_ID, value_input_option='RAW')
         return True
     except Exception as e:
         st.error(f"Erro ao salvar dados na planilha do Google: {e}")
@@ -204,7 +189,10 @@ def salvar_dados_reembolsos(df):
 
 # --- Lógica de Login e Cadastro (Google Sheets) ---
 def cadastrar_usuario(nome, matricula, email, senha):
-    df_usuarios = carregar_dados_usuarios()
+    try:
+        df_usuarios = carregar_dados_usuarios()
+    except FalhaPlanilha as e:
+        exibir_falha(e)
     
     email_limpo = email.strip()
     matricula_limpa = matricula.strip()
@@ -222,12 +210,9 @@ def cadastrar_usuario(nome, matricula, email, senha):
         'Email': email_limpo,
         'Senha': senha
     }])
-    df_usuarios = pd.concat([df_usuarios, novo_usuario], ignore_index=True)
     
     try:
-        sheet = gs_client.open_by_key(SHEET_ID).worksheet("Usuarios")
-        sheet.clear()
-        sheet.update([df_usuarios.columns.values.tolist()] + df_usuarios.values.tolist())
+        anexar_linhas(novo_usuario, "Usuarios", chave=SHEET_ID, value_input_option='RAW')
         st.success("🎉 Cadastro realizado com sucesso! Você já pode fazer login.")
         return True
     except Exception as e:
@@ -235,7 +220,10 @@ def cadastrar_usuario(nome, matricula, email, senha):
         return False
 
 def fazer_login(email, senha):
-    df_usuarios = carregar_dados_usuarios()
+    try:
+        df_usuarios = carregar_dados_usuarios()
+    except FalhaPlanilha as e:
+        exibir_falha(e)
     
     if not df_usuarios.empty:
         df_usuarios['Email'] = df_usuarios['Email'].astype(str).str.strip()
@@ -373,7 +361,10 @@ else:
 
     # Carregamento dos dados
     if 'df_reembolsos' not in st.session_state:
-        st.session_state.df_reembolsos = carregar_dados_reembolsos()
+        try:
+            st.session_state.df_reembolsos = carregar_dados_reembolsos()
+        except FalhaPlanilha as e:
+            exibir_falha(e)
 
     st.sidebar.write(f"**Bem-vindo, {st.session_state.get('nome_colaborador', 'Gestor')}!**")
     st.sidebar.title("Menu de Navegação")
@@ -505,10 +496,10 @@ else:
                             }
                             novos_registros.append(novo_registro)
                         
-                        df_novos_registros = pd.DataFrame(novos_registros)
-                        st.session_state.df_reembolsos = pd.concat([st.session_state.df_reembolsos, df_novos_registros], ignore_index=True)
+                        df_novos_registros = com_ids(pd.DataFrame(novos_registros))
 
-                        if salvar_dados_reembolsos(st.session_state.df_reembolsos):
+                        if anexar_dados_reembolsos(df_novos_registros):
+                            st.session_state.df_reembolsos = pd.concat([st.session_state.df_reembolsos, df_novos_registros], ignore_index=True)
                             st.success("🎉 Todas as solicitações de reembolso foram registradas com sucesso!")
                             
                             # Envio de e-mails
@@ -531,7 +522,7 @@ else:
                             Olá,<br><br>
                             Um novo reembolso foi registrado por {st.session_state.nome_colaborador} ({st.session_state.depto_form}).<br><br>
                             **Detalhes do(s) Reembolso(s):**<br>
-                            {df_novos_registros.to_html(index=False)}<br><br>
+                            {df_novos_registros.drop(columns=[COLUNA_ID]).to_html(index=False)}<br><br>
                             Acesse o sistema para analisar as solicitações.<br><br>
                             Atenciosamente,<br>
                             Sistema de Reembolsos
@@ -550,7 +541,7 @@ else:
         if not df_reembolsos_usuario.empty:
             df_usuario = df_reembolsos_usuario.copy()
             df_usuario['VALOR'] = df_usuario['VALOR'].apply(lambda x: f"R$ {x:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."))
-            st.dataframe(df_usuario, use_container_width=True)
+            st.dataframe(df_usuario, use_container_width=True, column_config={COLUNA_ID: None})
         else:
             st.info("Você ainda não enviou nenhuma solicitação de reembolso.")
 
@@ -653,7 +644,8 @@ else:
                         "Comprovante",
                         help="Clique para baixar o comprovante",
                         display_text="📥 Download"
-                    )
+                    ),
+                    COLUNA_ID: None
                 }
             )
 
@@ -676,7 +668,10 @@ else:
 
         st.subheader("Manutenção de Dados")
         if st.button("🔄 Recarregar Dados"):
-            st.session_state.df_reembolsos = carregar_dados_reembolsos()
+            try:
+                st.session_state.df_reembolsos = carregar_dados_reembolsos()
+            except FalhaPlanilha as e:
+                exibir_falha(e)
             st.success("Dados recarregados com sucesso!")
             st.rerun()
 
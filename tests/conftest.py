@@ -0,0 +1,16 @@
+import sys
+from pathlib import Path
+
+import pytest
+import streamlit as st
+
+# Os módulos do portal ficam na raiz do repositório, sem pacote
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def segredos(monkeypatch):
+    """st.secrets do teste, no lugar do secrets.toml (que aponta para a planilha de produção)."""
+    valores = {}
+    monkeypatch.setattr(st, "secrets", valores)
+    return valores
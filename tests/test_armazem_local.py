@@ -0,0 +1,58 @@
+"""Armazenamento local do painel fiscal: diário com escrita interrompida e compactação."""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+from armazem_local import ArmazemLocal
+from comum import COLUNA_ID
+
+
+def _armazem(pasta, **kwargs):
+    armazem = ArmazemLocal("fiscal", pasta, **kwargs)
+    armazem.substituir(pd.DataFrame({COLUNA_ID: ["I1", "I2"], "STATUS": ["ABERTA", "ABERTA"]}))
+    return armazem
+
+
+def test_linha_incompleta_do_diario_e_ignorada_e_cortada(tmp_path):
+    armazem = _armazem(tmp_path)
+    armazem.registrar({"I1": {"STATUS": "PAGA"}})
+    # Queda no meio da escrita da linha seguinte
+    with open(armazem.diario, "a", encoding="utf-8") as arquivo:
+        arquivo.write('{"id": "I2", "valores": {"STA')
+
+    assert armazem.carregar()["STATUS"].tolist() == ["PAGA", "ABERTA"]
+
+    # A próxima edição não fica colada na linha cortada
+    armazem.registrar({"I2": {"STATUS": "PAGA"}})
+    assert ArmazemLocal("fiscal", tmp_path).carregar()["STATUS"].tolist() == ["PAGA", "PAGA"]
+
+
+def test_compactacao_aplica_o_diario_e_o_esvazia(tmp_path):
+    armazem = _armazem(tmp_path, compactar_a_cada=2)
+    armazem.registrar({"I1": {"STATUS": "PAGA"}})
+    armazem.registrar({"I3": {"STATUS": "NOVA"}})
+
+    assert armazem.diario.stat().st_size == 0
+    principal = pd.read_parquet(armazem.principal)
+    assert principal[COLUNA_ID].tolist() == ["I1", "I2", "I3"]
+    assert principal["STATUS"].tolist() == ["PAGA", "ABERTA", "NOVA"]
+    assert armazem.carregar()["STATUS"].tolist() == ["PAGA", "ABERTA", "NOVA"]
+
+
+def test_regravacao_mantem_permissoes_do_arquivo(tmp_path):
+    armazem = _armazem(tmp_path)
+    os.chmod(armazem.principal, 0o640)
+    armazem.compactar()
+    assert armazem.principal.stat().st_mode & 0o777 == 0o640
+
+
+def test_armazem_nao_carrega_as_planilhas():
+    # O painel fiscal roda sobre o arquivo local, sem gspread nem Streamlit
+    resultado = subprocess.run(
+        [sys.executable, "-c", "import sys, armazem_local; print(sorted({'planilhas', 'gspread', 'streamlit'} & set(sys.modules)))"],
+        cwd=Path(__file__).resolve().parent.parent, capture_output=True, text=True, check=True,
+    )
+    assert resultado.stdout.strip() == "[]"
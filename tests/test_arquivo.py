@@ -0,0 +1,66 @@
+"""Arquivamento de pedidos nas abas anuais, sobre as planilhas em memória."""
+import uuid
+
+import pytest
+
+import arquivo
+import memoria
+import planilhas
+from barramento import nome_aba
+from planilhas import COLUNA_ID
+
+CABECALHO = ["DATA", "ITEM", "DATA_ENTREGA", COLUNA_ID]
+LINHAS = [
+    ["10/03/2022", "entregue 2022", "20/03/2022", "P1"],
+    ["05/06/2023", "entregue 2023", "01/07/2023", "P2"],
+    ["05/06/2023", "sem entrega", "", "P3"],
+    ["01/01/2099", "entregue há pouco", "02/01/2099", "P4"],
+    ["11/11/2022", "=1+1", "12/11/2022", "P5"],
+]
+
+
+@pytest.fixture
+def planilhas_teste(segredos):
+    """Planilha principal com a aba de pedidos e planilha do arquivo, ambas em memória."""
+    memoria.ativar()
+    principal, chave_arquivo = f"teste-{uuid.uuid4().hex}", f"arquivo-{uuid.uuid4().hex}"
+    segredos.update(sheet_id=principal, arquivo={"sheet_id": chave_arquivo, "dias": 365})
+    arquivo.anos_arquivados.clear()
+    arquivo.ler_arquivo.clear()
+    origem = planilhas.abrir_planilha(principal).sheet1
+    origem.update([CABECALHO] + LINHAS, "A1")
+    return origem, planilhas.abrir_planilha(chave_arquivo)
+
+
+def test_simular_so_conta(planilhas_teste):
+    origem, _ = planilhas_teste
+    assert arquivo.arquivar("pedidos", simular=True) == {2022: 2, 2023: 1}
+    assert origem.get_all_values() == [CABECALHO] + LINHAS
+
+
+def test_arquivar_move_as_linhas_encerradas(planilhas_teste):
+    origem, planilha_arquivo = planilhas_teste
+    contadores = planilhas.obter_barramento().contadores()
+    gravacoes = contadores.get(nome_aba(origem.spreadsheet_id, origem.id), 0)
+
+    assert arquivo.arquivar("pedidos") == {2022: 2, 2023: 1}
+    assert origem.get_all_values() == [CABECALHO, LINHAS[2], LINHAS[3]]
+    # As linhas vão como estão guardadas, com a fórmula e as datas sem conversão
+    assert planilha_arquivo.worksheet("pedidos_2022").get_all_values() == [CABECALHO, LINHAS[0], LINHAS[4]]
+    assert planilha_arquivo.worksheet("pedidos_2023").get_all_values() == [CABECALHO, LINHAS[1]]
+    # A exclusão passa pelo barramento, como as gravações dos painéis
+    contadores = planilhas.obter_barramento().contadores()
+    assert contadores[nome_aba(origem.spreadsheet_id, origem.id)] > gravacoes
+
+    assert arquivo.anos_arquivados("pedidos") == [2023, 2022]
+    assert sorted(arquivo.ler_arquivo("pedidos")[COLUNA_ID]) == ["P1", "P2", "P5"]
+
+
+def test_arquivar_de_novo_depois_de_interrompido(planilhas_teste):
+    origem, planilha_arquivo = planilhas_teste
+    # Execução anterior copiou P1 e parou antes de apagar
+    planilha_arquivo.add_worksheet("pedidos_2022", rows=2, cols=len(CABECALHO)).update([CABECALHO, LINHAS[0]], "A1")
+
+    assert arquivo.arquivar("pedidos") == {2022: 2, 2023: 1}
+    assert planilha_arquivo.worksheet("pedidos_2022").get_all_values() == [CABECALHO, LINHAS[0], LINHAS[4]]
+    assert origem.get_all_values() == [CABECALHO, LINHAS[2], LINHAS[3]]
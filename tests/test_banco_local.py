@@ -0,0 +1,129 @@
+"""Planilhas no banco SQLite local: mesma grade das planilhas em memória, com colunas e índices de verdade."""
+import pytest
+
+from banco_local import ClienteSQLite
+from memoria import ClienteMemoria
+
+CABECALHO = ["DATA", "ITEM", "ORDEM_COMPRA", "STATUS_PEDIDO", "_ID"]
+
+
+@pytest.fixture
+def cliente(tmp_path):
+    return ClienteSQLite({"arquivo": str(tmp_path / "portal.db")})
+
+
+def _indices(aba):
+    """{nome do índice: coluna da tabela} das colunas da aba."""
+    return {
+        nome: coluna
+        for nome, coluna in aba.client.executar(
+            "SELECT il.name, ii.name FROM sqlite_master il, pragma_index_info(il.name) ii "
+            "WHERE il.type = 'index' AND il.tbl_name = ? AND il.name NOT LIKE 'sqlite_%'",
+            (f"aba_{aba.tabela}",),
+        )
+    }
+
+
+def _mexer(aba):
+    """Sequência de gravações e mudanças de estrutura usada para comparar os dois clientes."""
+    aba.update([CABECALHO, ["01/02/2024", "a", "OC1", "ABERTO", "I1"], ["02/02/2024", "b", "", "", "I2"]], "A1")
+    aba.append_rows([["03/02/2024", "c", "OC2", "ENTREGUE", "I3"]], insert_data_option="INSERT_ROWS", table_range="A1")
+    aba.update([["x", "", "y"]], "B3")
+    planilha = aba.spreadsheet
+    requisicoes = [
+        {"insertDimension": {"range": {"sheetId": aba.id, "dimension": "COLUMNS", "startIndex": 1, "endIndex": 3}}},
+        {"deleteDimension": {"range": {"sheetId": aba.id, "dimension": "ROWS", "startIndex": 1, "endIndex": 2}}},
+        {"deleteDimension": {"range": {"sheetId": aba.id, "dimension": "COLUMNS", "startIndex": 0, "endIndex": 1}}},
+        {"insertDimension": {"range": {"sheetId": aba.id, "dimension": "ROWS", "startIndex": 2, "endIndex": 3}}},
+    ]
+    grades = []
+    for requisicao in requisicoes:
+        planilha.batch_update({"requests": [requisicao]})
+        grades.append((aba.get_all_values(), aba.row_count, aba.col_count))
+    aba.batch_clear(["'Dados'!C2:C9"])
+    grades.append((aba.get_all_values(), aba.row_count, aba.col_count))
+    return grades
+
+
+def test_mesma_grade_das_planilhas_em_memoria(cliente):
+    memoria = ClienteMemoria().open_by_key("p").worksheet("Dados")
+    sqlite = cliente.open_by_key("p").worksheet("Dados")
+    assert _mexer(sqlite) == _mexer(memoria)
+
+
+def test_indices_seguem_o_cabecalho(cliente):
+    aba = cliente.open_by_key("p").worksheet("Dados")
+    aba.update([CABECALHO, ["01/02/2024", "a", "OC1", "ABERTO", "I1"], ["02/02/2024", "b", "OC2", "ABERTO", "I2"]], "A1")
+    assert sorted(_indices(aba).values()) == ["c0", "c2", "c3"]
+
+    # Uma coluna incluída no começo desloca as indexadas
+    aba.spreadsheet.batch_update({"requests": [
+        {"insertDimension": {"range": {"sheetId": aba.id, "dimension": "COLUMNS", "startIndex": 0, "endIndex": 1}}},
+    ]})
+    aba.update([["NF"]], "A1")
+    assert sorted(_indices(aba).values()) == ["c0", "c1", "c3", "c4"]
+
+    assert aba.procurar("ORDEM_COMPRA", "OC2") == [["", "02/02/2024", "b", "OC2", "ABERTO", "I2"]]
+    assert [linha[-1] for linha in aba.procurar("STATUS_PEDIDO", "ABERTO")] == ["I1", "I2"]
+    plano = cliente.executar(
+        f"EXPLAIN QUERY PLAN SELECT * FROM aba_{aba.tabela} WHERE c3 = ? AND linha > 0", ("OC2",)
+    ).fetchall()
+    assert any(f"aba_{aba.tabela}_c3" in passo[-1] for passo in plano)
+    with pytest.raises(KeyError):
+        aba.procurar("QUANTIDADE", "1")
+
+
+def test_linhas_deslocadas_mantem_a_chave(cliente):
+    aba = cliente.open_by_key("p").worksheet("Dados")
+    aba.update([CABECALHO] + [[f"0{i}/01/2024", f"item {i}", f"OC{i}", "", f"I{i}"] for i in range(1, 6)], "A1")
+    tabela = f"aba_{aba.tabela}"
+    antes = dict(cliente.executar(f"SELECT c4, id FROM {tabela} WHERE linha > 0").fetchall())
+
+    aba.spreadsheet.batch_update({"requests": [
+        {"deleteDimension": {"range": {"sheetId": aba.id, "dimension": "ROWS", "startIndex": 1, "endIndex": 3}}},
+    ]})
+    depois = dict(cliente.executar(f"SELECT c4, id FROM {tabela} WHERE linha > 0").fetchall())
+    assert depois == {id_: rowid for id_, rowid in antes.items() if id_ not in {"I1", "I2"}}
+    assert aba.procurar("ORDEM_COMPRA", "OC5") == [["05/01/2024", "item 5", "OC5", "", "I5"]]
+
+
+def test_dados_ficam_no_arquivo(tmp_path):
+    arquivo = str(tmp_path / "portal.db")
+    aba = ClienteSQLite({"arquivo": arquivo}).open_by_key("p").worksheet("Dados")
+    aba.update([CABECALHO, ["01/02/2024", "a", "OC1", "ABERTO", "I1"]], "A1")
+
+    reaberta = ClienteSQLite({"arquivo": arquivo}).open_by_key("p").worksheet("Dados")
+    assert reaberta.get_all_values() == [CABECALHO, ["01/02/2024", "a", "OC1", "ABERTO", "I1"]]
+
+
+@pytest.mark.parametrize("conteudo", ["", "ITEM\na\n"])
+def test_sementes_da_planilha_principal(tmp_path, monkeypatch, conteudo):
+    monkeypatch.chdir(tmp_path)
+    for nome in ("dados_pedidos.csv", "dados_solicitantes.csv", "dados_almoxarifado.csv"):
+        (tmp_path / nome).write_text("", encoding="utf-8")
+    (tmp_path / "dados_pedidos.csv").write_text(conteudo, encoding="utf-8")
+
+    planilha = ClienteSQLite({"arquivo": "portal.db"}, principal="principal").open_by_key("principal")
+    titulos = [aba.title for aba in planilha.worksheets()]
+    if conteudo:
+        assert titulos == ["pedidos", "solicitantes", "almoxarifado"]
+        assert planilha.sheet1.get_all_values() == [["ITEM"], ["a"]]
+    else:
+        # CSVs vazios (como os do repositório): planilha vazia, com as abas criadas ao serem abertas
+        assert titulos == ["Página1"]
+
+
+def test_importar_planilha(cliente):
+    origem = ClienteMemoria().open_by_key("google")
+    origem.sheet1.update([CABECALHO, ["01/02/2024", "a", "OC1", "ABERTO", "I1"]], "A1")
+    origem.worksheet("Solicitantes").update([["NOME"], ["ana"]], "A1")
+
+    cliente.open_by_key("google").sheet1.update([["antiga"]], "A1")
+    versao = cliente.versao("google")
+    planilha = cliente.importar(origem)
+
+    assert [aba.title for aba in planilha.worksheets()] == ["Página1", "Solicitantes"]
+    assert planilha.sheet1.get_all_values() == [CABECALHO, ["01/02/2024", "a", "OC1", "ABERTO", "I1"]]
+    assert planilha.worksheet("Solicitantes").get_all_values() == [["NOME"], ["ana"]]
+    assert int(cliente.versao("google")) > int(versao)
+    assert sorted(_indices(planilha.sheet1).values()) == ["c0", "c2", "c3"]
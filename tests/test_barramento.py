@@ -0,0 +1,101 @@
+"""Barramento de invalidação por aba, sozinho e nas gravações de planilhas.py, sobre as planilhas em memória."""
+import uuid
+
+import pytest
+
+import memoria
+import planilhas
+from barramento import Barramento, nome_aba, nome_externo
+
+
+@pytest.fixture
+def barramento(tmp_path):
+    return Barramento(tmp_path / "barramento.sqlite")
+
+
+def test_gravacao_dos_paineis_nao_conta_como_de_fora(barramento):
+    barramento.publicar_escrita("p", 0, barramento.estado("p", 0), "1", "2")
+    externo = barramento.contadores()[nome_externo("p")]
+
+    # A planilha na base deixada pela última gravação, mesmo com a versão pulando mais de um
+    assert barramento.publicar_escrita("p", 1, barramento.estado("p", 1), "2", "9") is True
+    contadores = barramento.contadores()
+    assert contadores[nome_externo("p")] == externo
+    assert contadores[nome_aba("p", 1)] == 1
+    assert barramento.base("p") == "9"
+
+    # Mudança de fora antes da gravação: a versão de antes não é a base
+    barramento.publicar_escrita("p", 1, barramento.estado("p", 1), "12", "13")
+    assert barramento.contadores()[nome_externo("p")] == externo + 1
+
+
+def test_outra_gravacao_no_meio(barramento):
+    visto = barramento.estado("p", 0)
+    outro = Barramento(barramento.arquivo)
+    # Outro processo grava a mesma aba, e termina depois, entre a consulta de antes e a publicação
+    assert outro.publicar_escrita("p", 0, outro.estado("p", 0), None, "5") is True
+    assert barramento.publicar_escrita("p", 0, visto, None, "4") is False
+
+    contadores = outro.contadores()
+    assert contadores[nome_aba("p", 0)] == 2
+    # A base não volta para uma versão mais velha
+    assert barramento.base("p") == "5"
+
+
+def test_sem_versoes_so_o_contador_anda(barramento):
+    assert barramento.publicar_escrita("p", 0) is False
+    assert barramento.contadores() == {nome_aba("p", 0): 1}
+    barramento.publicar_escrita("p", 0, externa=True)
+    assert barramento.contadores() == {nome_aba("p", 0): 2, nome_externo("p"): 1}
+
+
+@pytest.fixture
+def chave(segredos, tmp_path):
+    memoria.ativar()
+    segredos["barramento"] = {"arquivo": str(tmp_path / "barramento.sqlite")}
+    planilhas.obter_barramento.clear()
+    yield f"teste-{uuid.uuid4().hex}"
+    planilhas.obter_barramento.clear()
+
+
+def test_versao_que_pula_mais_de_uma_nao_refaz_as_outras_abas(chave, monkeypatch):
+    planilha = planilhas.abrir_planilha(chave)
+    planilha.worksheet("Pedidos").update([["A", planilhas.COLUNA_ID], ["1", "P1"]], "A1")
+    planilha.worksheet("Solicitantes").update([["N"], ["ana"]], "A1")
+    cargas = []
+
+    @planilhas.recarregar_se_mudou(chave=chave)
+    def solicitantes():
+        cargas.append(1)
+        return planilhas.ler_aba("Solicitantes", chave=chave)
+
+    solicitantes()
+    # Primeira gravação dos painéis: a planilha ainda não tem base, conta como de fora
+    planilhas.gravar_celulas({"P1": {"A": "2"}}, "Pedidos", chave=chave)
+    solicitantes()
+    assert len(cargas) == 2
+    externo = planilhas.obter_barramento().contadores()[nome_externo(chave)]
+
+    # O Drive pode avançar a versão mais de uma vez por escrita
+    original = type(planilha)._tocar
+    monkeypatch.setattr(type(planilha), "_tocar", lambda self: [original(self) for _ in range(3)])
+    planilhas.gravar_celulas({"P1": {"A": "3"}}, "Pedidos", chave=chave)
+
+    assert planilhas.obter_barramento().contadores()[nome_externo(chave)] == externo
+    assert solicitantes()["N"].tolist() == ["ana"]
+    assert len(cargas) == 2
+
+
+def test_sem_espelho_nem_arquivo_a_gravacao_nao_consulta_a_versao(segredos, monkeypatch):
+    memoria.ativar()
+    planilhas.obter_barramento.clear()
+    planilhas.obter_espelho.clear()
+    chave = f"teste-{uuid.uuid4().hex}"
+    planilhas.abrir_planilha(chave).sheet1.update([["A", planilhas.COLUNA_ID], ["1", "P1"]], "A1")
+    consultas = []
+    monkeypatch.setattr(planilhas, "versao_planilha", lambda chave: consultas.append(chave))
+
+    planilhas.gravar_celulas({"P1": {"A": "2"}}, 0, chave=chave)
+    assert consultas == []
+    assert planilhas.obter_barramento().contadores()[nome_aba(chave, 0)] == 1
+    planilhas.obter_barramento.clear()
@@ -0,0 +1,121 @@
+"""Cache de tokens em disco contra um token endpoint local no lugar do Google."""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from google.auth.transport.requests import AuthorizedSession, Request
+
+from cache_tokens import credenciais_com_cache
+
+SCOPES = ("https://www.googleapis.com/auth/spreadsheets",)
+
+
+class _Servidor(ThreadingHTTPServer):
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Tratador)
+        self.emitidos = []
+        self.recusados = set()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class _Tratador(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, status, corpo):
+        dados = json.dumps(corpo).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        token = f"token-{len(self.server.emitidos) + 1}"
+        self.server.emitidos.append(token)
+        self._responder(200, {"access_token": token, "expires_in": 3600, "token_type": "Bearer"})
+
+    def do_GET(self):
+        token = self.headers.get("Authorization", "").removeprefix("Bearer ")
+        if token not in self.server.emitidos or token in self.server.recusados:
+            self._responder(401, {"error": "invalid_token"})
+        else:
+            self._responder(200, {"token": token})
+
+
+@pytest.fixture
+def servidor():
+    servidor = _Servidor()
+    thread = threading.Thread(target=servidor.serve_forever, daemon=True)
+    thread.start()
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+
+@pytest.fixture(scope="module")
+def chave_privada():
+    chave = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return chave.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+
+
+@pytest.fixture
+def info(servidor, chave_privada):
+    return {
+        "type": "service_account",
+        "client_email": "painel@teste.iam.gserviceaccount.com",
+        "private_key": chave_privada,
+        "private_key_id": "teste",
+        "token_uri": f"{servidor.url}/token",
+    }
+
+
+def test_token_reaproveitado_entre_reinicios(servidor, info, tmp_path):
+    creds = credenciais_com_cache(info, SCOPES, tmp_path)
+    assert not creds.valid
+    creds.refresh(Request())
+    assert creds.token == "token-1"
+
+    # Outro processo (ou o mesmo depois de reiniciar) já sai com o token do disco
+    reiniciado = credenciais_com_cache(info, SCOPES, tmp_path)
+    assert reiniciado.valid and reiniciado.token == "token-1"
+    assert servidor.emitidos == ["token-1"]
+
+
+def test_scopes_diferentes_nao_compartilham_token(servidor, info, tmp_path):
+    credenciais_com_cache(info, SCOPES, tmp_path).refresh(Request())
+    outras = credenciais_com_cache(info, ("https://www.googleapis.com/auth/drive",), tmp_path)
+    assert not outras.valid
+
+
+def test_token_vencido_usa_o_renovado_por_outro_processo(servidor, info, tmp_path):
+    creds = credenciais_com_cache(info, SCOPES, tmp_path)
+    outro = credenciais_com_cache(info, SCOPES, tmp_path)
+    outro.refresh(Request())
+
+    creds.refresh(Request())
+    assert creds.token == "token-1"
+    assert servidor.emitidos == ["token-1"]
+
+
+def test_token_recusado_nao_volta_do_disco(servidor, info, tmp_path):
+    credenciais_com_cache(info, SCOPES, tmp_path).refresh(Request())
+    servidor.recusados.add("token-1")
+
+    creds = credenciais_com_cache(info, SCOPES, tmp_path)
+    assert creds.token == "token-1"
+    resposta = AuthorizedSession(creds).get(f"{servidor.url}/api")
+
+    # O 401 renova no token endpoint, e o token novo substitui o recusado no disco
+    assert resposta.status_code == 200
+    assert resposta.json() == {"token": "token-2"}
+    assert credenciais_com_cache(info, SCOPES, tmp_path).token == "token-2"
@@ -0,0 +1,105 @@
+"""Espelho local das abas em Parquet, sozinho e nas leituras e gravações de planilhas.py."""
+import uuid
+
+import pytest
+
+import memoria
+import planilhas
+from espelho import EspelhoLocal, escrever_bloco
+
+
+@pytest.fixture
+def espelho(tmp_path):
+    return EspelhoLocal(tmp_path)
+
+
+def test_grade_vale_so_na_versao_guardada(espelho):
+    espelho.guardar("p", "Pedidos/2024", [["A", "B", "C"], ["1", "x", ""], ["2"]], "7")
+
+    assert espelho.versao("p", "Pedidos/2024") == "7"
+    assert espelho.ler("p", "Pedidos/2024", "7") == [["A", "B", "C"], ["1", "x", ""], ["2", "", ""]]
+    assert espelho.ler("p", "Pedidos/2024", "7", colunas=["C", "A"]) == [["A", "C"], ["1", ""], ["2", ""]]
+    assert espelho.ler("p", "Pedidos/2024", "8") is None
+
+    vencido = EspelhoLocal(espelho.pasta, validade=0)
+    assert vencido.versao("p", "Pedidos/2024") is None
+
+
+def test_alterar_passa_para_a_versao_nova(espelho):
+    espelho.guardar("p", "Dados", [["A"], ["1"]], "7")
+    espelho.alterar("p", "Dados", "9", lambda grade: escrever_bloco(grade, 2, 0, [[2.0]]))
+    assert espelho.ler("p", "Dados", "9") == [["A"], ["1"], ["2"]]
+
+    # Sem espelho da aba não há o que alterar
+    espelho.alterar("p", "Outra", "9", lambda grade: escrever_bloco(grade, 0, 0, [["x"]]))
+    assert espelho.versao("p", "Outra") is None
+
+
+@pytest.fixture
+def chave(segredos, tmp_path):
+    memoria.ativar()
+    segredos["espelho"] = {"pasta": str(tmp_path / "espelho")}
+    planilhas.obter_espelho.clear()
+    yield f"teste-{uuid.uuid4().hex}"
+    planilhas.obter_espelho.clear()
+
+
+@pytest.fixture
+def pedidos(chave):
+    """Aba de pedidos lida uma vez, com o espelho guardado."""
+    worksheet = planilhas.abrir_planilha(chave).worksheet("Pedidos")
+    worksheet.update([["A", planilhas.COLUNA_ID], ["1", "P1"], ["2", "P2"]], "A1")
+    planilhas.ler_aba("Pedidos", chave=chave)
+    return worksheet
+
+
+def _baixadas(chave, monkeypatch):
+    """Leituras da planilha do teste que foram ao "Google" (values.batchGet)."""
+    planilha = planilhas.abrir_planilha(chave)
+    original = planilha.values_batch_get
+    feitas = []
+
+    def espiar(ranges, params=None):
+        feitas.append(list(ranges))
+        return original(ranges, params)
+    monkeypatch.setattr(planilha, "values_batch_get", espiar)
+    return feitas
+
+
+def test_leitura_sem_mudanca_vem_do_disco(chave, pedidos, monkeypatch):
+    baixadas = _baixadas(chave, monkeypatch)
+    assert planilhas.ler_aba("Pedidos", chave=chave)["A"].tolist() == [1, 2]
+    assert baixadas == []
+
+    # Mudança de fora: a versão muda e a aba é baixada de novo
+    pedidos.update([["3"]], "A2")
+    planilhas.esquecer_versao(chave)
+    assert planilhas.ler_aba("Pedidos", chave=chave)["A"].tolist() == [3, 2]
+    assert len(baixadas) == 1
+
+
+def test_gravacao_atualiza_o_espelho(chave, pedidos, monkeypatch):
+    # Mesmo com a versão do Drive pulando mais de uma vez por escrita
+    planilha = pedidos.spreadsheet
+    original = type(planilha)._tocar
+    monkeypatch.setattr(type(planilha), "_tocar", lambda self: [original(self) for _ in range(3)])
+    baixadas = _baixadas(chave, monkeypatch)
+
+    planilhas.gravar_celulas({"P2": {"A": "22"}}, "Pedidos", chave=chave)
+    assert planilhas.obter_espelho().versao(chave, "Pedidos") == planilhas.versao_planilha(chave)
+    assert planilhas.ler_aba("Pedidos", chave=chave)["A"].tolist() == [1, 22]
+    # Só a coluna de IDs, lida pela gravação para achar a linha
+    assert all(intervalo == ["'Pedidos'!B:B"] for intervalo in baixadas)
+
+
+def test_outra_gravacao_no_meio_descarta_o_espelho(chave, pedidos, monkeypatch):
+    original = type(pedidos).batch_update
+
+    def com_outra_gravacao(aba, *args, **kwargs):
+        # Outro processo grava a mesma aba durante a chamada e publica antes
+        planilhas.obter_barramento().publicar_escrita(chave, aba.id)
+        return original(aba, *args, **kwargs)
+    monkeypatch.setattr(type(pedidos), "batch_update", com_outra_gravacao)
+
+    planilhas.gravar_celulas({"P2": {"A": "22"}}, "Pedidos", chave=chave)
+    assert planilhas.obter_espelho().versao(chave, "Pedidos") is None
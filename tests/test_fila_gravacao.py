@@ -0,0 +1,87 @@
+"""Fila de gravação em segundo plano: repetição das falhas, lotes com IDs que sumiram e a gravação na thread."""
+import uuid
+
+import memoria
+import planilhas
+from fila_gravacao import FilaGravacao
+
+
+class _IDsIgnorados(KeyError):
+    def __init__(self, ignoradas):
+        super().__init__("IDs inexistentes")
+        self.ignoradas = ignoradas
+
+
+def test_falha_repete_sem_passar_por_cima_de_edicao_nova():
+    gravados = []
+
+    def gravar(lote):
+        gravados.append(lote)
+        if len(gravados) == 1:
+            # Edição feita enquanto a primeira tentativa estava em andamento
+            fila.enfileirar({"I1": {"B": "nova"}})
+            raise ConnectionError("sem rede")
+
+    fila = FilaGravacao(gravar, janela=0.01)
+    fila.enfileirar({"I1": {"A": "1", "B": "velha"}})
+    assert fila.descarregar(timeout=5)
+
+    assert gravados[1] == {"I1": {"A": "1", "B": "nova"}}
+    estado = fila.estado()
+    assert estado["erro"] is None and estado["pendentes"] == 0
+
+
+def test_ids_ignorados_nao_descartam_o_resto_do_lote():
+    gravados = []
+
+    def gravar(lote):
+        gravados.append(lote)
+        raise _IDsIgnorados({"SUMIU": lote["SUMIU"]})
+
+    fila = FilaGravacao(gravar, janela=0.01)
+    fila.enfileirar({"SUMIU": {"A": "1"}, "I2": {"A": "2"}})
+    assert fila.descarregar(timeout=5)
+
+    # Conta como gravado: sem nova tentativa, com o que ficou de fora no estado
+    assert len(gravados) == 1
+    estado = fila.estado()
+    assert estado["ultima_gravacao"] is not None and "IDs inexistentes" in estado["erro"]
+
+
+def test_key_error_sem_ignoradas_volta_para_a_fila():
+    gravados = []
+
+    def gravar(lote):
+        gravados.append(lote)
+        if len(gravados) == 1:
+            raise KeyError("coluna")
+
+    fila = FilaGravacao(gravar, janela=0.01)
+    fila.enfileirar({"I1": {"A": "1"}})
+    assert fila.descarregar(timeout=5)
+
+    # Sem dizer o que ficou de fora, nada é perdido: o lote inteiro é tentado de novo
+    assert gravados == [{"I1": {"A": "1"}}, {"I1": {"A": "1"}}]
+    assert fila.estado()["erro"] is None
+
+
+def test_gravacao_na_thread_usa_so_o_destino(segredos, monkeypatch):
+    memoria.ativar()
+    chave = f"teste-{uuid.uuid4().hex}"
+    worksheet = planilhas.abrir_planilha(chave).sheet1
+    worksheet.update([["A", planilhas.COLUNA_ID], ["1", "I1"]], "A1")
+    destino = planilhas.destino_gravacao(0, chave=chave)
+
+    # Na thread da fila, nada de st.secrets nem dos recursos do st.cache_resource
+    segredos.clear()
+
+    def proibido(*args, **kwargs):
+        raise AssertionError("resolvido fora da execução da página")
+    for nome in ("get_gspread_client", "abrir_planilha", "obter_aba", "obter_barramento", "obter_espelho"):
+        monkeypatch.setattr(planilhas, nome, proibido)
+
+    fila = FilaGravacao(lambda lote: planilhas.gravar_celulas(lote, destino), janela=0.01)
+    fila.enfileirar({"I1": {"A": "2"}})
+    assert fila.descarregar(timeout=5)
+    assert fila.estado()["erro"] is None
+    assert worksheet.get_all_values() == [["A", planilhas.COLUNA_ID], ["2", "I1"]]
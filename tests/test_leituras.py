@@ -0,0 +1,239 @@
+"""Leituras de planilhas.py (agrupadas, por coluna e incrementais), sobre as planilhas em memória."""
+import threading
+import time
+import uuid
+
+import pandas as pd
+import pytest
+import streamlit as st
+
+import memoria
+import planilhas
+
+
+@pytest.fixture
+def chave():
+    # Planilha nova por teste: o cliente em memória é um só no processo
+    memoria.ativar()
+    return f"teste-{uuid.uuid4().hex}"
+
+
+@pytest.fixture
+def pedidos(chave, monkeypatch):
+    """Intervalos de cada values.batchGet feito na planilha do teste."""
+    planilha = planilhas.abrir_planilha(chave)
+    original = planilha.values_batch_get
+    feitos = []
+
+    def espiar(ranges, params=None):
+        feitos.append(list(ranges))
+        return original(ranges, params)
+    monkeypatch.setattr(planilha, "values_batch_get", espiar)
+    return feitos
+
+
+def _abas(chave, **grades):
+    """Abas com as grades informadas ({título: grade}), criadas na planilha em memória ao serem abertas."""
+    planilha = planilhas.abrir_planilha(chave)
+    abas = {}
+    for titulo, grade in grades.items():
+        abas[titulo] = planilha.worksheet(titulo)
+        abas[titulo].update(grade, "A1")
+    return abas
+
+
+def test_abas_do_grupo_vem_no_mesmo_batch_get(chave, pedidos):
+    _abas(chave, Pedidos=[["A"], ["1"]], Solicitantes=[["N"], ["ana"], ["bia"]])
+
+    df = planilhas.ler_aba("Pedidos", chave=chave, grupo=["Solicitantes"])
+    solicitantes = planilhas.ler_aba("Solicitantes", chave=chave)
+
+    assert len(pedidos) == 1 and len(pedidos[0]) == 2
+    assert df["A"].tolist() == [1]
+    assert solicitantes["N"].tolist() == ["ana", "bia"]
+    # O guardado é usado uma vez só: a leitura seguinte vai à planilha
+    planilhas.ler_aba("Solicitantes", chave=chave)
+    assert len(pedidos) == 2
+
+
+def test_gravacao_descarta_a_aba_guardada_do_grupo(chave, pedidos):
+    abas = _abas(chave, Pedidos=[["A"], ["1"]], Solicitantes=[["N", planilhas.COLUNA_ID], ["ana", "S1"]])
+
+    planilhas.ler_aba("Pedidos", chave=chave, grupo=["Solicitantes"])
+    planilhas.gravar_celulas({"S1": {"N": "ana maria"}}, "Solicitantes", chave=chave)
+
+    assert planilhas.ler_aba("Solicitantes", chave=chave)["N"].tolist() == ["ana maria"]
+    assert len(pedidos) == 2
+    assert abas["Solicitantes"].get_all_values()[1] == ["ana maria", "S1"]
+
+
+def test_leitura_por_colunas_baixa_so_as_colunas(chave, pedidos):
+    abas = _abas(chave, Pedidos=[["A", "B", "C", "D"], ["1", "x", "7", "p"], ["2", "y", "8", "q"]])
+
+    df = planilhas.ler_aba("Pedidos", chave=chave, colunas=["B", "D", "C"])
+    assert pedidos[-1] == ["'Pedidos'!B:D"]
+    assert df.columns.tolist() == ["B", "C", "D"]
+    assert df.to_dict("list") == {"B": ["x", "y"], "C": [7, 8], "D": ["p", "q"]}
+
+    # Uma coluna incluída por fora no meio: o cabeçalho não confere e a aba vem inteira
+    abas["Pedidos"].update([["A", "NOVA", "B", "C", "D"], ["1", "n", "x", "7", "p"], ["2", "m", "y", "8", "q"]], "A1")
+    df = planilhas.ler_aba("Pedidos", chave=chave, colunas=["B", "D"])
+    assert pedidos[-1] == ["'Pedidos'"]
+    assert df.to_dict("list") == {"B": ["x", "y"], "D": ["p", "q"]}
+
+
+def test_loader_compartilhado_nao_usa_a_sessao(chave, pedidos):
+    _abas(chave, Pedidos=[["A"], ["1"]], Solicitantes=[["N"], ["ana"]])
+
+    @planilhas.recarregar_se_mudou(chave=chave, compartilhado=True)
+    def carregar():
+        return planilhas.ler_aba("Pedidos", chave=chave, grupo=["Solicitantes"])
+
+    antes = set(st.session_state.keys())
+    assert carregar()["A"].tolist() == [1]
+    # Só a aba pedida foi baixada, e nada ficou guardado na sessão de quem encheu a carga
+    assert pedidos == [["'Pedidos'"]]
+    assert set(st.session_state.keys()) == antes
+
+
+def _linhas(inicio, fim):
+    return [[str(i), f"item {i}", f"I{i}"] for i in range(inicio, fim)]
+
+
+def test_leitura_incremental_baixa_so_a_cauda(chave, pedidos):
+    cabecalho = ["N", "DESCRICAO", planilhas.COLUNA_ID]
+    abas = _abas(chave, Almox=[cabecalho] + _linhas(1, 9))
+    planilhas.ler_aba("Almox", chave=chave, incremental=True)
+
+    abas["Almox"].append_rows(_linhas(9, 11), table_range="A1")
+    df = planilhas.ler_aba("Almox", chave=chave, incremental=True)
+
+    # Cabeçalho e as últimas LINHAS_VERIFICACAO já lidas (linhas 5 a 9 da planilha) em diante
+    assert pedidos[-1] == ["'Almox'!A1:C1", "'Almox'!A5:C"]
+    completa = planilhas.grade_para_dataframe(abas["Almox"].get_all_values())
+    pd.testing.assert_frame_equal(df, completa)
+    assert df["N"].tolist() == list(range(1, 11))
+
+
+@pytest.mark.parametrize("mexer", ["editar", "apagar"])
+def test_leitura_incremental_refaz_tudo_se_a_cauda_mudou(chave, pedidos, mexer):
+    cabecalho = ["N", "DESCRICAO", planilhas.COLUNA_ID]
+    abas = _abas(chave, Almox=[cabecalho] + _linhas(1, 9))
+    planilhas.ler_aba("Almox", chave=chave, incremental=True)
+
+    if mexer == "editar":
+        # Linha dentro das conferidas
+        abas["Almox"].update([["editado"]], "B7")
+    else:
+        abas["Almox"].spreadsheet.batch_update({"requests": [{"deleteDimension": {"range": {
+            "sheetId": abas["Almox"].id, "dimension": "ROWS", "startIndex": 2, "endIndex": 3,
+        }}}]})
+    abas["Almox"].append_rows(_linhas(9, 10), table_range="A1")
+    df = planilhas.ler_aba("Almox", chave=chave, incremental=True)
+
+    assert pedidos[-2:] == [["'Almox'!A1:C1", "'Almox'!A5:C"], ["'Almox'"]]
+    pd.testing.assert_frame_equal(df, planilhas.grade_para_dataframe(abas["Almox"].get_all_values()))
+
+
+def test_grade_para_dataframe_igual_ao_get_all_records(chave):
+    grade = [
+        ["INTEIRO", "DECIMAL", "MISTA", "CHAVE NF", "CODIGO", "VAZIA", "TEXTO"],
+        ["1", "1.5", "10", "35240612345678000190550010000123451234567890", "0012", "", "a"],
+        ["-2", "2", "x", "35240612345678000190550010000123461234567891", "0013", "", "b c"],
+        ["3", "", "2.5", "", "7", "", ""],
+    ]
+    aba = _abas(chave, Dados=grade)["Dados"]
+
+    esperado = pd.DataFrame(aba.get_all_records())
+    df = planilhas.grade_para_dataframe(aba.get_all_values())
+    assert df.columns.tolist() == esperado.columns.tolist()
+    for coluna in esperado.columns:
+        assert df[coluna].tolist() == esperado[coluna].tolist(), coluna
+        assert [type(v) for v in df[coluna]] == [type(v) for v in esperado[coluna]], coluna
+
+
+def _esperar(condicao, limite=5):
+    fim = time.monotonic() + limite
+    while not condicao():
+        assert time.monotonic() < fim, "tempo esgotado"
+        time.sleep(0.01)
+
+
+def test_leituras_simultaneas_iguais_baixam_uma_vez(chave, monkeypatch):
+    _abas(chave, Pedidos=[["A"], ["1"], ["2"]])
+    planilha = planilhas.abrir_planilha(chave)
+    original = planilha.values_batch_get
+    liberar, chamadas = threading.Event(), []
+
+    def lento(ranges, params=None):
+        chamadas.append(ranges)
+        liberar.wait(5)
+        return original(ranges, params)
+    monkeypatch.setattr(planilha, "values_batch_get", lento)
+
+    compartilhadas = planilhas.metricas_leituras()["compartilhadas"]
+    resultados = [None] * 3
+
+    def ler(i):
+        resultados[i] = planilhas.ler_abas(["Pedidos"], chave=chave)["Pedidos"]
+    threads = [threading.Thread(target=ler, args=(i,)) for i in range(3)]
+    threads[0].start()
+    _esperar(lambda: chamadas)
+    for thread in threads[1:]:
+        thread.start()
+    _esperar(lambda: planilhas.metricas_leituras()["compartilhadas"] == compartilhadas + 2)
+    liberar.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(chamadas) == 1
+    assert all(df["A"].tolist() == [1, 2] for df in resultados)
+    # Cada um recebe a sua cópia
+    resultados[1].loc[0, "A"] = 99
+    assert resultados[0]["A"].tolist() == [1, 2] and resultados[2]["A"].tolist() == [1, 2]
+
+
+def _voo_com_espera(chave_voo, falha):
+    """Líder que levanta `falha` depois que outra chamada passou a esperar por ele; devolve o que ela recebeu."""
+    comecou, liberar, recebido = threading.Event(), threading.Event(), {}
+
+    def buscar_lider():
+        comecou.set()
+        liberar.wait(5)
+        raise falha
+
+    def lider():
+        try:
+            planilhas._em_voo(chave_voo, buscar_lider)
+        except BaseException:
+            pass
+
+    def esperando():
+        try:
+            recebido["resultado"] = planilhas._em_voo(chave_voo, lambda: {"aba": pd.DataFrame({"A": [2]})})
+        except Exception as e:
+            recebido["erro"] = e
+
+    thread_lider = threading.Thread(target=lider)
+    thread_lider.start()
+    comecou.wait(5)
+    compartilhadas = planilhas.metricas_leituras()["compartilhadas"]
+    thread = threading.Thread(target=esperando)
+    thread.start()
+    _esperar(lambda: planilhas.metricas_leituras()["compartilhadas"] > compartilhadas)
+    liberar.set()
+    thread_lider.join(5)
+    thread.join(5)
+    return recebido
+
+
+def test_erro_da_leitura_chega_a_quem_esperava():
+    erro = ValueError("falhou")
+    recebido = _voo_com_espera(("voo", uuid.uuid4().hex), erro)
+    assert recebido == {"erro": erro}
+
+
+def test_interrupcao_do_lider_faz_quem_esperava_buscar_de_novo():
+    # O Stop/rerun da sessão líder chega como BaseException (não Exception)
+    recebido = _voo_com_espera(("voo", uuid.uuid4().hex), KeyboardInterrupt())
+    assert recebido["resultado"]["aba"]["A"].tolist() == [2]
@@ -0,0 +1,100 @@
+"""Comportamento das planilhas em memória que os testes e benchmarks esperam do Sheets."""
+import gspread
+import pytest
+
+from memoria import ClienteMemoria
+
+
+@pytest.fixture
+def cliente():
+    return ClienteMemoria()
+
+
+def test_planilha_aberta_pela_chave_cria_as_abas_pedidas(cliente):
+    planilha = cliente.open_by_key("nova")
+    assert [aba.title for aba in planilha.worksheets()] == ["Página1"]
+    assert planilha.worksheet("Pedidos").get_all_values() == []
+    assert planilha.get_worksheet(3).title == "Página4"
+    assert cliente.open_by_key("nova") is planilha
+
+    # Criada pelo create, como no Sheets: aba que não existe é erro
+    criada = cliente.create("Relatório")
+    with pytest.raises(gspread.exceptions.WorksheetNotFound):
+        criada.worksheet("Pedidos")
+
+
+def test_abas_iniciais_da_pasta(tmp_path):
+    pasta = tmp_path / "planilha"
+    pasta.mkdir()
+    (pasta / "0_Pedidos.csv").write_text("ITEM,QTD\na,1\nb,2\n", encoding="utf-8")
+    (pasta / "1_Solicitantes.csv").write_text("NOME\nana\n", encoding="utf-8")
+
+    planilha = ClienteMemoria({"pasta": str(tmp_path)}).open_by_key("planilha")
+    assert [aba.title for aba in planilha.worksheets()] == ["Pedidos", "Solicitantes"]
+    assert planilha.sheet1.get_all_records() == [{"ITEM": "a", "QTD": 1}, {"ITEM": "b", "QTD": 2}]
+    with pytest.raises(gspread.exceptions.WorksheetNotFound):
+        planilha.worksheet("Outra")
+
+
+def test_valores_voltam_como_texto_e_aparados(cliente):
+    aba = cliente.open_by_key("p").sheet1
+    aba.update([["A", "B", ""], [1.0, True, None], ["'0012", 2.5, ""]], "A1", value_input_option="USER_ENTERED")
+    assert aba.get_all_values() == [["A", "B"], ["1", "TRUE"], ["0012", "2.5"]]
+
+    resposta = aba.spreadsheet.values_batch_get(["'Página1'!A1:B1", "'Página1'!D1:D9"])
+    assert [intervalo.get("values") for intervalo in resposta["valueRanges"]] == [[["A", "B"]], None]
+
+    # Fora da grade, como na API
+    with pytest.raises(gspread.exceptions.APIError, match="exceeds grid limits"):
+        aba.update([["x"]], "AA1")
+
+
+def test_append_grava_abaixo_da_ultima_linha_com_dados(cliente):
+    aba = cliente.open_by_key("p").worksheet("Dados")
+    aba.resize(rows=3)
+    aba.update([["A"], ["1"]], "A1")
+
+    aba.append_rows([["2"], ["3"], ["4"]], table_range="A1")
+    assert aba.get_all_values() == [["A"], ["1"], ["2"], ["3"], ["4"]]
+    assert aba.row_count == 5
+
+    aba.append_rows([["5"]], insert_data_option="INSERT_ROWS", table_range="A1")
+    assert aba.row_count == 6 and aba.get_all_values()[-1] == ["5"]
+
+
+def test_versao_muda_a_cada_escrita(cliente):
+    planilha = cliente.open_by_key("p")
+    aba = planilha.sheet1
+    versao = cliente.versao("p")
+    aba.get_all_values()
+    assert cliente.versao("p") == versao
+    aba.update([["x"]], "A1")
+    aba.append_rows([["y"]])
+    assert int(cliente.versao("p")) == int(versao) + 2
+
+
+def test_falhas_injetadas_e_cota(cliente):
+    aba = cliente.open_by_key("p").sheet1
+    cliente.injetar_falhas(1, codigo=503)
+    with pytest.raises(gspread.exceptions.APIError) as erro:
+        aba.get_all_values()
+    assert erro.value.response.status_code == 503
+    aba.get_all_values()
+
+    limitado = ClienteMemoria({"cota_escrita": 2})
+    aba = limitado.open_by_key("p").sheet1
+    aba.update([["1"]], "A1")
+    aba.update([["2"]], "A1")
+    with pytest.raises(gspread.exceptions.APIError, match="429"):
+        aba.update([["3"]], "A1")
+    # A cota de leitura é outra
+    assert aba.get_all_values() == [["2"]]
+
+
+def test_limite_de_celulas_da_planilha():
+    planilha = ClienteMemoria({"limite_celulas": 30000}).open_by_key("p")
+    planilha.add_worksheet("Pequena", rows=100, cols=26)
+    with pytest.raises(gspread.exceptions.APIError, match="above the limit"):
+        planilha.add_worksheet("Grande", rows=1000, cols=26)
+    with pytest.raises(gspread.exceptions.APIError, match="above the limit"):
+        planilha.worksheet("Pequena").add_rows(100)
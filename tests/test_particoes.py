@@ -0,0 +1,82 @@
+"""Partição dos pedidos por filial, sobre as planilhas em memória."""
+import uuid
+
+import pandas as pd
+import pytest
+
+import memoria
+import planilhas
+from barramento import nome_externo
+from esquemas import PEDIDOS
+from particoes import AbaParticionada, dividir
+from planilhas import COLUNA_ID
+
+CABECALHO = ["ITEM", "FILIAL", COLUNA_ID]
+
+
+@pytest.fixture
+def chave(segredos):
+    memoria.ativar()
+    chave = f"teste-{uuid.uuid4().hex}"
+    segredos.update(sheet_id=chave, particoes={"pedidos": True})
+    return chave
+
+
+@pytest.fixture
+def particao(chave):
+    """Aba única com pedidos de duas filiais e um sem filial, já dividida."""
+    planilhas.abrir_planilha(chave).sheet1.update(
+        [CABECALHO, ["a", "MG", "I1"], ["b", "sp", "I2"], ["c", "MG", "I3"], ["d", "", "I4"]], "A1"
+    )
+    particao = AbaParticionada("pedidos", 0, "FILIAL", "PEDIDOS ", PEDIDOS)
+    dividir(particao)
+    return particao
+
+
+def _grade(chave, titulo):
+    return planilhas.abrir_planilha(chave).worksheet(titulo).get_all_values()
+
+
+def test_dividir(chave):
+    planilha = planilhas.abrir_planilha(chave)
+    grade = [CABECALHO, ["a", "MG", "I1"], ["b", "sp", "I2"], ["c", "MG", "I3"], ["d", "", "I4"]]
+    planilha.sheet1.update(grade, "A1")
+    particao = AbaParticionada("pedidos", 0, "FILIAL", "PEDIDOS ", PEDIDOS)
+    externo = planilhas.obter_barramento().contadores().get(nome_externo(chave), 0)
+
+    assert dividir(particao) == {"PEDIDOS MG": 2, "PEDIDOS SP": 1, "PEDIDOS SEM FILIAL": 1}
+    assert _grade(chave, "PEDIDOS MG") == [CABECALHO, ["a", "MG", "I1"], ["c", "MG", "I3"]]
+    assert _grade(chave, "PEDIDOS SP") == [CABECALHO, ["b", "sp", "I2"]]
+    assert planilha.sheet1.get_all_values() == grade
+    # As abas novas passam pelo barramento como mudança da planilha, que refaz as cargas dela
+    assert planilhas.obter_barramento().contadores()[nome_externo(chave)] > externo
+    assert particao.valores() == ["MG", "SEM FILIAL", "SP"]
+
+    # As que já existem não são tocadas
+    assert dividir(particao) == {}
+
+
+def test_ler_junta_as_abas(particao):
+    df = particao.ler()
+    assert sorted(df[COLUNA_ID]) == ["I1", "I2", "I3", "I4"]
+    assert particao.ler(valores=["mg"])[COLUNA_ID].tolist() == ["I1", "I3"]
+
+
+def test_salvar_reparte_entre_as_abas(chave, particao):
+    df = particao.ler(serializar=lambda df: df.astype(str)).astype(str)
+
+    # Só as linhas de MG na tela, uma alterada, e um pedido de filial nova
+    df = df[df["FILIAL"] == "MG"].copy()
+    df.loc[df[COLUNA_ID] == "I3", "ITEM"] = "c2"
+    df = pd.concat([df, pd.DataFrame({"ITEM": ["e"], "FILIAL": ["RJ"], COLUNA_ID: ["I5"]})], ignore_index=True)
+
+    assert particao.salvar(df) == 1 + len(CABECALHO)
+    assert _grade(chave, "PEDIDOS MG") == [CABECALHO, ["a", "MG", "I1"], ["c2", "MG", "I3"]]
+    assert _grade(chave, "PEDIDOS RJ") == [CABECALHO, ["e", "RJ", "I5"]]
+    # Abas carregadas sem linhas no DataFrame ficam como estão
+    assert _grade(chave, "PEDIDOS SP") == [CABECALHO, ["b", "sp", "I2"]]
+    assert _grade(chave, "PEDIDOS SEM FILIAL") == [CABECALHO, ["d", "", "I4"]]
+
+    # A linha da aba nova passa a ser gravada na aba dela
+    assert particao.atualizar_por_id(pd.DataFrame({"ITEM": ["e2"]}, index=["I5"])) == 1
+    assert _grade(chave, "PEDIDOS RJ") == [CABECALHO, ["e2", "RJ", "I5"]]
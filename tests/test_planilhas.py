@@ -0,0 +1,151 @@
+"""Gravações por diferença e por ID de planilhas.py, sobre as planilhas em memória."""
+import uuid
+
+import pandas as pd
+import pytest
+
+import memoria
+import planilhas
+from planilhas import COLUNA_ID
+
+
+@pytest.fixture
+def chave():
+    # Planilha nova por teste: o cliente em memória é um só no processo
+    memoria.ativar()
+    return f"teste-{uuid.uuid4().hex}"
+
+
+def _aba(chave, grade):
+    worksheet = planilhas.abrir_planilha(chave).sheet1
+    worksheet.update(grade, "A1")
+    return worksheet
+
+
+def _carregar(chave):
+    """Carga da sessão: a aba lida como texto, com o snapshot guardado para a gravação."""
+    df = planilhas.ler_aba(0, chave=chave).astype(str)
+    planilhas.registrar_snapshot(df, 0, chave=chave)
+    return df
+
+
+def test_salvar_envia_so_as_celulas_alteradas(chave):
+    worksheet = _aba(chave, [["A", "B", COLUNA_ID], ["1", "x", "I1"], ["2", "y", "I2"], ["3", "z", "I3"]])
+    df = _carregar(chave)
+    # Outra sessão altera outra célula depois da carga
+    worksheet.update([["OUTRA"]], "B4")
+
+    df.loc[df[COLUNA_ID] == "I2", "B"] = "nova"
+    assert planilhas.salvar_alteracoes(df, 0, chave=chave) == 1
+    assert worksheet.get_all_values() == [
+        ["A", "B", COLUNA_ID], ["1", "x", "I1"], ["2", "nova", "I2"], ["3", "OUTRA", "I3"],
+    ]
+    # Nada mudou desde a última gravação: nada é enviado
+    assert planilhas.salvar_alteracoes(df, 0, chave=chave) == 0
+
+
+def test_salvar_sem_ids_grava_pela_posicao_da_carga(chave):
+    worksheet = _aba(chave, [["A", "B"], ["1", "x"], ["2", "y"]])
+    df = _carregar(chave)
+
+    df.loc[1, "A"] = "22"
+    df.loc[2] = ["3", "z"]
+    assert planilhas.salvar_alteracoes(df, 0, chave=chave) == 3
+    assert worksheet.get_all_values() == [["A", "B"], ["1", "x"], ["22", "y"], ["3", "z"]]
+
+
+def test_salvar_sem_snapshot_reescreve_sem_limpar_antes(chave):
+    worksheet = _aba(chave, [["A", "B"], ["1", "x"], ["2", "y"], ["3", "z"]])
+    df = planilhas.ler_aba(0, chave=chave).astype(str).iloc[:1]
+
+    planilhas.salvar_alteracoes(df, 0, chave=chave)
+    # A grade nova fica por cima e o que sobrou abaixo dela é removido
+    assert worksheet.get_all_values() == [["A", "B"], ["1", "x"]]
+
+
+def _apagar_linha(worksheet, linha):
+    """Exclusão feita por outra sessão (linha 1-based da planilha)."""
+    worksheet.spreadsheet.batch_update({"requests": [{"deleteDimension": {"range": {
+        "sheetId": worksheet.id, "dimension": "ROWS", "startIndex": linha - 1, "endIndex": linha,
+    }}}]})
+
+
+def test_salvar_depois_de_anexar_mantem_linha_de_outra_sessao(chave):
+    worksheet = _aba(chave, [["A", "B", COLUNA_ID], ["1", "x", "I1"], ["2", "y", "I2"]])
+    df = _carregar(chave)
+    worksheet.append_rows([["9", "RX", "IX"]], table_range="A1")
+
+    minha = pd.DataFrame({"A": ["3"], "B": ["m"], COLUNA_ID: ["I3"]})
+    planilhas.anexar_linhas(minha, 0, chave=chave)
+    df = pd.concat([df, minha], ignore_index=True)
+    df.loc[df[COLUNA_ID] == "I3", "B"] = "editada"
+    planilhas.salvar_alteracoes(df, 0, chave=chave)
+
+    assert worksheet.get_all_values() == [
+        ["A", "B", COLUNA_ID], ["1", "x", "I1"], ["2", "y", "I2"], ["9", "RX", "IX"], ["3", "editada", "I3"],
+    ]
+
+
+def test_anexar_coluna_que_a_aba_nao_tem(chave):
+    worksheet = _aba(chave, [["A", COLUNA_ID], ["1", "I1"]])
+    _carregar(chave)
+    with pytest.raises(KeyError, match="EXTRA"):
+        planilhas.anexar_linhas(pd.DataFrame({"A": ["2"], "EXTRA": ["e"], COLUNA_ID: ["I2"]}), 0, chave=chave)
+    assert worksheet.get_all_values() == [["A", COLUNA_ID], ["1", "I1"]]
+
+
+def test_salvar_parte_da_aba_nao_apaga_as_outras_linhas(chave):
+    grade = [["A", "B", COLUNA_ID], ["1", "x", "I1"], ["2", "y", "I2"], ["3", "z", "I3"]]
+    worksheet = _aba(chave, grade)
+    df = _carregar(chave)
+
+    # DataFrame filtrado, e vazio (uma partição sem linhas na gravação)
+    filtrado = df[df[COLUNA_ID] == "I2"].copy()
+    filtrado["B"] = "nova"
+    assert planilhas.salvar_alteracoes(filtrado, 0, chave=chave) == 1
+    assert planilhas.salvar_alteracoes(df.iloc[0:0], 0, chave=chave) == 0
+    assert worksheet.get_all_values() == [grade[0], grade[1], ["2", "nova", "I2"], grade[3]]
+
+    # As linhas de fora continuam no snapshot: a gravação seguinte do DataFrame inteiro não as anexa de novo
+    df.loc[df[COLUNA_ID] == "I2", "B"] = "nova"
+    df.loc[df[COLUNA_ID] == "I3", "A"] = "33"
+    assert planilhas.salvar_alteracoes(df, 0, chave=chave) == 1
+    assert worksheet.get_all_values() == [grade[0], grade[1], ["2", "nova", "I2"], ["33", "z", "I3"]]
+
+
+def test_apagar_por_id(chave):
+    worksheet = _aba(chave, [["A", COLUNA_ID], ["1", "I1"], ["2", "I2"], ["3", "I3"], ["4", "I4"]])
+    df = _carregar(chave)
+    # Outra sessão já apagou I3
+    _apagar_linha(worksheet, 4)
+
+    assert planilhas.apagar_por_id(["I2", "I3", "I4"], 0, chave=chave) == 2
+    assert worksheet.get_all_values() == [["A", COLUNA_ID], ["1", "I1"]]
+
+    # As linhas apagadas que continuam no DataFrame, sem alteração, não voltam na gravação
+    df.loc[df[COLUNA_ID] == "I1", "A"] = "11"
+    planilhas.salvar_alteracoes(df, 0, chave=chave)
+    assert worksheet.get_all_values() == [["A", COLUNA_ID], ["11", "I1"]]
+
+
+def test_atualizar_por_id_depois_de_exclusao(chave):
+    worksheet = _aba(chave, [["A", "B", COLUNA_ID], ["1", "x", "I1"], ["2", "y", "I2"], ["3", "z", "I3"]])
+    _carregar(chave)
+    _apagar_linha(worksheet, 2)
+
+    alteracao = pd.DataFrame({"B": ["nova"]}, index=["I3"])
+    planilhas.atualizar_por_id(alteracao, 0, chave=chave)
+    assert worksheet.get_all_values() == [["A", "B", COLUNA_ID], ["2", "y", "I2"], ["3", "nova", "I3"]]
+
+    with pytest.raises(KeyError, match="I1"):
+        planilhas.atualizar_por_id(pd.DataFrame({"B": ["?"]}, index=["I1"]), 0, chave=chave)
+
+
+def test_posicoes_por_id():
+    df = pd.DataFrame({COLUNA_ID: ["I1", "I2", "I3"]}, index=[10, 20, 30])
+    assert planilhas.posicoes_por_id(df, ["I3", "I1"]).tolist() == [2, 0]
+
+    with pytest.raises(KeyError, match="SUMIU"):
+        planilhas.posicoes_por_id(df, ["I1", "SUMIU"])
+    with pytest.raises(KeyError, match="repetidos"):
+        planilhas.posicoes_por_id(pd.DataFrame({COLUNA_ID: ["I1", "I1"]}), ["I1"])
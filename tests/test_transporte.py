@@ -0,0 +1,135 @@
+"""Limitador de cota, backoff e repetições da SessaoComprimida, sem rede."""
+from types import SimpleNamespace
+
+import pytest
+import requests
+from google.auth.credentials import AnonymousCredentials
+from requests.adapters import BaseAdapter
+
+import transporte
+
+URL_LEITURA = "https://sheets.googleapis.com/v4/spreadsheets/x/values:batchGet"
+URL_ESCRITA = "https://sheets.googleapis.com/v4/spreadsheets/x:batchUpdate"
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    """Relógio parado do transporte: só anda com as pausas, que ficam registradas."""
+    estado = SimpleNamespace(agora=1000.0, pausas=[])
+
+    def dormir(segundos):
+        estado.pausas.append(segundos)
+        estado.agora += segundos
+    monkeypatch.setattr(transporte, "time", SimpleNamespace(monotonic=lambda: estado.agora, sleep=dormir))
+    return estado
+
+
+def test_limitador_libera_a_rajada_e_depois_espaca(relogio):
+    limitador = transporte.LimitadorCota(por_minuto=60, rajada=2)
+
+    assert limitador.adquirir(30) == 0
+    assert limitador.adquirir(30) == 0
+    # Rajada gasta: a vaga seguinte sai em 1 s (60 por minuto)
+    assert limitador.adquirir(30) == pytest.approx(1)
+    assert relogio.pausas == [pytest.approx(1)]
+
+    relogio.agora += 10
+    # Parado, acumula só até a rajada
+    assert [limitador.adquirir(30) for _ in range(3)] == [0, 0, pytest.approx(1)]
+
+
+def test_limitador_desiste_sem_gastar_vaga(relogio):
+    limitador = transporte.LimitadorCota(por_minuto=60, rajada=1)
+    limitador.adquirir(30)
+
+    with pytest.raises(transporte.CotaEsgotada):
+        limitador.adquirir(0.5)
+    assert relogio.pausas == []
+    relogio.agora += 1
+    assert limitador.adquirir(0.5) == 0
+
+
+def test_pausa_backoff(monkeypatch):
+    config = transporte.CONFIG_PADRAO
+    resposta = SimpleNamespace(headers={"Retry-After": "7"})
+    assert transporte._pausa_backoff(resposta, 0, config) == 7
+
+    # Sem Retry-After: jitter completo até o teto exponencial, limitado ao backoff máximo
+    monkeypatch.setattr(transporte.random, "uniform", lambda inicio, fim: fim)
+    sem_cabecalho = SimpleNamespace(headers={})
+    assert [transporte._pausa_backoff(sem_cabecalho, t, config) for t in range(7)] == [1, 2, 4, 8, 16, 32, 32]
+    assert transporte._pausa_backoff(None, 2, config) == 4
+
+
+class _Adaptador(BaseAdapter):
+    """Devolve os status (ou levanta as exceções) da lista, um por requisição."""
+
+    def __init__(self, respostas):
+        super().__init__()
+        self.respostas = list(respostas)
+        self.enviadas = 0
+
+    def send(self, request, **kwargs):
+        self.enviadas += 1
+        resposta = self.respostas.pop(0)
+        if isinstance(resposta, Exception):
+            raise resposta
+        response = requests.Response()
+        response.status_code = resposta
+        response._content = b"{}"
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def sessao(relogio, monkeypatch):
+    monkeypatch.setattr(transporte, "_limitadores", {})
+
+    def criar(respostas):
+        sessao = transporte.SessaoComprimida(AnonymousCredentials(), {"rajada": 100})
+        sessao.adaptador = _Adaptador(respostas)
+        sessao.mount("https://", sessao.adaptador)
+        return sessao
+    return criar
+
+
+def test_leitura_repete_429_e_5xx(sessao, relogio):
+    s = sessao([503, 429, 200])
+    assert s.request("GET", URL_LEITURA).status_code == 200
+    assert s.adaptador.enviadas == 3
+    assert len(relogio.pausas) == 2
+
+
+def test_leitura_desiste_depois_das_tentativas(sessao):
+    s = sessao([500] * 5)
+    assert s.request("GET", URL_LEITURA).status_code == 500
+    assert s.adaptador.enviadas == transporte.CONFIG_PADRAO["tentativas"]
+
+
+def test_escrita_so_repete_quando_nada_foi_aplicado(sessao):
+    s = sessao([429, 200])
+    assert s.request("POST", URL_ESCRITA, json={}).status_code == 200
+    assert s.adaptador.enviadas == 2
+
+    # 500 pode ter aplicado a escrita: volta para quem chamou sem repetir
+    s = sessao([500, 200])
+    assert s.request("POST", URL_ESCRITA, json={}).status_code == 500
+    assert s.adaptador.enviadas == 1
+
+
+def test_conexao_caida_so_repete_na_leitura(sessao):
+    s = sessao([requests.exceptions.ConnectionError(), 200])
+    assert s.request("GET", URL_LEITURA).status_code == 200
+
+    s = sessao([requests.exceptions.ConnectionError(), 200])
+    with pytest.raises(requests.exceptions.ConnectionError):
+        s.request("POST", URL_ESCRITA, json={})
+    assert s.adaptador.enviadas == 1
+
+    # A conexão nem abriu: a escrita pode ser repetida
+    s = sessao([requests.exceptions.ConnectTimeout(), 200])
+    assert s.request("POST", URL_ESCRITA, json={}).status_code == 200
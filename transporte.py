@@ -0,0 +1,279 @@
+import gzip
+import json
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import httplib2
+import requests
+from requests.adapters import HTTPAdapter
+from google.auth.transport.requests import AuthorizedSession
+
+# Camada de transporte HTTP compartilhada pelo gspread e pelos serviços do googleapiclient.
+# Uma única AuthorizedSession por conjunto de credenciais, com pool de conexões keep-alive
+# dimensionado, gzip na ida e na volta, timeout padrão e contadores de bytes trafegados.
+# Todas as chamadas passam por um limitador de cota (token bucket por API, comum ao
+# processo) e são repetidas com backoff exponencial com jitter em respostas 429/5xx.
+
+CONFIG_PADRAO = {
+    "pool_conexoes": 10,        # hosts distintos mantidos no pool
+    "pool_tamanho": 20,         # conexões keep-alive por host
+    "timeout_conexao": 10,      # segundos
+    "timeout_leitura": 120,     # segundos
+    "gzip_envio": True,         # comprime o corpo JSON das requisições
+    "gzip_minimo_bytes": 1024,  # corpos menores que isso vão sem compressão
+    # Cotas por minuto (o Sheets permite 60 leituras e 60 escritas por minuto por usuário)
+    "cota_leitura_planilhas": 60,
+    "cota_escrita_planilhas": 60,
+    "cota_drive": 600,
+    "cota_gmail": 120,
+    "rajada": 10,               # chamadas seguidas permitidas antes de começar a espaçar
+    "espera_maxima_cota": 30,   # segundos na fila por uma vaga antes de desistir
+    "tentativas": 5,            # inclui a primeira
+    "backoff_inicial": 1,       # segundos
+    "backoff_maximo": 32,       # segundos
+}
+
+# Respostas repetidas com backoff. Escritas (append, batchUpdate) só são repetidas quando
+# a resposta garante que nada foi aplicado, para não duplicar linhas.
+STATUS_REPETIR = {429, 500, 502, 503, 504}
+STATUS_REPETIR_ESCRITA = {429, 503}
+METODOS_LEITURA = {"GET", "HEAD"}
+
+
+class CotaEsgotada(requests.exceptions.RequestException):
+    """Não houve vaga no limitador de cota dentro da espera máxima."""
+
+
+_lock_metricas = threading.Lock()
+_metricas = {
+    "requisicoes": 0,
+    "bytes_enviados": 0,          # corpo das requisições como foi para a rede
+    "bytes_enviados_original": 0,  # corpo das requisições antes da compressão
+    "bytes_recebidos": 0,          # corpo das respostas como veio da rede
+    "bytes_recebidos_original": 0,  # corpo das respostas já descomprimido
+}
+
+
+def _registrar(enviados, enviados_original, recebidos, recebidos_original):
+    with _lock_metricas:
+        _metricas["requisicoes"] += 1
+        _metricas["bytes_enviados"] += enviados
+        _metricas["bytes_enviados_original"] += enviados_original
+        _metricas["bytes_recebidos"] += recebidos
+        _metricas["bytes_recebidos_original"] += recebidos_original
+
+
+_metricas_chamadas = {}
+
+
+def _registrar_chamada(categoria, tempo, espera, repeticoes, falhou):
+    with _lock_metricas:
+        metricas = _metricas_chamadas.setdefault(categoria, {
+            "chamadas": 0, "repeticoes": 0, "falhas": 0, "tempo": 0.0, "espera_cota": 0.0,
+        })
+        metricas["chamadas"] += 1
+        metricas["repeticoes"] += repeticoes
+        metricas["falhas"] += falhou
+        metricas["tempo"] += tempo
+        metricas["espera_cota"] += espera
+
+
+def metricas_chamadas():
+    """Contadores por API (chamadas, repetições, falhas, tempo total e espera na fila)."""
+    with _lock_metricas:
+        return {categoria: dict(valores) for categoria, valores in _metricas_chamadas.items()}
+
+
+class LimitadorCota:
+    """Token bucket: `por_minuto` vagas repostas continuamente, acumulando até `rajada`."""
+
+    def __init__(self, por_minuto, rajada):
+        self.taxa = por_minuto / 60
+        self.capacidade = max(1, rajada)
+        self.vagas = float(self.capacidade)
+        self.atualizado = time.monotonic()
+        self.lock = threading.Lock()
+
+    def adquirir(self, espera_maxima):
+        """Reserva uma vaga, esperando na fila se preciso; devolve os segundos esperados."""
+        with self.lock:
+            agora = time.monotonic()
+            self.vagas = min(self.capacidade, self.vagas + (agora - self.atualizado) * self.taxa)
+            self.atualizado = agora
+            espera = max(0.0, (1 - self.vagas) / self.taxa)
+            if espera > espera_maxima:
+                raise CotaEsgotada(f"Cota da API esgotada: a próxima vaga sai em {espera:.0f}s")
+            # A vaga fica reservada já; quem chega depois espera a seguinte
+            self.vagas -= 1
+        if espera:
+            time.sleep(espera)
+        return espera
+
+
+_lock_limitadores = threading.Lock()
+_limitadores = {}
+
+
+def _limitador(categoria, config):
+    with _lock_limitadores:
+        if categoria not in _limitadores:
+            _limitadores[categoria] = LimitadorCota(config[f"cota_{categoria}"], config["rajada"])
+        return _limitadores[categoria]
+
+
+def categoria_chamada(method, url):
+    """API da chamada, para escolher o limitador: leitura/escrita de planilhas, drive ou gmail."""
+    partes = urlsplit(url)
+    if partes.netloc == "sheets.googleapis.com":
+        leitura = method.upper() == "GET" or partes.path.endswith(":batchGet")
+        return "leitura_planilhas" if leitura else "escrita_planilhas"
+    if "gmail" in partes.netloc or "/gmail/" in partes.path:
+        return "gmail"
+    return "drive"
+
+
+def _pausa_backoff(response, tentativa, config):
+    """Retry-After da resposta, se houver; senão backoff exponencial com jitter completo."""
+    try:
+        return float(response.headers["Retry-After"])
+    except (AttributeError, KeyError, ValueError):
+        teto = min(config["backoff_maximo"], config["backoff_inicial"] * 2 ** tentativa)
+        return random.uniform(0, teto)
+
+
+def registrar_recebidos(recebidos, recebidos_original):
+    """Soma os bytes de uma resposta lida em stream, depois de consumida."""
+    with _lock_metricas:
+        _metricas["bytes_recebidos"] += recebidos
+        _metricas["bytes_recebidos_original"] += recebidos_original
+
+
+def metricas_transporte():
+    """Cópia dos contadores de tráfego acumulados no processo."""
+    with _lock_metricas:
+        return dict(_metricas)
+
+
+def zerar_metricas_transporte():
+    with _lock_metricas:
+        for chave in _metricas:
+            _metricas[chave] = 0
+        _metricas_chamadas.clear()
+
+
+class SessaoComprimida(AuthorizedSession):
+    """AuthorizedSession com pool dimensionado, gzip e contagem de bytes."""
+
+    def __init__(self, credentials, config=None):
+        super().__init__(credentials)
+        self.config = {**CONFIG_PADRAO, **(config or {})}
+
+        adaptador = HTTPAdapter(
+            pool_connections=self.config["pool_conexoes"],
+            pool_maxsize=self.config["pool_tamanho"],
+        )
+        self.mount("https://", adaptador)
+        self.mount("http://", adaptador)
+
+        # O Google só devolve gzip quando o User-Agent também menciona gzip
+        self.headers["Accept-Encoding"] = "gzip"
+        self.headers["User-Agent"] = f"{self.headers.get('User-Agent', 'python-requests')} (gzip)"
+
+    def request(self, method, url, data=None, headers=None, timeout=None, **kwargs):
+        headers = dict(headers or {})
+
+        # O gspread manda o corpo em `json=`; serializamos aqui para poder comprimir
+        corpo_json = kwargs.pop("json", None)
+        if corpo_json is not None and data is None:
+            data = json.dumps(corpo_json).encode("utf-8")
+            headers.setdefault("Content-Type", "application/json")
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+
+        # Só corpos JSON são comprimidos; uploads de mídia seguem como estão
+        tamanho_original = len(data) if isinstance(data, bytes) else 0
+        if (
+            self.config["gzip_envio"]
+            and isinstance(data, bytes)
+            and "json" in headers.get("Content-Type", headers.get("content-type", ""))
+            and tamanho_original >= self.config["gzip_minimo_bytes"]
+            and "Content-Encoding" not in headers
+        ):
+            data = gzip.compress(data)
+            headers["Content-Encoding"] = "gzip"
+
+        if timeout is None:
+            timeout = (self.config["timeout_conexao"], self.config["timeout_leitura"])
+
+        categoria = categoria_chamada(method, url)
+        limitador = _limitador(categoria, self.config)
+        leitura = method.upper() in METODOS_LEITURA
+        repetir = STATUS_REPETIR if leitura else STATUS_REPETIR_ESCRITA
+        # Uma conexão que cai depois do envio pode ter deixado a escrita aplicada: escritas
+        # só são repetidas quando a conexão nem chegou a ser aberta
+        falhas_conexao = requests.exceptions.ConnectionError if leitura else requests.exceptions.ConnectTimeout
+        ultima = self.config["tentativas"] - 1
+        inicio = time.monotonic()
+        espera = 0.0
+        for tentativa in range(ultima + 1):
+            try:
+                espera += limitador.adquirir(self.config["espera_maxima_cota"])
+                response = super().request(method, url, data=data, headers=headers, timeout=timeout, **kwargs)
+            except CotaEsgotada:
+                _registrar_chamada(categoria, time.monotonic() - inicio, espera, tentativa, True)
+                raise
+            except requests.exceptions.ConnectionError as erro:
+                # Conexão caída antes da resposta: repete, salvo na última tentativa
+                if not isinstance(erro, falhas_conexao) or tentativa == ultima:
+                    _registrar_chamada(categoria, time.monotonic() - inicio, espera, tentativa, True)
+                    raise
+                time.sleep(_pausa_backoff(None, tentativa, self.config))
+                continue
+            if response.status_code not in repetir or tentativa == ultima:
+                break
+            response.close()
+            time.sleep(_pausa_backoff(response, tentativa, self.config))
+        _registrar_chamada(
+            categoria, time.monotonic() - inicio, espera, tentativa, response.status_code >= 400
+        )
+        enviados = len(data) if isinstance(data, bytes) else 0
+
+        if kwargs.get("stream"):
+            # Corpo ainda não lido: quem consome a resposta conta os bytes (registrar_recebidos)
+            _registrar(enviados, tamanho_original, 0, 0)
+            return response
+
+        # raw.tell() conta os bytes lidos do socket, antes da descompressão
+        recebidos_original = len(response.content)
+        try:
+            recebidos = response.raw.tell() or recebidos_original
+        except (AttributeError, ValueError):
+            recebidos = recebidos_original
+        _registrar(enviados, tamanho_original, recebidos, recebidos_original)
+        return response
+
+
+class HttpSessao:
+    """
+    Adaptador com a interface de httplib2.Http que o googleapiclient espera,
+    encaminhando as chamadas para uma SessaoComprimida.
+    """
+
+    def __init__(self, sessao):
+        self.sessao = sessao
+
+    def request(self, uri, method="GET", body=None, headers=None, redirections=5, connection_type=None):
+        response = self.sessao.request(
+            method, uri, data=body, headers=headers, allow_redirects=redirections > 0
+        )
+        info = {k.lower(): v for k, v in response.headers.items()}
+        # O corpo já chega descomprimido; o cabeçalho não vale mais para ele
+        info.pop("content-encoding", None)
+        info["content-length"] = str(len(response.content))
+        info["status"] = str(response.status_code)
+        return httplib2.Response(info), response.content
+
+    def close(self):
+        self.sessao.close()